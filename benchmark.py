@@ -0,0 +1,366 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import board
+import controller
+import measure
+import parallel
+import search
+
+# fixed corpus of positions (moves played from an empty board, first move by PLAYER_1)
+CORPUS = {
+    'opening': [3, 3],
+    'midgame': [3, 3, 2, 4, 2, 2, 1],
+    'tactical': [0, 1, 0, 1, 0, 2, 6, 6, 6, 5, 5, 5],  # player to move has an immediate win
+    'endgame': [0] * 7 + [1] * 7 + [2] * 7 + [3] * 7 + [4] * 7,  # only columns 5 and 6 are left
+}
+
+PRECOMPUTE_DEPTH = 2  # pre-compute depth used by parallel.MasterController
+
+MIN_COMPARE_SECONDS = 0.01  # measurements shorter than this are too noisy to be compared
+
+
+def position(name: str) -> Tuple[board.Board, int]:
+    """
+    Create a board for a corpus position.
+
+    :param name: corpus position name
+    :return: board and the player making the next move
+    """
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    for move in CORPUS[name]:
+        status = b.play(move, player)
+        assert status == board.Board.VALID_MOVE, f'invalid corpus position {name}'
+        player *= -1
+    return b, player
+
+
+def peak_rss(who=resource.RUSAGE_SELF) -> int:
+    """
+    Peak resident set size in kilobytes.
+
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return: peak RSS
+    """
+    rss = resource.getrusage(who).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOS reports bytes, Linux kilobytes
+
+
+def count_tasks(metrics: measure.MoveMetrics) -> int:
+    """
+    Number of tasks workers computed for a move (tasks answered from the result store are not dispatched).
+
+    :param metrics: measurements of the move
+    :return: number of tasks
+    """
+    return sum(stats['tasks'] for stats in metrics.workers.values())
+
+
+def bench_search(backend: str, max_depth: int) -> List[dict]:
+    """
+    Measure single process search throughput: nodes/sec and time-to-depth for every position and depth.
+
+    :param backend: search backend name
+    :param max_depth: maximum search depth
+    :return: list of measurements
+    """
+    results = []
+    for name in CORPUS:
+        b, player = position(name)
+        ctl = controller.ComputerController(b, max_depth, backend=backend)
+        for depth in range(1, max_depth + 1):
+            start = time.perf_counter()
+            result = ctl.search(player, depth)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'backend': backend,
+                'position': name,
+                'depth': depth,
+                'seconds': elapsed,
+                'nodes': result.nodes,
+                'nodes_per_sec': result.nodes / elapsed if elapsed else 0.0,
+                'best_move': result.best_move,
+            })
+    return results
+
+
+_local_controller: controller.ComputerController = None  # controller of a local pool worker process
+
+
+def _local_init(max_depth: int, backend: str):
+    """
+    Local pool worker initializer.
+
+    :param max_depth: maximum search depth
+    :param backend: search backend name
+    :return:
+    """
+    global _local_controller
+    _local_controller = controller.ComputerController(None, max_depth, precompute_depth=PRECOMPUTE_DEPTH,
+                                                      backend=backend)
+
+
+def _local_work(task: parallel.Task) -> parallel.Result:
+    """
+    Local pool equivalent of parallel.Worker._work.
+
+    :param task: task to complete
+    :return: computed result
+    """
+    _local_controller.board = task.board()
+    return parallel.do_work(_local_controller, task, _local_controller.max_depth - _local_controller.precompute_depth)
+
+
+def _play_local(pool, ctl: controller.ComputerController, b: board.Board, player: int) -> Tuple[int, int]:
+    """
+    Local pool equivalent of parallel.MasterController.play for backends without windows.
+
+    :param pool: process pool
+    :param ctl: computer controller used for scoring
+    :param b: board
+    :param player: player making the move
+    :return: optimal move and the number of computed tasks
+    """
+    scores = parallel.ScoreTree(b, player, PRECOMPUTE_DEPTH)
+    tasks = parallel.MasterController._generate_tasks(b, scores.root, player, max_depth=PRECOMPUTE_DEPTH,
+                                                      leaves=scores.leaves)
+    count = 0
+    for result in pool.imap_unordered(_local_work, tasks):
+        scores.apply(result)
+        count += 1
+    result = scores.finish()
+    ctl.print_scores(result)
+    return result.best_move, count
+
+
+def bench_local(backend: str, max_depth: int, workers: int) -> dict:
+    """
+    Measure parallel search on a local process pool.
+
+    Windowed backends (see search.AlphaBetaSearch) split the search at the principal variation and update windows
+    of running tasks, which a process pool can't do, so they are only measured on MPI workers.
+
+    :param backend: search backend name
+    :param max_depth: maximum search depth
+    :param workers: number of pool processes
+    :return: measurement
+    """
+    if search.BACKENDS[backend].windowed:
+        raise ValueError(f'backend {backend} can only be measured on MPI workers')
+    ctl = controller.ComputerController(None, max_depth, precompute_depth=PRECOMPUTE_DEPTH, backend=backend)
+    positions = {}
+    with multiprocessing.Pool(workers, initializer=_local_init, initargs=(max_depth, backend)) as pool:
+        for name in CORPUS:
+            b, player = position(name)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # scores are printed for every move
+                move, tasks = _play_local(pool, ctl, b, player)
+            positions[name] = {'seconds': time.perf_counter() - start, 'tasks': tasks,
+                               'best_move': move}
+        pool.close()
+        pool.join()
+    return _summary('local', backend, max_depth, workers, positions,
+                    {'master': peak_rss(), 'workers': peak_rss(resource.RUSAGE_CHILDREN)})
+
+
+def _summary(mode: str, backend: str, max_depth: int, workers: int, positions: dict, rss: dict) -> dict:
+    """
+    Summarize parallel measurements of all corpus positions.
+
+    :param mode: local or mpi
+    :param backend: search backend name
+    :param max_depth: maximum search depth
+    :param workers: number of workers
+    :param positions: per position measurements
+    :param rss: peak RSS in kilobytes
+    :return: measurement
+    """
+    seconds = sum(t['seconds'] for t in positions.values())
+    tasks = sum(t['tasks'] for t in positions.values())
+    return {
+        'mode': mode,
+        'backend': backend,
+        'depth': max_depth,
+        'workers': workers,
+        'seconds': seconds,
+        'tasks': tasks,
+        'tasks_per_sec': tasks / seconds if seconds else 0.0,
+        'peak_rss_kb': rss,
+        'positions': positions,
+    }
+
+
+def _mpi_run(backend: str, max_depth: int, output: str):
+    """
+    Benchmark run inside mpiexec: rank 0 is the master, every other rank is a worker.
+
+    :param backend: search backend name
+    :param max_depth: maximum search depth
+    :param output: file the master writes the measurement to
+    :return:
+    """
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    workers = comm.Get_size() - 1
+    ctl = controller.ComputerController(None, max_depth, precompute_depth=PRECOMPUTE_DEPTH, backend=backend)
+    if rank == 0:
+        master = parallel.MasterController(comm, workers, board.Board(), ctl)
+        positions = {}
+        for name in CORPUS:
+            b, player = position(name)
+            master.board = b
+            ctl.board = b
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = parallel.MasterController.play.__wrapped__(master, player)  # skip measure.log
+            positions[name] = {'seconds': time.perf_counter() - start, 'tasks': count_tasks(master.metrics.moves[-1]),
+                               'best_move': move}
+        master.done()
+        rss = comm.gather(peak_rss(), root=0)
+        with open(output, 'w') as file:
+            json.dump(_summary('mpi', backend, max_depth, workers, positions,
+                               {'master': rss[0], 'workers': max(rss[1:], default=0)}), file)
+    else:
+        parallel.Worker(rank, comm, ctl).run()
+        comm.gather(peak_rss(), root=0)
+
+
+def bench_mpi(backend: str, max_depth: int, workers: int, mpiexec: str) -> dict:
+    """
+    Measure parallel search on MPI workers (launches mpiexec with workers + 1 processes).
+
+    :param backend: search backend name
+    :param max_depth: maximum search depth
+    :param workers: number of worker ranks
+    :param mpiexec: mpiexec command (with any extra arguments, e.g. --hostfile hostfile)
+    :return: measurement
+    """
+    fd, output = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        subprocess.run(mpiexec.split() + ['-n', str(workers + 1), sys.executable, os.path.abspath(__file__),
+                                          '--mpi-child', '--backend', backend, '--depth', str(max_depth),
+                                          '--output', output], check=True)
+        with open(output) as file:
+            return json.load(file)
+    finally:
+        os.remove(output)
+
+
+def add_speedup(results: List[dict]) -> List[dict]:
+    """
+    Add speedup and efficiency (relative to the 1 worker run of the same mode) to parallel measurements.
+
+    :param results: parallel measurements
+    :return: same measurements
+    """
+    for result in results:
+        base = [t for t in results if t['mode'] == result['mode'] and t['workers'] == 1]
+        if base and result['seconds']:
+            result['speedup'] = base[0]['seconds'] / result['seconds']
+            result['efficiency'] = result['speedup'] / result['workers']
+    return results
+
+
+def compare(old: dict, new: dict, tolerance: float) -> List[str]:
+    """
+    Find regressions between two benchmark outputs.
+
+    :param old: baseline benchmark output
+    :param new: current benchmark output
+    :param tolerance: allowed relative slowdown (0.1 = 10%)
+    :return: list of regression descriptions
+    """
+    regressions = []
+    old_search = {(t['backend'], t['position'], t['depth']): t for t in old.get('search', [])}
+    for t in new.get('search', []):
+        base = old_search.get((t['backend'], t['position'], t['depth']))
+        if not base or min(t['seconds'], base['seconds']) < MIN_COMPARE_SECONDS:
+            continue
+        if t['nodes_per_sec'] < base['nodes_per_sec'] * (1 - tolerance):
+            regressions.append(f'search {t["backend"]} {t["position"]} depth {t["depth"]}: '
+                               f'{t["nodes_per_sec"]:.0f} nodes/s (was {base["nodes_per_sec"]:.0f})')
+    old_parallel = {(t['mode'], t['backend'], t['depth'], t['workers']): t for t in old.get('parallel', [])}
+    for t in new.get('parallel', []):
+        base = old_parallel.get((t['mode'], t['backend'], t['depth'], t['workers']))
+        if base and t['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append(f'{t["mode"]} {t["backend"]} {t["workers"]} workers: '
+                               f'{t["seconds"]:.3f}s (was {base["seconds"]:.3f}s)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search throughput and parallel scaling benchmark.')
+    parser.add_argument('--backend', default='tree', help='search backend name')
+    parser.add_argument('--depth', type=int, default=5, help='maximum search depth')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='measure parallel runs with 1..WORKERS workers')
+    parser.add_argument('--local', action='store_true', help='measure a local process pool')
+    parser.add_argument('--mpi', action='store_true', help='measure MPI workers')
+    parser.add_argument('--mpiexec', default='mpiexec', help='mpiexec command, e.g. "mpiexec --hostfile hostfile"')
+    parser.add_argument('--output', default='benchmark.json', help='output file')
+    parser.add_argument('--compare', help='baseline benchmark output, exits with 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown for --compare')
+    parser.add_argument('--mpi-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.local and search.BACKENDS[args.backend].windowed:
+        parser.error(f'--local does not support the windowed backend {args.backend}, use --mpi')
+
+    if args.mpi_child:
+        _mpi_run(args.backend, args.depth, args.output)
+        return
+
+    output = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'board': [board.Board.width, board.Board.height, board.Board.win_count],
+        },
+        'search': bench_search(args.backend, args.depth),
+        'search_peak_rss_kb': peak_rss(),
+    }
+    parallel_results = []
+    for workers in range(1, args.workers + 1):
+        if args.local:
+            parallel_results.append(bench_local(args.backend, args.depth, workers))
+        if args.mpi:
+            parallel_results.append(bench_mpi(args.backend, args.depth, workers, args.mpiexec))
+    output['parallel'] = add_speedup(parallel_results)
+
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=2)
+
+    for t in output['search']:
+        print(f'search {t["backend"]} {t["position"]:>8} depth {t["depth"]}: {t["seconds"]:.3f}s '
+              f'{t["nodes_per_sec"]:.0f} nodes/s')
+    for t in output['parallel']:
+        print(f'{t["mode"]:>5} {t["workers"]} workers: {t["seconds"]:.3f}s {t["tasks_per_sec"]:.1f} tasks/s '
+              f'speedup {t.get("speedup", 0):.3f} efficiency {t.get("efficiency", 0):.3f}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), output, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import numpy as np
 import common
-from typing import List
+import profiling
+import tables
+from typing import List, Tuple
 
 
 def _remap_char(value: int) -> str:
@@ -45,16 +47,31 @@ def remap_char(value: int) -> str:
         return _official_char(value)
 
 
+class _DefaultTables:
+    """
+    Board.lookup: the lookup tables for the default board size, loaded on first access instead of when the module is
+    imported. The first access replaces it with the loaded tables.
+    """
+
+    def __get__(self, instance, owner) -> tables.Tables:
+        lookup = tables.load(*owner.DEFAULT_SIZE)
+        owner.lookup = lookup
+        return lookup
+
+
 class Board:
     """
-    Playing board with fixed width and height.
+    Playing board of a certain width and height.
 
     It assumes two players, doesn't care who the players are - just defines the rules of the game.
+    Every board has its own size and number of stones in a row needed to win (the class attributes are the defaults),
+    with lookup tables built for that size (see tables.load).
     """
-    width = 7
+    width = 7  # default board size
     height = 7
 
     win_count = 4
+    DEFAULT_SIZE = (width, height, win_count)
 
     NOT_SET = 0
     PLAYER_1 = 1
@@ -65,36 +82,51 @@ class Board:
     WIN = 1  # status returned when user wins a game
     VALID_MOVE = 2  # status returned when user makes a valid move (but doesn't win)
 
-    def __init__(self, state=None):
+    lookup = _DefaultTables()  # precomputed lookup tables for the default board size (loaded on first access)
+
+    @profiling.hot
+    def __init__(self, state=None, last_rows: List[int] = None, width: int = None, height: int = None,
+                 win_count: int = None):
         """
         Create a board.
         State can be loaded by putting it in state param.
-        It has to be a numpy array with shape (Board.height, Board.width).
+        It has to be a numpy array with shape (height, width), it defines the board size.
 
         :param state: preloaded board state
+        :param last_rows: valid row for every column of the preloaded state (skips computing them from the state)
+        :param width: board width (Board.width by default)
+        :param height: board height (Board.height by default)
+        :param win_count: number of stones in a row needed to win (Board.win_count by default)
         """
-        if common.PPRINT: # choose which type of table print we're going to be using
-            self.table = self._table
-        else:
-            self.table = self._official_table
-
         # 0 - unplayed field
         # 1 - player 1
         # -1 - player 2 (opponent)
-        self.last_rows = [Board.height - 1 for i in range(Board.width)] # define valid row for every column of the board
         if state is None:
             # if no preloaded state -> initialize an empty board
-            self.state = np.zeros((Board.height, Board.width))
+            self.width = width or Board.width
+            self.height = height or Board.height
+            self.state = np.zeros((self.height, self.width))
+            self.last_rows = [self.height - 1] * self.width  # define valid row for every column of the board
         else:
-            assert type(state) is np.ndarray and state.shape == (Board.height, Board.width)
+            assert type(state) is np.ndarray and state.ndim == 2
+            assert width is None and height is None or (height, width) == state.shape
+            self.height, self.width = state.shape
             self.state = state
-            for col in range(self.width): # compute last_rows based on the loaded state
-                self.last_rows[col] = -1
-                for row in range(self.height - 1, -1, -1):
-                    if self.state[row, col] == self.NOT_SET:
-                        self.last_rows[col] = row
-                        break
-
+            if last_rows is None:  # compute last_rows based on the loaded state
+                last_rows = (self.height - 1 - np.count_nonzero(state, axis=0)).tolist()
+            self.last_rows = last_rows
+        self.win_count = win_count or Board.win_count
+        if self.size == Board.DEFAULT_SIZE:
+            self.lookup = Board.lookup
+        else:
+            assert self.width <= 16, 'moves have to fit in 4 bits'
+            self.lookup = tables.load(self.width, self.height, self.win_count)
+        self.legal = 0  # bitmask of columns that still have a valid row (bit i set -> column i is playable)
+        for col, row in enumerate(self.last_rows):
+            if row >= 0:
+                self.legal |= 1 << col
+
+    @profiling.hot
     def play(self, col: int, player: int) -> int:
         """
         Plays a move and updates board state.
@@ -116,8 +148,11 @@ class Board:
         # otherwise update state and return status
         self.state[row, col] = player
         self.last_rows[col] -= 1
+        if row == 0:  # column is now full
+            self.legal &= ~(1 << col)
         return status
 
+    @profiling.hot
     def think(self, row: int, col: int, player: int) -> int:
         """
         Checks the outcome of a certain move (defined by row and column) without updating board state.
@@ -129,27 +164,42 @@ class Board:
         """
         if not self.check_validity(row, col):
             return Board.INVALID_MOVE
-        row_arr = self.state[row] # take a whole row
-        col_arr = self.state[:, col].T # take a whole column
-        row_count = self._count(row_arr, col, player)
-        col_count = self._count(col_arr, row, player)
-
-        if row_count >= Board.win_count or col_count >= Board.win_count:
-            return Board.WIN
+        state = self.state
+        for line in self.lookup.line_cells[row][col]:  # every horizontal and vertical line through the move
+            for cell in line:
+                if state[cell] != player:
+                    break
+            else:
+                return Board.WIN
         return Board.VALID_MOVE
 
     @property
+    @profiling.hot
     def valid_moves(self) -> List[int]:
         """
         Calculate valid moves from the current board state.
 
         :return: list containing all valid moves
         """
-        result = []
-        for i, elem in enumerate(self.last_rows):
-            if 0 <= elem < Board.height:
-                result.append(i)
-        return result
+        return list(self.lookup.move_lists[self.legal])
+
+    @property
+    def ordered_moves(self) -> List[int]:
+        """
+        Calculate valid moves from the current board state, ordered from the center column outwards.
+
+        :return: list containing all valid moves
+        """
+        return list(self.lookup.ordered_move_lists[self.legal])
+
+    @property
+    def size(self) -> Tuple[int, int, int]:
+        """
+        Board size.
+
+        :return: width, height and number of stones in a row needed to win
+        """
+        return self.width, self.height, self.win_count
 
     def check_validity(self, row: int, col: int) -> bool:
         """
@@ -159,43 +209,22 @@ class Board:
         :param col: move column
         :return: true if valid, false otherwise
         """
-        if not (0 <= row < Board.height):
-            return False
-        if not (0 <= col < Board.width):
+        if not (0 <= row < self.height):
             return False
-        # if field is set move is invalid
-        if self.state[row, col] != Board.NOT_SET:
+        if not (0 <= col < self.width):
             return False
-        # if field is not set (guaranteed by the upper if) and
-        # row is at the bottom of the board = valid move
-        if row == Board.height - 1:
-            return True
-        # otherwise, row below ours has to be set
-        return self.state[row + 1, col] != Board.NOT_SET
+        # move is valid only on the lowest free field of the column
+        return row == self.last_rows[col]
 
-    @staticmethod
-    def _count(arr: np.ndarray, position: int, player: int) -> int:
-        """
-        Calculate how many contiguous fields are set for a player in a given array.
-
-        :param arr: input array (could be a row or a column) - always provide it in shape (1, n)
-        :param position: start position for checking
-        :param player: player we're simulating a move for
-        :return: number of contiguous fields set for that player
-        """
-        # middle-out spread -> count only contiguous player fields
-        max_count = 1  # assume we want our current position to be for player
-        # go left of position
-        for i in range(position - 1, -1, -1):
-            if arr[i] != player:
-                break
-            max_count += 1
-        # go right of position
-        for i in range(position + 1, len(arr)):
-            if arr[i] != player:
-                break
-            max_count += 1
-        return max_count
+    def table(self):
+        """
+        Return a string representation of the board, pretty printed if common.PPRINT is set.
+
+        :return: string representation of the board
+        """
+        if common.PPRINT:  # choose which type of table print we're going to be using
+            return self._table()
+        return self._official_table()
 
     def _official_table(self):
         """
@@ -203,7 +232,7 @@ class Board:
 
         :return: string representation of the board
         """
-        fmt_string = '{}' * Board.width
+        fmt_string = '{}' * self.width
         result = ''
         for row in self.state:
             result += fmt_string.format(*list(map(remap_char, row))) + '\n'
@@ -222,11 +251,11 @@ class Board:
         bottom_left_border = '\u2569'
         bottom_right_border = '\u255D'
 
-        fmt_string = ('{} ' * Board.width)
+        fmt_string = ('{} ' * self.width)
         top = ' ' + vertical_border + ' ' + ' '.join([f'{i}' for i in range(self.width)]) + ' ' + vertical_border
-        header = horizontal_border + top_left_border + horizontal_border * (Board.width * 2 + 1) + top_right_border
+        header = horizontal_border + top_left_border + horizontal_border * (self.width * 2 + 1) + top_right_border
         footer = horizontal_border + bottom_left_border + horizontal_border * (
-                Board.width * 2 + 1) + bottom_right_border
+                self.width * 2 + 1) + bottom_right_border
         result = ''
         for i, row in enumerate(self.state):
             result += f'{i}' + vertical_border + ' ' + fmt_string.format(
@@ -234,9 +263,106 @@ class Board:
         result = top + '\n' + header + '\n' + result + footer + '\n'
         return result
 
+    @profiling.hot
     def copy(self):
         """
         Copies the current board.
         :return: board in the new memory space
         """
-        return Board(state=np.copy(self.state))
+        b = Board.__new__(Board)  # nothing has to be computed again, skip __init__
+        b.state = np.copy(self.state)
+        b.last_rows = self.last_rows.copy()
+        b.legal = self.legal
+        b.width, b.height, b.win_count = self.width, self.height, self.win_count
+        b.lookup = self.lookup
+        return b
+
+    def key(self) -> int:
+        """
+        Compact key of the board state, the same one Board.encode_states computes. It's a 64-bit key for boards where
+        width * (height + 1) <= 64 (the default one), a longer integer for bigger boards.
+
+        :return: position key
+        """
+        column_bits = self.height + 1
+        state = self.state
+        key = 0
+        for col, row in enumerate(self.last_rows):
+            code = 1 << (self.height - 1 - row)  # top of column marker above the stones
+            for i in range(self.height - 1 - row):  # i-th stone from the bottom
+                if state[self.height - 1 - i, col] == Board.PLAYER_1:
+                    code |= 1 << i
+            key |= code << (col * column_bits)
+        return key
+
+    @staticmethod
+    def from_key(key: int, width: int = None, height: int = None, win_count: int = None) -> 'Board':
+        """
+        Create a board from a position key (inverse of Board.key).
+
+        :param key: position key
+        :param width: board width (Board.width by default)
+        :param height: board height (Board.height by default)
+        :param win_count: number of stones in a row needed to win (Board.win_count by default)
+        :return: board
+        """
+        width, height = width or Board.width, height or Board.height
+        column_bits = height + 1
+        state = np.zeros((height, width))
+        for col in range(width):
+            code = key >> (col * column_bits) & ((1 << column_bits) - 1)
+            for i in range(code.bit_length() - 1):  # highest set bit is the top of column marker
+                state[height - 1 - i, col] = Board.PLAYER_1 if code >> i & 1 else Board.PLAYER_2
+        return Board(state, win_count=win_count)
+
+    @staticmethod
+    def encode_states(states: np.ndarray) -> np.ndarray:
+        """
+        Encode many board states into 64-bit position keys.
+
+        Every column takes height + 1 bits: one bit per stone from the bottom up (1 for PLAYER_1, 0 for
+        PLAYER_2) followed by a 1 bit marking the top of the column. Columns are stored from the least significant
+        bits, column 0 first.
+
+        :param states: array of board states with shape (n, height, width)
+        :return: array of n position keys (uint64)
+        """
+        states = np.asarray(states)
+        height, width = states.shape[1:]
+        assert width * (height + 1) <= 64, 'board too big for 64-bit keys'
+        column_bits = height + 1
+        keys = np.zeros(len(states), dtype=np.uint64)
+        counts = np.count_nonzero(states, axis=1)  # stones in every column, shape (n, width)
+        codes = np.zeros(counts.shape, dtype=np.uint64)
+        for i in range(height):  # i-th stone from the bottom
+            codes |= (states[:, height - 1 - i, :] == Board.PLAYER_1).astype(np.uint64) << np.uint64(i)
+        codes |= np.uint64(1) << counts.astype(np.uint64)  # top of column marker
+        for col in range(width):
+            keys |= codes[:, col] << np.uint64(col * column_bits)
+        return keys
+
+    @staticmethod
+    def decode_keys(keys: np.ndarray, width: int = None, height: int = None) -> np.ndarray:
+        """
+        Decode 64-bit position keys into board states (inverse of Board.encode_states).
+
+        :param keys: array of n position keys
+        :param width: board width (Board.width by default)
+        :param height: board height (Board.height by default)
+        :return: array of board states with shape (n, height, width)
+        """
+        width, height = width or Board.width, height or Board.height
+        keys = np.asarray(keys, dtype=np.uint64)
+        column_bits = height + 1
+        states = np.zeros((len(keys), height, width))
+        for col in range(width):
+            codes = (keys >> np.uint64(col * column_bits)) & np.uint64((1 << column_bits) - 1)
+            counts = np.zeros(len(keys), dtype=np.int64)
+            for i in range(height, 0, -1):  # highest set bit is the top of column marker
+                counts = np.where((counts == 0) & ((codes >> np.uint64(i)) & np.uint64(1) == 1), i, counts)
+            for i in range(height):
+                bits = (codes >> np.uint64(i)) & np.uint64(1)
+                states[:, height - 1 - i, col] = np.where(i < counts,
+                                                          np.where(bits == 1, Board.PLAYER_1, Board.PLAYER_2),
+                                                          Board.NOT_SET)
+        return states
@@ -1,5 +1,6 @@
 VERBOSE = False
 PPRINT = False
+PROFILE = False  # set by profiling.enable, hot functions are timed only if it's enabled
 
 
 def log(*values):
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import sys
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+
+import numpy as np
+
+import board
+import common
+import controller
+import parallel
+
+
+class Analysis:
+    """
+    A running analysis of a single position, shared by every request for the same position and budget.
+    """
+
+    def __init__(self):
+        self.updates: List[dict] = []  # intermediate results so far (one per completed depth)
+        self.subscribers: List[asyncio.Queue] = []
+        self.done = False
+
+    def publish(self, update):
+        """
+        Send an update (None marks the end of the analysis) to all subscribers.
+
+        :param update: intermediate result
+        :return:
+        """
+        if update is None:
+            self.done = True
+        else:
+            self.updates.append(update)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(update)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Subscribe to updates. Updates published before subscribing are replayed.
+
+        :return: queue the updates are put in
+        """
+        subscriber = asyncio.Queue()
+        for update in self.updates:
+            subscriber.put_nowait(update)
+        if self.done:
+            subscriber.put_nowait(None)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+
+class Engine:
+    """
+    Asyncio front-end for asking the engine for the best move of a position.
+
+    Positions are searched with iterative deepening, every completed depth produces an intermediate best move.
+    With a scheduler every depth is computed by the MPI workers through a parallel.Session, without one the
+    position is searched locally with the search backend. Identical positions requested at the same time are
+    searched only once.
+    """
+
+    def __init__(self, scheduler: parallel.Scheduler = None, max_depth=7, backend='tree', precompute_depth=2,
+                 max_requests=32):
+        self.scheduler = scheduler
+        self.max_depth = max_depth
+        self.backend = backend
+        self.precompute_depth = precompute_depth
+        # searches block, so they run on threads (their number limits the number of positions searched at once)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_requests)
+        self._analyses: Dict[Tuple, Analysis] = {}  # in-flight analyses by position and budget
+
+    async def analyse(self, state: np.ndarray, player: int, budget: float = None,
+                      max_depth: int = None) -> AsyncIterator[dict]:
+        """
+        Search a position, yielding the best move after every completed depth.
+
+        :param state: board state
+        :param player: player making the move
+        :param budget: time budget in seconds (search stops deepening once it's used up), None for no limit
+        :param max_depth: maximum search depth (engine default if None)
+        :return: async iterator of {'depth': depth, 'move': best move, 'seconds': elapsed time}
+        """
+        max_depth = max_depth or self.max_depth
+        key = (state.tobytes(), player, budget, max_depth)
+        analysis = self._analyses.get(key)
+        if analysis is None:  # not in flight yet -> start it
+            analysis = Analysis()
+            self._analyses[key] = analysis
+            asyncio.get_running_loop().create_task(self._run(key, analysis, state, player, budget, max_depth))
+        updates = analysis.subscribe()
+        while True:
+            update = await updates.get()
+            if update is None:
+                return
+            yield update
+
+    async def best_move(self, state: np.ndarray, player: int, budget: float = None, max_depth: int = None) -> int:
+        """
+        Best move of a position.
+
+        :param state: board state
+        :param player: player making the move
+        :param budget: time budget in seconds, None for no limit
+        :param max_depth: maximum search depth (engine default if None)
+        :return: best move
+        """
+        move = None
+        async for update in self.analyse(state, player, budget, max_depth):
+            move = update['move']
+        return move
+
+    async def _run(self, key: Tuple, analysis: Analysis, state: np.ndarray, player: int, budget: float,
+                   max_depth: int):
+        """
+        Iterative deepening of a single position.
+
+        :param key: in-flight analysis key
+        :param analysis: analysis to publish the results to
+        :param state: board state
+        :param player: player making the move
+        :param budget: time budget in seconds
+        :param max_depth: maximum search depth
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        b = board.Board(np.copy(state))
+        ctl = controller.ComputerController(b, max_depth, precompute_depth=self.precompute_depth,
+                                            backend=self.backend, verbose=False)
+        session = parallel.Session(self.scheduler, b, ctl) if self.scheduler else None
+        start = time.perf_counter()
+        try:
+            first_depth = self.precompute_depth + 1 if session else 1
+            for depth in range(min(first_depth, max_depth), max_depth + 1):
+                if session:
+                    ctl.max_depth = depth
+                    move = await loop.run_in_executor(self._executor, session.play, player)
+                else:
+                    result = await loop.run_in_executor(self._executor, ctl.search, player, depth)
+                    move = result.best_move
+                elapsed = time.perf_counter() - start
+                analysis.publish({'depth': depth, 'move': move, 'seconds': elapsed})
+                if budget is not None and elapsed >= budget:
+                    break
+        except Exception as e:
+            common.log(f'analysis failed: {e}')
+            analysis.publish({'error': str(e)})
+        finally:
+            if session:
+                session.close()
+            del self._analyses[key]
+            analysis.publish(None)
+
+    def close(self):
+        """
+        Stop the search threads (and the scheduler, if there is one).
+        :return:
+        """
+        self._executor.shutdown()
+        if self.scheduler:
+            self.scheduler.done()
+
+
+def parse_position(request: dict) -> Tuple[np.ndarray, int]:
+    """
+    Create a position from a request: either "moves" (list of columns played from an empty board)
+    or "state" (Board.height lists of Board.width fields). "player" is optional.
+
+    :param request: request
+    :return: board state and player making the move
+    """
+    if 'moves' in request:
+        b = board.Board()
+        player = board.Board.PLAYER_1
+        for move in request['moves']:
+            if b.play(int(move), player) != board.Board.VALID_MOVE:
+                raise ValueError(f'invalid or winning move {move}')
+            player *= -1
+    else:
+        state = np.array(request['state'], dtype=float)
+        if state.shape != (board.Board.height, board.Board.width):
+            raise ValueError(f'state has to be {board.Board.height} rows of {board.Board.width} fields, '
+                             f'got shape {state.shape}')
+        if not np.isin(state, (0, board.Board.PLAYER_1, board.Board.PLAYER_2)).all():
+            raise ValueError('state fields have to be 0, 1 or -1')
+        floating = (state[:-1] != 0) & (state[1:] == 0)  # stones above an empty field (the last row is the bottom)
+        if floating.any():
+            row, col = np.argwhere(floating)[0]
+            raise ValueError(f'stone at row {row}, column {col} is not on a filled field')
+        difference = np.count_nonzero(state == board.Board.PLAYER_1) - np.count_nonzero(state == board.Board.PLAYER_2)
+        if difference not in (0, 1):  # player 1 moves first
+            raise ValueError('state has to hold as many stones of player 1 as of player 2, or one more')
+        b = board.Board(state)
+        player = board.Board.PLAYER_1 if np.count_nonzero(b.state) % 2 == 0 else board.Board.PLAYER_2
+    player = request.get('player', player)
+    if player not in (board.Board.PLAYER_1, board.Board.PLAYER_2):
+        raise ValueError(f'invalid player {player}')
+    if not b.valid_moves:
+        raise ValueError('board is full')
+    return b.state, player
+
+
+async def handle(engine: Engine, line: str, write):
+    """
+    Handle one JSON-lines request: {"id": ..., "moves"/"state": ..., "player": ..., "budget": seconds,
+    "depth": max depth, "stream": true/false}. Streaming requests get a response for every completed depth,
+    the last response has "final": true.
+
+    :param engine: engine
+    :param line: request line
+    :param write: function writing a response object
+    :return:
+    """
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        state, player = parse_position(request)
+        last = None
+        async for update in engine.analyse(state, player, request.get('budget'), request.get('depth')):
+            if 'error' in update:
+                raise RuntimeError(update['error'])
+            last = update
+            if request.get('stream'):
+                write({'id': request_id, **update, 'final': False})
+        if last is None:  # stopped before any depth was completed
+            write({'id': request_id, 'error': 'search finished without a result', 'final': True})
+            return
+        write({'id': request_id, **last, 'final': True})
+    except Exception as e:
+        write({'id': request_id, 'error': str(e), 'final': True})
+
+
+async def serve_stdio(engine: Engine):
+    """
+    Serve JSON-lines requests from stdin, responses go to stdout. Requests are handled concurrently.
+
+    :param engine: engine
+    :return:
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    def write(response):
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+    pending = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.strip():
+            task = loop.create_task(handle(engine, line.decode(), write))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+
+
+async def serve_tcp(engine: Engine, host: str, port: int):
+    """
+    Serve JSON-lines requests on a TCP socket. Requests of every connection are handled concurrently.
+
+    :param engine: engine
+    :param host: host to listen on
+    :param port: port to listen on
+    :return:
+    """
+
+    async def connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def write(response):
+            writer.write((json.dumps(response) + '\n').encode())
+
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.get_running_loop().create_task(handle(engine, line.decode(), write))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        writer.close()
+
+    server = await asyncio.start_server(connection, host, port)
+    common.log(f'listening on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON-lines best move server (run under mpiexec to use workers).')
+    parser.add_argument('--depth', type=int, default=7, help='default maximum search depth')
+    parser.add_argument('--backend', default='tree', help='search backend name')
+    parser.add_argument('--tcp', help='listen on HOST:PORT instead of serving stdin/stdout')
+    args = parser.parse_args()
+
+    try:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+    except ImportError:
+        comm = None
+    rank = comm.Get_rank() if comm else 0
+    workers = comm.Get_size() - 1 if comm else 0
+
+    if rank != 0:
+        ctl = controller.ComputerController(None, args.depth, precompute_depth=2, backend=args.backend, streaming=True)
+        parallel.Worker(rank, comm, ctl).run()
+        return
+
+    scheduler = parallel.Scheduler(comm, workers) if workers else None  # no workers -> search locally
+    engine = Engine(scheduler, args.depth, args.backend)
+    try:
+        if args.tcp:
+            host, port = args.tcp.rsplit(':', 1)
+            asyncio.run(serve_tcp(engine, host, int(port)))
+        else:
+            asyncio.run(serve_stdio(engine))
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
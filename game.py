@@ -20,6 +20,7 @@ class Game:
         self.move = 0
         self.won = 0
         self.controllers = [player_1, player_2]
+        self.history = []  # valid moves played so far
 
     def step(self) -> int:
         """
@@ -46,28 +47,31 @@ class Game:
         status = self.board.play(selected_move, player)  # play the selected move
         if status == self.board.INVALID_MOVE:
             return status
+        self.history.append(selected_move)
         if status == self.board.WIN:
             self.won = player
         self.move += 1
         return status
 
-    def run(self, verbose=False):
+    def run(self, verbose=False) -> int:
         """
         Runs the main game loop.
 
-        :param verbose: prints the board after every move
-        :return:
+        :param verbose: prints the board after every move and the winner at the end
+        :return: winner player ID (0 if nobody won)
         """
         step_num = 0
         while self.won == 0:
             if len(self.board.valid_moves) == 0:
-                return
+                return self.won
             status = self.step()
             if verbose and step_num % 2 == 1:
                 print(self.board.table())
             if status != board.Board.INVALID_MOVE:
                 step_num += 1
-        print(f'Player {board.remap_char(self.won)} won!')
+        if verbose:
+            print(f'Player {board.remap_char(self.won)} won!')
+        return self.won
 
 
 def test_1():
@@ -106,20 +110,22 @@ def user_vs_user():
     game.run(verbose=True)
 
 
-def user_vs_computer():
+def user_vs_computer(backend='tree'):
     b = board.Board()
-    game = Game(b, controller.UserController(b), controller.ComputerController(b, difficulty=6))
+    game = Game(b, controller.UserController(b), controller.ComputerController(b, difficulty=6, backend=backend))
     game.run(verbose=True)
 
 
-def computer_vs_computer():
+def computer_vs_computer(backend_1='tree', backend_2='tree'):
     b = board.Board()
-    game = Game(b, controller.ComputerController(b, difficulty=6), controller.ComputerController(b, difficulty=6))
+    game = Game(b, controller.ComputerController(b, difficulty=6, backend=backend_1),
+                controller.ComputerController(b, difficulty=6, backend=backend_2))
     game.run(verbose=True)
 
 
 if __name__ == '__main__':
     import common
+    import sys
 
     # test for board states
     # test_1()
@@ -127,5 +133,5 @@ if __name__ == '__main__':
     # user_vs_user()
     # user vs computer game
     # user_vs_computer()
-    # computer vs computer game
-    computer_vs_computer()
+    # computer vs computer game (optionally with search backend names as arguments)
+    computer_vs_computer(*sys.argv[1:3])
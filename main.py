@@ -5,32 +5,127 @@ import common
 import controller
 import game
 import parallel
+import profiling
+import store
+import topology
 
 if __name__ == '__main__':
     import sys
+    import threading
 
     total_processes = int(sys.argv[1])
     num_of_workers = total_processes - 1  # minus the master
 
     max_depth = int(sys.argv[2])
 
+    backend = sys.argv[3] if len(sys.argv) > 3 else 'tree'  # search backend name (see search.BACKENDS)
+
+    games = int(sys.argv[4]) if len(sys.argv) > 4 else 1  # concurrent computer vs random games (1 = play the user)
+
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
 
     common.VERBOSE = False
     common.PPRINT = False
+    common.PROFILE = False  # time hot functions on every rank and print the merged profile at the end
+
+    if common.PROFILE:
+        profiling.enable()
+
+    width, height, win_count = board.Board.DEFAULT_SIZE  # board size and number of stones in a row needed to win
+
+    persistent_store = False  # keep worker results on disk so that later runs don't compute them again
+    # every rank opens the same store file (ranks on other hosts need a shared file system)
+    results = None
+    if persistent_store:
+        try:
+            results = store.ResultStore(store.default_path(backend, (width, height, win_count)),
+                                        size=(width, height, win_count))
+        except ValueError as error:  # e.g. boards whose position keys don't fit in the store's 64-bit keys
+            if rank == 0:
+                print(f'running without the result store: {error}')
+
+    node_budget = None  # maximum number of search tree nodes a worker keeps in memory (None -> no limit)
+
+    worker_processes = 1  # > 1: every worker searches its tasks on a local pool of this many processes
 
-    ctl = controller.ComputerController(None, max_depth,
-                                        precompute_depth=2)  # pre-compute depth for controller is 2 (max 49 tasks)
-    if rank == 0:  # code for master
+    share_ordering = False  # workers send their move ordering history to the master (pruning backends only)
+
+    serve_games = False  # keep all ranks running after a game and play another one (workers stay warm)
+
+    # seconds a worker computing a task may stay silent before its tasks are given to other workers (None -> forever)
+    # workers send heartbeats only if MPI provides MPI_THREAD_MULTIPLE, without them it has to be longer than any task
+    # (a worker hung for good doesn't stop the game, but the job never exits: MPI waits for every rank to finish)
+    worker_timeout = None
+
+    # workers and the master only look at the root of the score tree and its children -> score it streaming
+    ctl = controller.ComputerController(None, max_depth, precompute_depth=2, backend=backend, store=results,
+                                        node_budget=node_budget, share_ordering=share_ordering,
+                                        streaming=True)  # pre-compute depth for controller is 2 (max 49 tasks)
+
+    hierarchical = False  # master -> one sub-master per host -> workers of the host
+    # None -> hosts are the ranks MPI reports as sharing a node, a path -> hosts are read from that hostfile
+    # (assumes mpiexec maps ranks by slot, meant for trying layouts on a single machine)
+    topology_hostfile = None
+    if hierarchical:
+        if topology_hostfile is not None:
+            layout = topology.Topology.from_hostfile(topology_hostfile, total_processes)
+        else:
+            layout = topology.Topology.from_comm(comm)  # collective, every rank takes part
+        local_comm = layout.split(comm)  # collective, every rank takes part
+        workers = layout.sub_masters
+    else:
+        local_comm = None
+        workers = None  # every worker talks to the master
+
+    if rank == 0 and games > 1:  # code for master serving many games
+        common.log(f'initializing master for {games} games')
+        scheduler = parallel.Scheduler(comm, num_of_workers, workers, worker_timeout)  # all games share the workers
+        threads = []
+        for i in range(games):
+            b = board.Board(width=width, height=height, win_count=win_count)
+            session = parallel.Session(scheduler, b, controller.ComputerController(
+                None, max_depth, precompute_depth=2, backend=backend, verbose=False, store=results, streaming=True,
+                share_ordering=share_ordering))
+            g = game.Game(b, controller.RandomController(b, seed=i), session)
+            threads.append(threading.Thread(target=lambda g=g, i=i: print(f'game {i}: {g.run()}')))
+            threads[-1].start()
+        for thread in threads:
+            thread.join()
+        scheduler.done()  # indicate MPI ending
+    elif rank == 0:  # code for master
         common.log('initializing master')
-        board = board.Board()
-        master = parallel.MasterController(comm, num_of_workers, board, ctl)  # initialize master
-        game = game.Game(board, controller.UserController(board), master)
-        game.run(verbose=True)  # run game loop
+        b = board.Board(width=width, height=height, win_count=win_count)
+        master = parallel.MasterController(comm, num_of_workers, b, ctl, workers, worker_timeout)  # initialize master
+        while True:
+            g = game.Game(b, controller.UserController(b), master)
+            g.run(verbose=True)  # run game loop
+            if not serve_games or input('new game? [y/n] ').strip().lower() != 'y':
+                break
+            b = board.Board(width=width, height=height, win_count=win_count)
+            master.new_game(b)  # workers are told to start over instead of being started again
         master.done()  # indicate MPI ending
+        master.metrics.write_json('metrics.json')  # per-move measurements
+        master.metrics.write_csv('metrics.csv')
+    elif local_comm is not None and local_comm.Get_rank() == 0:  # code for sub-master
+        common.log(f'initializing sub-master {rank}')
+        parallel.SubMaster(rank, comm, local_comm, ctl, worker_timeout).run()
+        common.log(f'sub-master {rank} exited')
     else:  # code for worker
         common.log(f'initializing worker {rank}')
-        worker = parallel.Worker(rank, comm, ctl)  # initialize worker
+        worker_rank, worker_comm = (local_comm.Get_rank(), local_comm) if local_comm is not None else (rank, comm)
+        if worker_processes > 1:
+            worker = parallel.PoolWorker(worker_rank, worker_comm, ctl, worker_processes)
+        else:
+            worker = parallel.Worker(worker_rank, worker_comm, ctl)  # initialize worker
         worker.run()
         common.log(f'worker {rank} exited')
+
+    if results is not None:
+        results.close(compact=rank == 0)  # workers are done writing once the master stopped them
+
+    if common.PROFILE:
+        profiles = profiling.gather(comm)  # merge profiles of all ranks on the master
+        if rank == 0:
+            profiling.write_json('profile.json', profiles)
+            print(profiling.report(profiling.merge(profiles)))
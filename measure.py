@@ -1,4 +1,11 @@
-import multiprocessing
+import csv
+import functools
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
 
 
 class Mjerenje:
@@ -15,11 +22,24 @@ class Mjerenje:
                 self.speedup = self._line_to_list(lines[2], float)
                 self.efficiency = self._line_to_list(lines[3], float)
         except (FileNotFoundError, IndexError) as e:
-            self.cpu_count = multiprocessing.cpu_count()
+            self.cpu_count = os.cpu_count()
             self.measurements = [0, ] * 8
             self.speedup = [1, ] * 8
             self.efficiency = [1, ] * 8
 
+    def ensure(self, num_of_processes: int):
+        """
+        Make sure there is a slot for a number of processes.
+
+        :param num_of_processes: number of processes
+        :return:
+        """
+        missing = num_of_processes - len(self.measurements)
+        if missing > 0:
+            self.measurements += [0, ] * missing
+            self.speedup += [1, ] * missing
+            self.efficiency += [1, ] * missing
+
     @staticmethod
     def _line_to_list(line, map_func=int) -> list:
         """
@@ -59,36 +79,230 @@ def log(func):
     """
     Annotation used to measure execution of a method only for its' first run.
     Method can be used only for classes that contain field "num_of_processes".
+    Use Metrics for measurements of every run.
 
     :param func: function to be wrapped
     :return: wrapper function
     """
-    import time
-
     my_measure = -1
-    measure: Mjerenje = Mjerenje()
+    measure: Mjerenje = None  # read on the first measured run, not when the module is imported
 
+    @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         nonlocal my_measure, measure  # grab vars outside the current scope
-        if my_measure == -1:  # if no measure was done yet
+        if my_measure == -1 and self.num_of_processes > 0:  # if no measure was done yet
+            if measure is None:
+                measure = Mjerenje()
             start = time.time()
             result = func(self, *args, **kwargs)
             end = time.time()
             my_measure = round((end - start) * 1000)  # measure the elapsed time
             this = self.num_of_processes - 1
+            measure.ensure(self.num_of_processes)
             measure.measurements[this] = my_measure
             if my_measure != 0:  # calculate speedup and efficiency
                 measure.speedup[this] = measure.measurements[0] / my_measure
-                if self.num_of_processes != 0:
-                    measure.efficiency[this] = measure.measurements[0] / (my_measure * self.num_of_processes)
-                else:
-                    measure.efficiency[this] = 0.0
+                measure.efficiency[this] = measure.measurements[0] / (my_measure * self.num_of_processes)
             else:
                 measure.speedup[this] = 0.0
-                measure.efficiency = 0.0
+                measure.efficiency[this] = 0.0
             measure.write()  # write to file mjerenje.txt
         else:
             result = func(self, *args, **kwargs)
         return result
 
     return wrapper
+
+
+class MoveMetrics:
+    """
+    Measurements of a single move computed by the master (all times are in seconds).
+    """
+    FIELDS = ['move', 'player', 'tasks', 'precompute', 'dispatch_latency', 'result_wait', 'scoring', 'total',
+              'nodes', 'search_time', 'cache_hits', 'max_depth']
+    WORKER_FIELDS = ['tasks', 'nodes', 'seconds', 'cache_hits', 'max_depth']  # search statistics of every worker
+
+    def __init__(self, move: int, player: int):
+        self.move = move  # move number in the game
+        self.player = player
+        self.tasks = 0  # number of tasks sent to workers
+        self.precompute = 0.0  # pre-computed tree and task creation
+        self.dispatch_latency = 0.0  # time spent waiting for workers to request tasks
+        self.result_wait = 0.0  # time spent waiting for results after all tasks were dispatched
+        self.scoring = 0.0  # final scoring of the pre-computed tree
+        self.total = 0.0
+        self.busy: Dict[int, float] = {}  # worker rank -> time between sending a task and receiving its result
+        self.idle: Dict[int, float] = {}  # worker rank -> rest of the move time
+        # search statistics reported by workers
+        self.nodes = 0
+        self.search_time = 0.0
+        self.cache_hits = 0
+        self.max_depth = 0
+        self.workers: Dict[int, Dict[str, float]] = {}  # worker rank -> WORKER_FIELDS
+
+    def task_done(self, worker: int, seconds: float):
+        """
+        Record a task computed by a worker.
+
+        :param worker: worker rank
+        :param seconds: time between sending the task and receiving its result
+        :return:
+        """
+        self.busy[worker] = self.busy.get(worker, 0.0) + seconds
+
+    def add_result(self, result):
+        """
+        Record search statistics a worker returned with a parallel.Result.
+
+        :param result: computation result
+        :return:
+        """
+        self.nodes += result.nodes
+        self.search_time += result.seconds
+        self.cache_hits += result.cache_hits
+        self.max_depth = max(self.max_depth, result.max_depth)
+        stats = self.workers.setdefault(result.worker, dict.fromkeys(self.WORKER_FIELDS, 0))
+        stats['tasks'] += 1
+        stats['nodes'] += result.nodes
+        stats['seconds'] += result.seconds
+        stats['cache_hits'] += result.cache_hits
+        stats['max_depth'] = max(stats['max_depth'], result.max_depth)
+
+    def finish(self, workers: List[int]):
+        """
+        Compute idle times after the move is done.
+
+        :param workers: ranks of all workers
+        :return:
+        """
+        for worker in workers:
+            self.busy.setdefault(worker, 0.0)
+            self.idle[worker] = max(self.total - self.busy[worker], 0.0)
+
+    def to_dict(self) -> dict:
+        result = {field: getattr(self, field) for field in self.FIELDS}
+        result['busy'] = {str(k): v for k, v in sorted(self.busy.items())}
+        result['idle'] = {str(k): v for k, v in sorted(self.idle.items())}
+        result['workers'] = {str(k): v for k, v in sorted(self.workers.items())}
+        return result
+
+    def __repr__(self):
+        return f'MoveMetrics(move {self.move} tasks {self.tasks} total {self.total:.3f})'
+
+
+class Metrics:
+    """
+    Per-move measurements of a whole run, with aggregation into histograms and JSON/CSV export.
+    """
+
+    def __init__(self):
+        self.moves: List[MoveMetrics] = []
+
+    def start(self, player: int) -> MoveMetrics:
+        """
+        Start measuring a new move.
+
+        :param player: player making the move
+        :return: measurements for the move
+        """
+        move = MoveMetrics(len(self.moves), player)
+        self.moves.append(move)
+        return move
+
+    def values(self, field: str) -> List[float]:
+        """
+        Values of a field for every move. Field can also be "busy" or "idle" (values of all workers and moves).
+
+        :param field: field name
+        :return: list of values
+        """
+        if field in ('busy', 'idle'):
+            return [value for move in self.moves for value in getattr(move, field).values()]
+        return [getattr(move, field) for move in self.moves]
+
+    def workers(self) -> Dict[int, Dict[str, float]]:
+        """
+        Search statistics of every worker aggregated over all moves.
+
+        :return: worker rank -> MoveMetrics.WORKER_FIELDS
+        """
+        result = {}
+        for move in self.moves:
+            for worker, stats in move.workers.items():
+                total = result.setdefault(worker, dict.fromkeys(MoveMetrics.WORKER_FIELDS, 0))
+                for field in MoveMetrics.WORKER_FIELDS:
+                    if field == 'max_depth':
+                        total[field] = max(total[field], stats[field])
+                    else:
+                        total[field] += stats[field]
+        for total in result.values():
+            total['nodes_per_sec'] = total['nodes'] / total['seconds'] if total['seconds'] else 0.0
+        return result
+
+    def histogram(self, field: str, bins=10) -> dict:
+        """
+        Histogram of field values.
+
+        :param field: field name
+        :param bins: number of bins
+        :return: dictionary with bin counts and bin edges
+        """
+        values = self.values(field)
+        if not values:
+            return {'counts': [], 'edges': []}
+        counts, edges = np.histogram(values, bins=bins)
+        return {'counts': counts.tolist(), 'edges': edges.tolist()}
+
+    def summary(self, field: str) -> dict:
+        """
+        Summary statistics of field values.
+
+        :param field: field name
+        :return: dictionary with min, mean, median, 90th percentile, max and sum
+        """
+        values = self.values(field)
+        if not values:
+            return {}
+        return {
+            'min': float(np.min(values)),
+            'mean': float(np.mean(values)),
+            'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)),
+            'max': float(np.max(values)),
+            'sum': float(np.sum(values)),
+        }
+
+    def to_dict(self, bins=10) -> dict:
+        fields = MoveMetrics.FIELDS[2:] + ['busy', 'idle']
+        return {
+            'moves': [move.to_dict() for move in self.moves],
+            'summary': {field: self.summary(field) for field in fields},
+            'histograms': {field: self.histogram(field, bins) for field in fields},
+            'workers': {str(k): v for k, v in sorted(self.workers().items())},
+        }
+
+    def write_json(self, path: str, bins=10):
+        """
+        Write all measurements, summaries and histograms to a JSON file.
+
+        :param path: file path
+        :param bins: number of histogram bins
+        :return:
+        """
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(bins), file, indent=2)
+
+    def write_csv(self, path: str):
+        """
+        Write one row per move to a CSV file (with busy/idle columns for every worker).
+
+        :param path: file path
+        :return:
+        """
+        workers = sorted({worker for move in self.moves for worker in move.busy})
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(MoveMetrics.FIELDS + [f'busy_{w}' for w in workers] + [f'idle_{w}' for w in workers])
+            for move in self.moves:
+                writer.writerow([getattr(move, field) for field in MoveMetrics.FIELDS] +
+                                [move.busy.get(w, 0.0) for w in workers] + [move.idle.get(w, 0.0) for w in workers])
@@ -0,0 +1,131 @@
+from typing import List
+
+import numpy as np
+
+import board
+
+
+class MoveOrdering:
+    """
+    Move ordering of a pruning search: the moves most likely to be best are searched first, so cutoffs come sooner.
+
+    Moves are ordered by:
+
+    * killer moves - the last KILLERS moves that caused a cutoff at the same ply (siblings tend to be refuted by the
+      same move)
+    * history - a score for every (player, cell) pair, raised every time a move to that cell caused a cutoff or won
+      the game, more for deeper searches
+    * static order - columns from the center outwards (see tables.Tables.center_order)
+
+    The tables are kept across iterations of iterative deepening and across moves (history is halved for every new
+    search, so old results fade out) and cleared when the board size changes. History gathered by workers can be
+    merged into the master's tables.
+    """
+    KILLERS = 2  # killer moves kept per ply
+
+    def __init__(self, max_ply=64):
+        self.max_ply = max_ply
+        self._reset(board.Board.width, board.Board.height)
+
+    def _reset(self, width: int, height: int):
+        """
+        Clear the tables.
+
+        :param width: width of the boards the tables are for
+        :param height: height of the boards the tables are for
+        :return:
+        """
+        self.width, self.height = width, height
+        self.killers: List[List[int]] = [[] for _ in range(self.max_ply)]  # ply -> latest cutoff moves, newest first
+        self.history = np.zeros((2, width * height))  # (player, cell) -> score
+        self._updates = np.zeros_like(self.history)  # history raised since take_updates was called
+
+    def clear(self):
+        """
+        Forget everything learned so far (a new game starts).
+
+        :return:
+        """
+        self._reset(self.width, self.height)
+
+    @staticmethod
+    def _index(player: int) -> int:
+        return 0 if player == board.Board.PLAYER_1 else 1
+
+    def order(self, b: board.Board, player: int, ply: int) -> List[int]:
+        """
+        Valid moves of a position, best first.
+
+        :param b: board
+        :param player: player making the move
+        :param ply: distance from the root of the search
+        :return: ordered moves
+        """
+        if (b.width, b.height) != (self.width, self.height):
+            self._reset(b.width, b.height)
+        moves = b.ordered_moves
+        history = self.history[self._index(player)]
+        width = b.width
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        # sort is stable -> moves with equal scores stay in the static (center-first) order
+        moves.sort(key=lambda t: (killers.index(t) if t in killers else MoveOrdering.KILLERS,
+                                  -history[b.last_rows[t] * width + t]))
+        return moves
+
+    def update(self, b: board.Board, player: int, move: int, ply: int, depth: int):
+        """
+        Record a move that caused a cutoff or won the game.
+
+        :param b: board before the move
+        :param player: player making the move
+        :param move: move
+        :param ply: distance from the root of the search
+        :param depth: remaining search depth
+        :return:
+        """
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if move in killers:
+                killers.remove(move)
+            killers.insert(0, move)
+            del killers[MoveOrdering.KILLERS:]
+        cell = b.last_rows[move] * b.width + move
+        self.history[self._index(player), cell] += depth * depth
+        self._updates[self._index(player), cell] += depth * depth
+
+    def age(self):
+        """
+        Halve the history scores (called before every new search).
+
+        :return:
+        """
+        self.history /= 2
+
+    def take_updates(self) -> np.ndarray:
+        """
+        History gathered since the last call, to be merged into another ordering (see merge).
+
+        :return: history updates with the shape of the history table
+        """
+        updates, self._updates = self._updates, np.zeros_like(self.history)
+        return updates
+
+    def merge(self, updates: np.ndarray):
+        """
+        Merge history updates gathered by another search (a worker). They are passed on by take_updates too, so a
+        sub-master forwards the history of its node workers.
+
+        :param updates: history updates (see take_updates)
+        :return:
+        """
+        self.history += updates
+        self._updates += updates
+
+
+if __name__ == '__main__':
+    test_board = board.Board()
+    ordering = MoveOrdering()
+    print(ordering.order(test_board, board.Board.PLAYER_1, 0))  # static order
+    ordering.update(test_board, board.Board.PLAYER_1, 6, 0, 3)
+    ordering.update(test_board, board.Board.PLAYER_1, 0, 1, 5)
+    print(ordering.order(test_board, board.Board.PLAYER_1, 0), ordering.order(test_board, board.Board.PLAYER_1, 1))
@@ -1,6 +1,10 @@
-import queue
+import collections
+import functools
+import itertools
+import sys
 import threading
-from typing import List
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
 
@@ -8,12 +12,18 @@ import board
 import common
 import controller
 import measure
+import profiling
+import search
+import tables
 import tree
 
 REQUEST_TAG = 50  # tag used for request messages
 TASK_TAG = 101  # tag used for task messages
 RESULT_TAG = 102  # tag used for result messages
 DONE_TAG = 103  # tag used for indicating run end
+WINDOW_TAG = 104  # tag used for alpha/beta window updates of running tasks
+NEW_GAME_TAG = 105  # tag used for starting a new game on warm workers
+HEARTBEAT_TAG = 106  # tag used for signs of life of workers computing a task
 
 
 class Message:
@@ -29,19 +39,61 @@ class Message:
         return f'Message(tag: {self.tag}, value: {self.value})'
 
 
+@functools.lru_cache(maxsize=64)
+def root_board(key: int, size: Tuple[int, int, int] = None) -> board.Board:
+    """
+    Board of a root position, decoded only once for all tasks of a search round.
+
+    :param key: position key of the root
+    :param size: board width, height and number of stones in a row needed to win (None -> default board)
+    :return: board (shared, copy it before playing moves)
+    """
+    return board.Board.from_key(key, *(size or ()))
+
+
 class Task:
     """
     Task that has to be computed on the worker.
+
+    It doesn't carry the board state: the position is the root position of the search round (a 64-bit position key)
+    with the task moves played on top of it, so a task message is only a few bytes long. Tasks of boards other than
+    the default one carry the board size.
     """
 
-    def __init__(self, worker: int, state: np.ndarray, moves: List[int], player: int):
-        self.player = player
+    def __init__(self, worker: int, root: int, moves: List[int], player: int, game_id: int = None,
+                 depth: int = None, round: int = None, window: Tuple[int, int] = None,
+                 size: Tuple[int, int, int] = None, slot: int = None):
+        self.player = player  # player who made the last task move
         self.moves = moves
         self.worker = worker
-        self.state = state
+        self.root = root  # position key of the root position
+        self.game_id = game_id  # game (session) the task belongs to
+        self.depth = depth  # max depth to compute on the worker (None -> worker default)
+        self.round = round  # search round (move) of the session the task belongs to
+        self.window = window  # (alpha, beta) window of windowed backends (None -> full search)
+        self.size = size  # board width, height and win count (None -> default board)
+        self.slot = slot  # index of the task's leaf in the score tree of its round (see ScoreTree)
+
+    def board(self) -> board.Board:
+        """
+        Board of the task position, replayed from the root position (boards of roots are cached).
+
+        :return: new board
+        """
+        b = root_board(self.root, self.size).copy()
+        player = self.player * (-1) ** (len(self.moves) - 1)  # player making the first move
+        for move in self.moves:
+            b.play(move, player)
+            player *= -1
+        return b
+
+    def __reduce__(self):
+        # pickle only the values (not attribute names) to keep task messages small
+        return Task, (self.worker, self.root, self.moves, self.player, self.game_id, self.depth, self.round,
+                      self.window, self.size, self.slot)
 
     def __repr__(self) -> str:
-        return f'Task(player: {self.player}, moves: {self.moves}, worker:{self.worker})'
+        return f'Task(game: {self.game_id}, player: {self.player}, moves: {self.moves}, worker:{self.worker})'
 
 
 class Result:
@@ -49,81 +101,388 @@ class Result:
     Computation result returned from the worker.
     """
 
-    def __init__(self, score: int, total: int, winner: bool, loser: bool, moves: List[int]):
+    def __init__(self, score: int, total: int, winner: bool, loser: bool, moves: List[int], worker: int = None,
+                 nodes: int = 0, seconds: float = 0.0, cache_hits: int = 0, max_depth: int = 0, game_id: int = None,
+                 round: int = None, history: np.ndarray = None, slot: int = None):
         self.score = score
         self.total = total
         self.winner = winner
         self.loser = loser
         self.moves = moves
+        self.game_id = game_id  # game (session) the task belonged to
+        self.round = round  # search round of the session the task belonged to
+        self.slot = slot  # slot of the task (see ScoreTree)
+        # search statistics of the worker
+        self.worker = worker  # worker rank
+        self.nodes = nodes  # nodes expanded
+        self.seconds = seconds  # wall time of the search
+        self.cache_hits = cache_hits
+        self.max_depth = max_depth  # maximum depth reached
+        self.history = history  # move ordering history gathered by the search (see ordering.MoveOrdering.merge)
 
     def __repr__(self) -> str:
-        return f'Result(score: {self.score}, winner: {self.winner}, loser: {self.loser}, move: {self.moves})'
+        return f'Result(game: {self.game_id}, score: {self.score}, winner: {self.winner}, loser: {self.loser}, move: {self.moves}, ' \
+               f'worker: {self.worker}, nodes: {self.nodes}, seconds: {self.seconds:.3f})'
 
 
+@profiling.hot
 def do_work(controller: controller.ComputerController, task: Task, max_depth: int) -> Result:
     """
     Does the computation work represented by the Task.
 
     :param controller: computer controller that will do the computation.
     :param task: task that has to be executed
-    :param max_depth: maximum score tree depth to be computed on the worker
+    :param max_depth: maximum score tree depth to be computed on the worker (unless the task defines its own)
     :return: computed result
     """
-    # compute for player -(-1)^(precomputed tree depth), compute max depth on the worker
-    node = controller.compute(-task.player * (-1) ** controller.precompute_depth, max_depth)
-    node.move = task.moves[-1]  # subtree root node move is last task move
-    return Result(node.score, node.total, node.winner, node.loser, task.moves)
+    if task.depth is not None:
+        max_depth = task.depth
+    start = time.perf_counter()
+    # search for player -(-1)^(precomputed tree depth), search max depth on the worker
+    player = -task.player * (-1) ** controller.precompute_depth
+    store = controller.store if task.window is None else None  # values searched with a window are only bounds
+    if store is not None:
+        key = controller.board.key()
+        stored = store.get(key, player, max_depth)
+        if stored is not None:  # computed in an earlier run (or by another worker)
+            return Result(*stored, task.moves, task.worker, 0, time.perf_counter() - start, 1, max_depth,
+                          task.game_id, task.round, slot=task.slot)
+    result = controller.search(player, max_depth, task.window)
+    if store is not None and result.depth == max_depth:  # don't store searches cut short by a budget
+        store.put(key, player, max_depth, result.score, result.total, result.winner, result.loser)
+    return Result(result.score, result.total, result.winner, result.loser, task.moves, task.worker, result.nodes,
+                  time.perf_counter() - start, result.cache_hits, result.depth, task.game_id, task.round,
+                  history_updates(controller), task.slot)
 
 
-class MasterController(controller.Controller):
+def history_updates(controller: controller.ComputerController) -> np.ndarray:
     """
-    Controller run on the master node.
-    It uses a computer controller to create a pre-computed tree, create tasks, send them to workers,
-    collect results and then compute the final score -> turning the pre-computed tree into a score tree.
+    Move ordering history a worker sends back with a result.
 
-    It's also possible to run work on the master node, but it's currently disabled because Pythons' GIL
-    slows communication with other nodes considerably.
+    :param controller: computer controller of the worker
+    :return: history gathered since the last result, None if it isn't shared
     """
+    if not controller.share_ordering or controller.backend.ordering is None:
+        return None
+    return controller.backend.ordering.take_updates()
 
-    def __init__(self, comm, num_of_processes, b: board.Board, ctl: controller.ComputerController):
-        super().__init__(b)
+
+def store_key(ctl: controller.ComputerController, task: Task) -> Tuple[int, int, int]:
+    """
+    Result store key of a task, the same one do_work uses on the worker.
+
+    :param ctl: computer controller of the session
+    :param task: task (with its depth set)
+    :return: position key, player making the move, search depth
+    """
+    return task.board().key(), -task.player * (-1) ** ctl.precompute_depth, task.depth
+
+
+class Scheduler:
+    """
+    Task scheduler run on the master node, shared by any number of game sessions.
+
+    It owns the communication with workers. There are no communication threads: a session waiting for results
+    drives a non-blocking progress loop (see receive) that probes for requests and results, hands out tasks of all
+    sessions to the workers waiting for one and delivers results to the sessions they belong to. With many sessions
+    on threads only one of them drives the loop at a time, the others wait for their results to be delivered.
+    Sessions with a higher priority are served first, sessions with the same priority are served round-robin
+    (fair share).
+
+    Sessions submit tasks as iterables that are consumed lazily, one task per requesting worker, so a generator can
+    create tasks while the first ones are already being computed.
+
+    Every dispatched task is leased to its worker until its result arrives. With a timeout, a worker that holds a
+    lease and sends nothing (no result, request or heartbeat, see Worker) for longer than the timeout is considered
+    lost: its tasks are dispatched again to the other workers, and a duplicate result that arrives later is dropped.
+    A lost worker that speaks up again is used again. Once all workers are lost, tasks are computed on the scheduler's
+    own process.
+    """
+    POLL_INTERVAL = 0.001  # longest pause (in seconds) of the progress loop when there are no messages
+
+    def __init__(self, comm, num_of_processes, workers: List[int] = None, timeout: float = None):
         self.comm = comm
         self.num_of_processes = num_of_processes
-        self.controller = ctl
-        self.controller.board = self.board
-
-        self._recv_thread = threading.Thread(target=self._recv_msg)
+        # ranks the scheduler hands out tasks to (all other ranks by default, sub-masters in a two-level topology)
+        self.workers = workers if workers is not None else list(range(1, num_of_processes + 1))
+        self.timeout = timeout  # seconds a worker holding a task may stay silent (None -> wait for it forever)
+        self.lost = set()  # workers that stopped responding
 
-        self._task_queue = queue.Queue()
-        self._request_queue = queue.Queue()
-        self._response_queue = queue.Queue()
+        self._condition = threading.Condition()  # guards sessions, pending tasks and idle workers
+        self._idle = collections.deque()  # ranks of workers waiting for a task
+        self._driving = False  # a session is running the progress loop
+        self._sessions: Dict[int, 'Session'] = {}  # game ID -> session
+        self._pending: Dict[int, collections.deque] = {}  # game ID -> task iterators waiting for a worker
+        self._game_ids = itertools.count()
+        self._last_game_id = -1  # game ID of the last served session (for round-robin)
+        # leases: (game ID, round, task moves) -> (worker, time the task was sent, task), until its result arrives
+        self._sent = {}
+        self._received = {}  # (game ID, round, task moves) -> (worker, time sent, time its result was received)
+        self._seen: Dict[int, float] = {}  # worker -> time of its last message
+        self._local: Dict[int, controller.ComputerController] = {}  # game ID -> controller computing tasks locally
+        self._totals = [0, 0]  # requests and results received
+        self._requests = []  # requests of sent messages that may not have completed yet (see _isend)
 
         self.stopped = False
 
-        self._recv_thread.start()
+    def register(self, session: 'Session') -> int:
+        """
+        Register a session.
+
+        :param session: game session
+        :return: game ID of the session
+        """
+        with self._condition:
+            game_id = next(self._game_ids)
+            self._sessions[game_id] = session
+            self._pending[game_id] = collections.deque()
+        return game_id
+
+    def unregister(self, session: 'Session'):
+        """
+        Remove a session (its pending tasks are dropped).
+
+        :param session: game session
+        :return:
+        """
+        with self._condition:
+            self._sessions.pop(session.game_id, None)
+            self._pending.pop(session.game_id, None)
+            self._local.pop(session.game_id, None)
+
+    def submit(self, session: 'Session', tasks: Iterable[Task]):
+        """
+        Queue tasks of a session for dispatching. Workers already waiting for a task get one right away.
+
+        :param session: game session
+        :param tasks: tasks to compute (e.g. a generator, it's consumed as workers ask for tasks)
+        :return:
+        """
+        with self._condition:
+            self._pending[session.game_id].append(iter(tasks))
+            self._dispatch()
+
+    def cancel(self, session: 'Session'):
+        """
+        Drop the tasks of a session that haven't been dispatched yet.
+
+        :param session: game session
+        :return:
+        """
+        with self._condition:
+            if session.game_id in self._pending:
+                self._pending[session.game_id].clear()
+
+    def _next_task(self) -> Task:
+        """
+        Choose the pending task to be dispatched next (called with the condition held).
+
+        :return: task (None if there are no pending tasks or the scheduler was stopped)
+        """
+        while not self.stopped:
+            waiting = [game_id for game_id, tasks in self._pending.items() if tasks]
+            if not waiting:
+                return None
+            priority = max(self._sessions[game_id].priority for game_id in waiting)
+            waiting = [game_id for game_id in waiting if self._sessions[game_id].priority == priority]
+            # round-robin: first session after the last served one
+            game_id = min(waiting, key=lambda t: (t <= self._last_game_id, t))
+            tasks = self._pending[game_id]
+            task = next(tasks[0], None)
+            if task is None:  # iterator exhausted
+                tasks.popleft()
+                continue
+            self._last_game_id = game_id
+            task.game_id = game_id
+            return task
+        return None
+
+    def _dispatch(self) -> bool:
+        """
+        Hand out pending tasks to the workers waiting for one (called with the condition held).
+
+        :return: whether any task was sent
+        """
+        sent = False
+        while self._idle:
+            task = self._next_task()
+            if task is None:
+                break
+            task.worker = self._idle.popleft()
+            self._sent[(task.game_id, task.round, tuple(task.moves))] = (task.worker, time.perf_counter(), task)
+            self._forward_task(task)
+            sent = True
+        return sent
+
+    def update_window(self, task: Task, window: Tuple[int, int]):
+        """
+        Narrow the window of a task: a task that wasn't dispatched yet is sent with it, a running one gets it as a
+        window update message.
 
-    def _recv_msg(self):
+        :param task: task of a windowed search
+        :param window: new (alpha, beta) window
+        :return:
         """
-        Receive messages and act accordingly to the tag.
+        key = (task.game_id, task.round, tuple(task.moves))
+        with self._condition:  # another session's thread may be driving the progress loop
+            task.window = window
+            sent = self._sent.get(key)
+            if sent is not None:  # still running
+                self._isend(Message(WINDOW_TAG, (key, window)), sent[0])
+
+    def _isend(self, message: Message, dest: int):
+        """
+        Send a message without waiting for it to be received. The request is kept until it completes: the progress
+        loop drops completed ones, done waits for the rest (except for the ones to lost workers).
+
+        :param message: message
+        :param dest: rank of the receiver
         :return:
         """
-        totals = [0, 0]
+        with self._condition:
+            self._requests.append((dest, self.comm.isend(message, dest=dest, tag=message.tag)))
+
+    def _progress(self) -> bool:
+        """
+        One pass of the progress loop: receive all messages that have arrived, act accordingly to their tags and
+        dispatch tasks to the workers that asked for one.
+
+        :return: whether anything was received or sent
+        """
+        messages = []
         while True:
-            msg: Message = self.comm.recv()  # receive any message tag
-            common.log(f'got message {msg}')
-            if msg.tag == DONE_TAG:
-                common.log('detected done - exiting')
-                return
-            elif msg.tag == REQUEST_TAG:
-                totals[0] += 1
-                common.log(f'got request from {msg.value} {totals[0]}')
-                self._request_queue.put(msg.value)
-            elif msg.tag == RESULT_TAG:
-                totals[1] += 1
-                common.log(f'received result ({totals[1]})')
-                self._return_response(msg.value)
+            probe = self.comm.improbe()  # matched probe, the message can't be taken by another receive
+            if probe is None:
+                break
+            messages.append(probe.recv())
+        now = time.perf_counter()
+        with self._condition:
+            for msg in messages:
+                common.log(f'got message {msg}')
+                if msg.tag == REQUEST_TAG:
+                    self._totals[0] += 1
+                    common.log(f'got request from {msg.value} {self._totals[0]}')
+                    self._heard(msg.value, now)
+                    self._idle.append(msg.value)
+                elif msg.tag == RESULT_TAG:
+                    self._totals[1] += 1
+                    common.log(f'received result ({self._totals[1]})')
+                    self._heard(msg.value.worker, now)
+                    self._return_response(msg.value)
+                elif msg.tag == HEARTBEAT_TAG:
+                    self._heard(msg.value, now)
+                else:
+                    raise Exception(msg)
+            expired = self.timeout is not None and self._expire(now)
+            sent = self._dispatch()
+            self._requests = [(dest, request) for dest, request in self._requests if not request.Test()]
+            # nobody left to compute the tasks -> compute one of them here
+            task = self._next_task() if self.workers and self.lost.issuperset(self.workers) else None
+            if task is not None:
+                local = self._local_controller(task.game_id)
+            if messages or expired or sent:
+                self._condition.notify_all()  # results (or store hits of generated tasks) may have been delivered
+        if task is not None:
+            task.worker = self.comm.Get_rank()  # timed like a task of a worker
+            started = time.perf_counter()
+            local.board = task.board()
+            result = do_work(local, task, local.max_depth - local.precompute_depth)
+            with self._condition:
+                self._received[(task.game_id, task.round, tuple(task.moves))] = (task.worker, started,
+                                                                                  time.perf_counter())
+                session = self._sessions.get(result.game_id)
+                if session is not None:
+                    session.deliver(result)
+                self._condition.notify_all()
+        return bool(messages) or expired or sent or task is not None
+
+    def _heard(self, worker: int, now: float):
+        """
+        Note a message from a worker (called with the condition held).
+
+        :param worker: worker rank
+        :param now: time the message was received
+        :return:
+        """
+        self._seen[worker] = now
+        if worker in self.lost:
+            self.lost.discard(worker)
+            print(f'worker {worker} is responding again', file=sys.stderr)
+
+    def _expire(self, now: float) -> bool:
+        """
+        Find workers whose leases timed out and dispatch their tasks again (called with the condition held).
+
+        :param now: current time
+        :return: whether any worker was lost
+        """
+        lost = {worker for worker, sent_at, task in self._sent.values()
+                if now - max(sent_at, self._seen.get(worker, sent_at)) > self.timeout}
+        for worker in lost:
+            print(f'worker {worker} did not respond for {self.timeout} s, its tasks go to other workers',
+                  file=sys.stderr)
+            self.lost.add(worker)
+            for key, (leased_to, sent_at, task) in list(self._sent.items()):
+                if leased_to != worker:
+                    continue
+                del self._sent[key]
+                session = self._sessions.get(task.game_id)
+                if session is not None and task.round == session.round:  # tasks of finished rounds aren't needed
+                    task.worker = None
+                    self._pending[task.game_id].appendleft(iter([task]))
+        return bool(lost)
+
+    def _local_controller(self, game_id: int) -> controller.ComputerController:
+        """
+        Controller computing the tasks of a session on the scheduler's process (called with the condition held).
+
+        :param game_id: game ID of the session
+        :return: computer controller with the settings of the session's controller
+        """
+        if game_id not in self._local:
+            ctl = self._sessions[game_id].controller
+            self._local[game_id] = controller.ComputerController(
+                None, ctl.max_depth, ctl.precompute_depth, ctl.backend.name, verbose=False,
+                node_budget=ctl.tree_search.node_budget, streaming=ctl.tree_search.streaming,
+                share_ordering=ctl.share_ordering)
+        return self._local[game_id]
+
+    def receive(self, session: 'Session'):
+        """
+        Wait for the next response of a session, running the progress loop if no other session is running it.
+
+        :param session: game session
+        :return: computation result, or (round, number of results to expect) once all tasks of a round are generated
+        """
+        while True:
+            with self._condition:
+                if session.has_responses():
+                    return session.next_response()
+                if self._driving:  # woken up when responses are delivered or the loop is free
+                    self._condition.wait(Scheduler.POLL_INTERVAL)
+                    continue
+                self._driving = True
+            try:
+                self._drive(session.has_responses)
+            finally:
+                with self._condition:
+                    self._driving = False
+                    self._condition.notify_all()
+
+    def _drive(self, finished: Callable[[], bool]):
+        """
+        Run the progress loop until a condition holds, backing off while there is nothing to do.
+
+        :param finished: condition
+        :return:
+        """
+        pause = 0.0
+        while not finished():
+            if self._progress():
+                pause = 0.0
             else:
-                raise Exception(msg)
+                time.sleep(pause)
+                pause = min(2 * pause or 1e-5, Scheduler.POLL_INTERVAL)
 
     def _forward_task(self, task: Task):
         """
@@ -132,126 +491,629 @@ class MasterController(controller.Controller):
         :param task: task to execute on the worker
         :return:
         """
-        self.comm.isend(Message(TASK_TAG, task), dest=task.worker, tag=TASK_TAG)
+        self._isend(Message(TASK_TAG, task), task.worker)
         common.log(f'sent task to {task.worker}')
 
     def _return_response(self, result: Result):
         """
-        Put Result in response queue.
+        Deliver a Result to the session it belongs to (called with the condition held).
+        :param result: received computation result
+        :return:
+        """
+        key = (result.game_id, result.round, tuple(result.moves))
+        lease = self._sent.pop(key, None)
+        if lease is None:  # the task was dispatched again and its result has already arrived
+            common.log(f'dropped duplicate result {result}')
+            return
+        self._received[key] = (result.worker, lease[1], time.perf_counter())
+        session = self._sessions.get(result.game_id)
+        if session is None:  # session was closed in the meantime
+            return
+        session.deliver(result)
+
+    def timings(self, result: Result) -> Tuple[int, float, float]:
+        """
+        Pop the dispatch timings of a task whose result has been received.
+
         :param result: received computation result
+        :return: worker, time the task was sent, time its result was received
+        """
+        return self._received.pop((result.game_id, result.round, tuple(result.moves)))
+
+    def new_game(self, max_depth: int):
+        """
+        Tell all workers that a new game starts (warm workers keep running between games, see Worker.new_game).
+
+        The new depth and the cleared move ordering apply to every task a worker gets afterwards, so the workers can't
+        be shared with the games of other sessions. Lost workers are not waited for, they get the message if they ever
+        respond again.
+
+        :param max_depth: maximum search depth of the new game
         :return:
         """
-        self._response_queue.put(result, block=False)
+        with self._condition:
+            assert len(self._sessions) == 1, 'a new game on warm workers needs a single registered session'
+            lost = set(self.lost)
+        for i in self.workers:
+            if i in lost:
+                self._isend(Message(NEW_GAME_TAG, max_depth), i)
+            else:  # a small message, workers wait for it between their tasks
+                self.comm.send(Message(NEW_GAME_TAG, max_depth), dest=i, tag=NEW_GAME_TAG)
 
-    def _work(self):
+    def done(self):
         """
-        Do the work on the master node.
-        Not recommended for usage.
+        Stop all workers.
+
+        Every worker asks for a new task once it's done with the last one, so the progress loop runs until all of
+        them are waiting for a task: then none of their requests and results is left unreceived. Lost workers are not
+        waited for, they stop if they ever get to the message.
         :return:
         """
-        while True:
-            task: Task = self._task_queue.get()
-            # common.log(f'got task {task}')
-            b = board.Board(task.state)
-            self.controller.board = b
-            response = do_work(self.controller, task, self.controller.max_depth - self.controller.precompute_depth)
-            # common.log(f'putting response {response} to queue')
-            self._response_queue.put(response)
+        with self._condition:
+            self.stopped = True
+        self._drive(lambda: self.lost.union(self._idle).issuperset(self.workers))
+        for i in self.workers:
+            if i in self.lost:
+                self._isend(Message(DONE_TAG, True), i)
+            else:  # a small message and the worker is waiting for it
+                self.comm.send(Message(DONE_TAG, True), dest=i, tag=DONE_TAG)
+        for dest, request in self._requests:
+            if dest not in self.lost:
+                request.Wait()
+        self._requests.clear()
 
-    @staticmethod
-    def _create_tasks(root: tree.Node, max_depth=2) -> List[Task]:
+
+class ScoreTree:
+    """
+    Pre-computed tree of a search round, scored incrementally as results arrive.
+
+    Every task gets a slot - the index of its leaf node in leaves - and a result is written straight into the node of
+    its slot. Only the nodes above it are rescored, the same way search.TreeSearch scores a pre-computed tree: nodes
+    above the pre-computed depth that aren't finished games sum up the (score, total) pairs of their children, and
+    are winners (losers) when all their children are, unless a child already won (lost) the game for them.
+    """
+
+    def __init__(self, b: board.Board, player: int, depth: int):
+        """
+        :param b: board
+        :param player: current player
+        :param depth: pre-computed depth
+        """
+        # the root of the pre-computed tree, its children are created by the task generator
+        self.root = search.TreeSearch.create_tree(b.copy(), player, 0)
+        self.player = player
+        self.win_count = b.win_count
+        self.depth = depth
+        self.leaves: List[tree.Node] = []  # slot -> node the task of that slot computes
+        self._flags: Dict[tree.Node, Tuple[bool, bool]] = {}  # scored node -> its winner/loser flags before scoring
+
+    def apply(self, result: Result):
+        """
+        Apply a computation result to the node it was computed for and rescore the nodes above it.
+
+        :param result: computation result
+        :return:
+        """
+        node = self.leaves[result.slot]
+        node.winner = result.winner
+        node.loser = result.loser
+        node.score = result.score
+        node.total = result.total
+        path = []  # the node and its ancestors, up to the root
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        for i, node in enumerate(path):
+            depth = len(path) - 1 - i
+            # only nodes the scoring recursion reaches: above the pre-computed depth, below no finished game
+            if depth < self.depth and all(abs(parent.status) != board.Board.WIN for parent in path[i:-1]):
+                self._score(node)
+
+    def _score(self, node: tree.Node):
         """
-        Create tasks from the pre-computed tree.
+        Score a node from its children (see search.TreeSearch._score_node).
 
-        :param root: root node of the tree
-        :param max_depth: maximum pre-compute depth (in case we have a deeper tree)
-        :return: list of tasks
+        :param node: tree node
+        :return:
         """
+        if node not in self._flags:
+            self._flags[node] = (node.winner, node.loser)
+        winner, loser = self._flags[node]
+        if not (winner or loser):  # if not directly a winner or a loser (child not a winner or loser)
+            node.winner = all(child.winner for child in node.children)
+            node.loser = all(child.loser and not child.winner for child in node.children)
+        if node.children:
+            node.score = sum(child.score for child in node.children)
+            node.total = sum(child.total for child in node.children)
 
-        def recurse(existing_moves: List[int], move: int, depth: int, node: tree.Node) -> List[Task]:
-            result = []
-            if node.winner or node.loser:
-                return result
-            if move is not None:
-                existing_moves.append(move)
+    def _expand(self, node: tree.Node):
+        """
+        Create the children of a node the task generator left unexpanded (see search.TreeSearch._tree).
+
+        :param node: tree node
+        :return:
+        """
+        node_board = board.Board(np.copy(node.state), win_count=self.win_count)
+        for move in node_board.valid_moves:
+            search.TreeSearch.play_node(self.player, node_board.copy(), move, node.player * -1, node)
+
+    def finish(self) -> search.SearchResult:
+        """
+        Score the nodes no result has reached and the ones above them. Children of a winning or losing node get no
+        tasks, they are expanded and scored here. The rest of the tree is up to date already.
+
+        :return: scores of the root and its children
+        """
+
+        def recurse(node: tree.Node, depth: int) -> bool:
+            changed = False
+            if not node.children and node not in self._flags:
+                self._expand(node)
             for child in node.children:
-                m = child.move
+                if depth + 1 < self.depth and abs(child.status) != board.Board.WIN:
+                    changed |= recurse(child, depth + 1)
+            if changed or node not in self._flags:
+                self._score(node)
+                return True
+            return False
+
+        recurse(self.root, 0)
+        return search.SearchResult.from_node(self.root, self.depth)
+
+
+class Session(controller.Controller):
+    """
+    A single game served by a (shared) scheduler.
+    It uses a computer controller to create a pre-computed tree, create tasks, submit them to the scheduler,
+    collect results and then compute the final score -> turning the pre-computed tree into a score tree.
+
+    The pre-computed tree and its tasks are generated lazily, as workers ask for tasks, and results are applied to the
+    tree as they arrive. Subclasses can override early_exit to stop waiting for the remaining results.
+
+    Windowed backends (alpha-beta, see search.AlphaBetaSearch) don't use the pre-computed tree, their searches are
+    split by principal variation instead (see _split_search).
+    """
+
+    def __init__(self, scheduler: Scheduler, b: board.Board, ctl: controller.ComputerController, priority=0):
+        super().__init__(b)
+        self.scheduler = scheduler
+        self.controller = ctl
+        self.controller.board = self.board
+        # workers search for the player making the first move of a task (see do_work), which is the player of the
+        # pre-computed tree only after an even number of moves
+        assert ctl.precompute_depth % 2 == 0, 'pre-compute depth has to be even'
+        self.priority = priority  # sessions with a higher priority get their tasks dispatched first
+        self.round = 0  # number of searches (moves) so far, results of earlier rounds are ignored
+
+        # results, and (round, number of results to expect) once all tasks of a round are generated
+        # (filled by the scheduler, see Scheduler.receive)
+        self._responses = collections.deque()
+
+        self.metrics = measure.Metrics()  # measurements of every move
+        self.game_id = scheduler.register(self)
+
+    @staticmethod
+    def _generate_tasks(b: board.Board, root: tree.Node, player: int, max_depth=2, exhaustive=False,
+                        leaves: List[tree.Node] = None) -> Iterator[Task]:
+        """
+        Generate the pre-computed tree and its tasks (1 task for 1 leaf node) lazily, depth-first.
+
+        Children of a node are created just before its subtree is visited, so the first task is ready after at most
+        max_depth * branching played moves. Nodes with a winning or losing child don't get tasks, unless the
+        generation is exhaustive: then every leaf that isn't a finished game gets a task, so the scored tree is exactly
+        the same as a single search of the whole depth.
+
+        :param b: board
+        :param root: root node of the tree (without children), it's expanded while tasks are generated
+        :param player: current player
+        :param max_depth: maximum pre-compute depth
+        :param exhaustive: create tasks for subtrees of winning and losing nodes too
+        :param leaves: optional list the node of every task is appended to, task.slot is set to its index
+                       (see ScoreTree)
+        :return: iterator of tasks
+        """
+
+        root_key = b.key()
+        size = b.size if b.size != board.Board.DEFAULT_SIZE else None
+
+        def task(moves: List[int], node: tree.Node) -> Task:
+            slot = None
+            if leaves is not None:
+                slot = len(leaves)
+                leaves.append(node)
+            return Task(None, root_key, moves, node.player, size=size, slot=slot)
+
+        def recurse(moves: List[int], depth: int, node: tree.Node, node_board: board.Board,
+                    current_player: int) -> Iterator[Task]:
+            boards = []
+            for move in node_board.valid_moves:  # create the children first, they decide whether this node wins
+                boards.append(node_board.copy())
+                search.TreeSearch.play_node(player, boards[-1], move, current_player, node)
+            if (node.winner or node.loser) and not exhaustive:
+                return
+            if not node.children:
+                if not exhaustive:  # a full board keeps the score it was created with
+                    yield task(moves, node)
+                return
+            for child, child_board in zip(node.children, boards):
+                if abs(child.status) == board.Board.WIN:  # finished game (only reached in exhaustive generation)
+                    continue
                 if depth < max_depth:
-                    result += recurse(existing_moves.copy(), m, depth + 1, child)
+                    yield from recurse(moves + [child.move], depth + 1, child, child_board, current_player * -1)
                 else:
-                    result.append(Task(None, child.state, existing_moves.copy() + [m], child.player))
-            if not node.children:
-                return [Task(None, node.state, existing_moves.copy(), node.player)]
-            return result
+                    yield task(moves + [child.move], child)
 
-        return recurse([], None, 1, root)
+        return recurse([], 1, root, b.copy(), player)
+
+    def _tasks(self, scores: ScoreTree, player: int, search_round: int, issued: List[Task],
+               metrics: measure.MoveMetrics, exhaustive=False) -> Iterator[Task]:
+        """
+        Tasks of a search round, consumed by the scheduler as workers ask for tasks.
+
+        Tasks whose results are in the result store are not dispatched, their results go straight to the session's
+        responses. Once all tasks are generated, (round, number of results to expect) is added to the responses.
+
+        :param scores: score tree of the search round (its root has no children yet)
+        :param player: current player
+        :param search_round: search round the tasks belong to
+        :param issued: list the generated tasks are recorded in (by their slots)
+        :param metrics: measurements of the current move
+        :param exhaustive: exhaustive task generation (see _generate_tasks)
+        :return: iterator of tasks
+        """
+        store = self.controller.store
+        count = 0
+        started = time.perf_counter()
+        for task in self._generate_tasks(self.board, scores.root, player, max_depth=self.controller.precompute_depth,
+                                         exhaustive=exhaustive, leaves=scores.leaves):
+            # workers search as deep as this session's controller wants
+            task.depth = self.controller.max_depth - self.controller.precompute_depth
+            task.round = search_round
+            issued.append(task)
+            count += 1
+            metrics.tasks = count
+            stored = store.get(*store_key(self.controller, task)) if store is not None else None
+            if stored is not None:  # results stored in earlier runs don't have to be computed again
+                self._responses.append(Result(*stored, task.moves, game_id=self.game_id, round=search_round,
+                                              slot=task.slot))
+                continue
+            metrics.precompute += time.perf_counter() - started
+            yield task
+            started = time.perf_counter()
+        metrics.precompute += time.perf_counter() - started
+        self._responses.append((search_round, count))
+
+    def early_exit(self, root: tree.Node, result: Result) -> bool:
+        """
+        Hook called after every result is applied to the pre-computed tree. Returning True stops the search round:
+        tasks that weren't dispatched yet are dropped, results still being computed are ignored and the move is
+        selected from the tree as it is.
+
+        :param root: root node of the pre-computed tree
+        :param result: the result that was just applied
+        :return: whether to stop waiting for the remaining results
+        """
+        return False
 
-    @measure.log
     def play(self, player: int) -> int:
         """
         Selects an optimal move based on the board state and the current player ID.
 
-        It creates a pre-computed tree on the master, then creates tasks based on that tree.
-        Each task is actually a leaf node in the pre-computed tree.
-        Afterwards it sends tasks to workers and applies results (scores) to the pre-computed tree created before,
-        effectively creating a score tree.
-        Finally, it chooses the optimal move for the board state based on the score tree.
+        It submits a generator to the scheduler that creates a pre-computed tree (of the controller's pre-compute
+        depth) and its tasks while workers ask for them. Each task is actually a leaf node in the pre-computed tree.
+        Results (scores) are applied to the pre-computed tree as they arrive, effectively creating a score tree
+        (see ScoreTree). Once the last one arrives, it chooses the optimal move for the board state from the score
+        tree.
 
         :param player: current player ID
         :return: optimal move
         """
-        # create a pre-computed tree of depth 2
-        root = self.controller.create_tree(self.board.copy(), player, 2)
-        # common.log(f'created root {root.tree()}')
-        # create tasks from the pre-computed tree (1 task for 1 leaf node)
-        tasks = self._create_tasks(root, max_depth=2)
-        num_of_tasks = len(tasks)
+        metrics = self.metrics.start(player)
+        start = time.perf_counter()
+        if self.controller.backend.windowed:
+            result = self._split_search(player, self.controller.max_depth, metrics)
+        else:
+            result = self._search(player, metrics)
+        self.controller.print_scores(result)
+        move = result.best_move
+        metrics.total = time.perf_counter() - start
+        metrics.finish(self.scheduler.workers)
+        return move
+
+    def _search(self, player: int, metrics: measure.MoveMetrics, exhaustive=False) -> search.SearchResult:
+        """
+        Compute the pre-computed tree of the current board state on the workers and score it.
+
+        :param player: current player ID
+        :param metrics: measurements of the current move
+        :param exhaustive: exhaustive task generation (see _generate_tasks)
+        :return: scores for the board state and every valid move
+        """
+        self.round += 1
+        scores = ScoreTree(self.board, player, self.controller.precompute_depth)
+        store = self.controller.store
+        if store is not None:
+            store.refresh()
+        issued: List[Task] = []
 
         # send out tasks
-        for task in tasks:
-            worker = self._request_queue.get()
-            task.worker = worker
-            self._forward_task(task)
-            # common.log(f'task put on queue: {task}')
+        submitted = time.perf_counter()
+        self.scheduler.submit(self, self._tasks(scores, player, self.round, issued, metrics, exhaustive))
 
         # update pre-computed tree from results
-        for i in range(num_of_tasks):
-            result = self._response_queue.get()
-            root_node = root.get_move(*result.moves)
-            root_node.winner = result.winner
-            root_node.loser = result.loser
-            root_node.score = result.score
-            root_node.total = result.total
-
-        # set controller max depth to be pre-compute depth
-        # (because we want to score only the existing nodes, not generate new ones)
-        max_depth = self.controller.max_depth
-        self.controller.max_depth = self.controller.precompute_depth
-        # compute the optimal move based on the pre-computed tree
-        result = self.controller.play(player, root)
-        # revert controller max depth
-        self.controller.max_depth = max_depth
+        results = {}
+        expected = None  # number of results, known once all tasks are generated
+        while expected is None or len(results) < expected:
+            result = self.scheduler.receive(self)
+            if isinstance(result, tuple):  # all tasks generated
+                search_round, count = result
+                if search_round == self.round:
+                    expected = count
+                continue
+            if result.round != self.round:  # left over from a round that exited early
+                if result.worker is not None:
+                    self.scheduler.timings(result)
+                continue
+            if result.worker is not None:  # computed by a worker (not found in the result store)
+                self._record(result, submitted, metrics)
+            else:
+                metrics.cache_hits += 1
+            scores.apply(result)
+            results[result.slot] = result
+            if self.early_exit(scores.root, result):
+                self.scheduler.cancel(self)
+                break
+        metrics.result_wait = time.perf_counter() - submitted
+        scoring_start = time.perf_counter()
+        scored = scores.finish()
+        metrics.scoring = time.perf_counter() - scoring_start
+        if store is not None:
+            store.refresh()  # workers sharing the store file have stored their results already
+            for slot, result in results.items():
+                task = issued[slot]
+                if result.worker is not None and result.max_depth == task.depth:
+                    store.put(*store_key(self.controller, task), result.score, result.total, result.winner,
+                              result.loser)
+        return scored
+
+    def _record(self, result: Result, submitted: float, metrics: measure.MoveMetrics):
+        """
+        Add a result computed by a worker to the measurements of the current move.
+
+        :param result: computation result
+        :param submitted: time the tasks were submitted
+        :param metrics: measurements of the current move
+        :return:
+        """
+        worker, sent_at, received_at = self.scheduler.timings(result)
+        metrics.dispatch_latency += sent_at - submitted
+        metrics.task_done(worker, received_at - sent_at)
+        metrics.add_result(result)
+        if result.history is not None and self.controller.backend.ordering is not None:
+            self.controller.backend.ordering.merge(result.history)
+
+    def _split_search(self, player: int, depth: int, metrics: measure.MoveMetrics,
+                      window: Tuple[int, int] = None) -> search.SearchResult:
+        """
+        Alpha-beta search of the current board state split by principal variation (see _split). The principal
+        variation is split recursively down to the pre-computed depth of the controller, like the pre-computed tree
+        of the tree search. Moves are ordered by the controller's move ordering (with history merged from workers, see
+        ComputerController.share_ordering).
+
+        :param player: current player ID
+        :param depth: search depth
+        :param metrics: measurements of the current move
+        :param window: optional (alpha, beta) window of the current board state
+        :return: value of the board state and of every move (values of moves other than the best one are bounds)
+        """
+        inf = search.AlphaBetaSearch.INF
+        self.round += 1
+        if self.controller.backend.ordering is not None:
+            self.controller.backend.ordering.age()
+        submitted = time.perf_counter()
+        result = self._split(self.board, [], player, depth, window if window is not None else (-inf, inf),
+                             submitted, metrics)
+        metrics.result_wait = time.perf_counter() - submitted
         return result
 
+    def _split(self, b: board.Board, path: List[int], player: int, depth: int, window: Tuple[int, int],
+               submitted: float, metrics: measure.MoveMetrics) -> search.SearchResult:
+        """
+        Principal variation split of the position after path: the first move is searched on its own - split again
+        by this method while the position is above the pre-computed depth, on a worker below it - then the other
+        moves are searched on workers in parallel with the window it set. Every result that improves on the best move
+        narrows the window, running tasks get it as a window update.
+
+        The window of a move only lets through values that would become the new best move: better than the best one
+        so far, or as good as it for moves before it (the first best move in search order wins, as in a serial
+        search). A value outside of it is only a bound, but it's never needed exactly.
+
+        :param b: board of the position
+        :param path: moves from the session board to the position
+        :param player: player making the move in the position
+        :param depth: search depth
+        :param window: (alpha, beta) window of the position
+        :param submitted: time the search started
+        :param metrics: measurements of the current move
+        :return: value of the position and of every move (values of moves other than the best one are bounds)
+        """
+        inf, win_score = search.AlphaBetaSearch.INF, search.AlphaBetaSearch.WIN_SCORE
+        alpha, beta = window
+        ordering = self.controller.backend.ordering
+        moves = ordering.order(b, player, len(path)) if ordering is not None else b.valid_moves
+        wins = [move for move in moves if b.copy().play(move, player) == board.Board.WIN]
+        if wins:  # nothing is better than winning right away
+            value = win_score + depth
+            return search.SearchResult(value, 1, True, False, None, depth,
+                                       [search.SearchResult(value, 1, True, False, wins[0], depth - 1)])
+        if not moves and path:  # full board below the session board
+            return search.SearchResult(0, 1, False, False, None, depth)
+        if depth <= 1 or not moves:  # nothing to split
+            return self.controller.search(player, depth, window)
+
+        root = self.board.key()
+        size = self.board.size if self.board.size != board.Board.DEFAULT_SIZE else None
+        tasks = [Task(None, root, path + [move], player, depth=depth - 1, round=self.round, size=size)
+                 for move in moves]
+        index = {tuple(task.moves): i for i, task in enumerate(tasks)}
+        values = {}  # move index -> value for the current player
+        best, best_index = -inf, None  # best exact value and its move
+        # split the first move again if its position is above the pre-computed depth and deep enough to be worth it
+        recursive = len(path) + 1 < self.controller.precompute_depth and depth > 2
+
+        def child_window(i: int) -> Tuple[int, int]:
+            bound = max(alpha, best) - (1 if best_index is not None and i < best_index else 0)
+            return -beta, -bound  # window of the position after the move, for the other player
+
+        def siblings() -> Iterator[Task]:
+            for i in range(1, len(tasks)):
+                tasks[i].window = child_window(i)  # the newest window at the time the task is dispatched
+                yield tasks[i]
+
+        def record(i: int, score) -> bool:
+            """
+            Record the value of a move.
+
+            :param i: move index
+            :param score: value of the position after the move, for the other player
+            :return: whether the position fails high (the other moves don't matter)
+            """
+            nonlocal best, best_index
+            values[i] = -score
+            low, high = child_window(i)
+            if score <= low:  # fail high
+                best, best_index = values[i], i
+                return True
+            if score < high:  # new best move
+                best, best_index = values[i], i
+                for j, task in enumerate(tasks):
+                    if j not in values and j > 0:
+                        self.scheduler.update_window(task, child_window(j))
+            return False
+
+        metrics.tasks += len(tasks) - recursive
+        tasks[0].window = child_window(0)
+        if recursive:  # principal variation first
+            child = b.copy()
+            child.play(moves[0], player)
+            cutoff = record(0, self._split(child, tasks[0].moves, -player, depth - 1, tasks[0].window, submitted,
+                                           metrics).score)
+            if not cutoff:
+                self.scheduler.submit(self, siblings())
+        else:
+            cutoff = False
+            self.scheduler.submit(self, tasks[:1])
+        while not cutoff and len(values) < len(tasks):
+            result = self.scheduler.receive(self)
+            # left over from an earlier round, or from a deeper split that failed high
+            if isinstance(result, tuple) or result.round != self.round or tuple(result.moves) not in index:
+                if not isinstance(result, tuple) and result.worker is not None:
+                    self.scheduler.timings(result)
+                continue
+            self._record(result, submitted, metrics)
+            i = index[tuple(result.moves)]
+            cutoff = record(i, result.score)
+            if cutoff:
+                self.scheduler.cancel(self)
+            elif i == 0:
+                self.scheduler.submit(self, siblings())
+
+        value = max(values.values())
+        children = [search.SearchResult(values[i], 1, values[i] >= win_score, values[i] <= -win_score, moves[i],
+                                        depth - 1) for i in sorted(values, key=lambda t: moves[t])]
+        return search.SearchResult(value, 1, value >= win_score, value <= -win_score, None, depth, children,
+                                   metrics.nodes, best=moves[best_index] if best_index is not None else None)
+
+    def deliver(self, result: Result):
+        """
+        Hand over the result of one of the session's tasks (called by the scheduler).
+
+        :param result: computation result
+        :return:
+        """
+        self._responses.append(result)
+
+    def has_responses(self) -> bool:
+        """
+        Whether responses were delivered that the session hasn't taken yet (called by the scheduler).
+
+        :return: whether there are responses
+        """
+        return bool(self._responses)
+
+    def next_response(self):
+        """
+        Take the oldest delivered response (called by the scheduler).
+
+        :return: computation result, or (round, number of results to expect)
+        """
+        return self._responses.popleft()
+
+    def new_game(self, b: board.Board):
+        """
+        Start a new game on the same scheduler and workers: workers drop the state of the last game instead of
+        being started again.
+
+        :param b: board of the new game
+        :return:
+        """
+        self.board = b
+        self.controller.board = b
+        if self.controller.backend.ordering is not None:
+            self.controller.backend.ordering.clear()
+        self.scheduler.new_game(self.controller.max_depth)
+
+    def close(self):
+        """
+        Unregister the session from the scheduler (the game is over).
+        :return:
+        """
+        self.scheduler.unregister(self)
+
+
+class MasterController(Session):
+    """
+    Controller run on the master node, serving a single game with its own scheduler.
+
+    All communication with the workers runs in the scheduler's progress loop on the game thread, so requests and
+    results don't have to cross threads (see Scheduler).
+    """
+
+    def __init__(self, comm, num_of_processes, b: board.Board, ctl: controller.ComputerController,
+                 workers: List[int] = None, timeout: float = None):
+        super().__init__(Scheduler(comm, num_of_processes, workers, timeout), b, ctl)
+        self.comm = comm
+        self.num_of_processes = num_of_processes
+
+    @measure.log
+    def play(self, player: int) -> int:
+        return super().play(player)
+
     def done(self):
         """
         Stop all local threads and workers.
         :return:
         """
-        self.stopped = True
-        for i in range(0, self.num_of_processes + 1):  # send to every node including ourselves
-            self.comm.send(Message(DONE_TAG, True), dest=i, tag=DONE_TAG)
+        self.scheduler.done()
 
 
 class Worker:
     """
     Worker node object
+
+    While it computes a task, it sends heartbeats to the master every HEARTBEAT_INTERVAL seconds, as long as the
+    computation makes progress (see Scheduler.timeout). Heartbeats are sent from a thread while the main thread
+    computes or receives, so they need MPI_THREAD_MULTIPLE (the level mpi4py asks for). Without it no heartbeats are
+    sent, and the scheduler timeout has to be longer than any task.
     """
+    HEARTBEAT_INTERVAL = 1.0  # seconds between heartbeats
 
     def __init__(self, rank: int, comm, ctl: controller.ComputerController):
         self.rank = rank
         self.comm = comm
         self.controller = ctl
+        self._working = False  # a task is being computed
+        self._stopped = threading.Event()  # stops the heartbeat thread
 
     def run(self):
         """
@@ -259,42 +1121,285 @@ class Worker:
         Sends requests for tasks, receives tasks, computes a sub tree for each task and returns the result to the master.
         :return:
         """
+        from mpi4py import MPI
+
+        heartbeat = None
+        if MPI.Query_thread() == MPI.THREAD_MULTIPLE:
+            heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+            heartbeat.start()
+        else:
+            common.log('MPI is not thread safe, no heartbeats are sent')
+        requests = []  # sends that haven't completed yet
         while True:
+            requests = [request for request in requests if not request.Test()]
             request = Message(REQUEST_TAG, self.rank)
             # send a request
-            self.comm.isend(request, dest=0, tag=REQUEST_TAG)
+            requests.append(self.comm.isend(request, dest=0, tag=REQUEST_TAG))
             common.log('sent request')
 
             # receive a task (or DONE event)
             message: Message = self.comm.recv(source=0)
+            while message.tag in (WINDOW_TAG, NEW_GAME_TAG):
+                if message.tag == NEW_GAME_TAG:
+                    self.new_game(message.value)
+                # else window update that arrived after its task was done
+                message = self.comm.recv(source=0)
 
             if message.tag == DONE_TAG:  # exit if DONE event
+                for request in requests:
+                    request.Wait()
                 common.log('exiting')
+                self._stopped.set()
+                if heartbeat is not None:
+                    heartbeat.join()
                 return
 
             # do the computation
-            result, state = self._work(message.value)
+            self._working = True
+            result = self._work(message.value)
+            self._working = False
             # send the result
-            self.comm.isend(Message(RESULT_TAG, result), dest=0, tag=RESULT_TAG)
+            requests.append(self.comm.isend(Message(RESULT_TAG, result), dest=0, tag=RESULT_TAG))
             common.log('sent result')
             # free up memory
-            del state
             del result
 
-    def _work(self, task: Task):
+    def _heartbeat(self):
+        """
+        Send heartbeats while a task is being computed and the computation makes progress (runs on its own thread).
+        :return:
+        """
+        requests = []  # heartbeats still being sent
+        last = None
+        while not self._stopped.wait(Worker.HEARTBEAT_INTERVAL):
+            requests = [request for request in requests if not request.Test()]
+            mark = self._progress_mark()
+            if self._working and (mark is None or mark != last):
+                requests.append(self.comm.isend(Message(HEARTBEAT_TAG, self.rank), dest=0, tag=HEARTBEAT_TAG))
+            last = mark
+        for request in requests:
+            request.Wait()
+
+    def _progress_mark(self):
+        """
+        Progress of the computation, a heartbeat is sent only if it changed since the last one.
+
+        :return: number of nodes searched by this process (None if progress can't be told, heartbeats are always sent)
+        """
+        return search.TreeSearch.nodes + search.AlphaBetaSearch.nodes
+
+    def new_game(self, max_depth: int):
+        """
+        Prepare for a new game: the process, its imports and lookup tables stay warm, only the state of the last
+        game is dropped.
+
+        :param max_depth: maximum search depth of the new game
+        :return:
+        """
+        common.log(f'new game with depth {max_depth}')
+        self.controller.max_depth = max_depth
+        if self.controller.backend.ordering is not None:
+            self.controller.backend.ordering.clear()
+
+    def _work(self, task: Task) -> Result:
         """
-        Does the actual work: updates the controller board from the task state and calls do_work.
+        Does the actual work: updates the controller board from the task position and calls do_work.
         :param task: task to complete
-        :return: result and result state
+        :return: result
         """
-        state = task.state
-        b = board.Board(state)
-        self.controller.board = b
+        self.controller.board = task.board()
         common.log(f'received task {task}')
+        if self.controller.backend.windowed:
+            self.controller.backend.poll = functools.partial(self._poll, task)
 
         result = do_work(self.controller, task, self.controller.max_depth - self.controller.precompute_depth)
         common.log(f'calculated result {result}')
-        return result, state
+        return result
+
+    def _poll(self, task: Task) -> Tuple[int, int]:
+        """
+        Receive window updates of the running task (called by the search backend while it searches).
+
+        :param task: running task
+        :return: newest window of the task, None if there's no update
+        """
+        window = None
+        key = (task.game_id, task.round, tuple(task.moves))
+        while self.comm.Iprobe(source=0, tag=WINDOW_TAG):
+            update_key, update = self.comm.recv(source=0, tag=WINDOW_TAG).value
+            if update_key == key:  # updates of earlier tasks are dropped
+                window = update
+        return window
+
+
+class SubMaster(Worker):
+    """
+    Sub-master of a node in a two-level topology (see topology.py).
+
+    Towards the master it's a worker. Every task it receives is split again, on the same pre-computed depth as the
+    master splits, into tasks for the workers of its node. They are served by its own scheduler on the node
+    communicator, so intra-node traffic never reaches the master. The scored subtree is returned as a single Result.
+
+    Tasks of windowed backends are split by principal variation (see Session._split_search) with the task window,
+    window updates sent while the task runs are not forwarded to the node workers.
+    """
+
+    def __init__(self, rank: int, comm, local_comm, ctl: controller.ComputerController, timeout: float = None):
+        super().__init__(rank, comm, ctl)
+        self.local_comm = local_comm
+        self.scheduler = Scheduler(local_comm, local_comm.Get_size() - 1, timeout=timeout)
+        self.session = Session(self.scheduler, board.Board(), ctl)
+
+    def run(self):
+        super().run()
+        self.scheduler.done()  # stop the workers of this node
+
+    def new_game(self, max_depth: int):
+        super().new_game(max_depth)
+        self.scheduler.new_game(max_depth)  # pass it on to the workers of this node
+
+    def _progress_mark(self):
+        return None  # node workers are watched by the sub-master's own scheduler, it computes tasks if they're lost
+
+    def _work(self, task: Task) -> Result:
+        """
+        Split the task into tasks for the node workers and score their results.
+        :param task: task to complete
+        :return: result of the whole task subtree
+        """
+        ctl = self.controller
+        b = task.board()
+        common.log(f'received task {task}')
+        max_depth = task.depth if task.depth is not None else ctl.max_depth - ctl.precompute_depth
+        if max_depth <= ctl.precompute_depth or not b.valid_moves:  # too shallow to split
+            ctl.board = b
+            return do_work(ctl, task, max_depth)
+
+        start = time.perf_counter()
+        player = -task.player * (-1) ** ctl.precompute_depth  # the same player do_work searches for
+        self.session.board = b
+        ctl.board = b
+        if task.window is not None:
+            metrics = self.session.metrics.start(player)
+            scored = self.session._split_search(player, max_depth, metrics, task.window)
+            self.session.metrics.moves.clear()
+            return Result(scored.score, scored.total, scored.winner, scored.loser, task.moves, task.worker,
+                          metrics.nodes, time.perf_counter() - start, metrics.cache_hits, max_depth, task.game_id,
+                          task.round, history_updates(ctl), task.slot)
+        difficulty = ctl.max_depth
+        ctl.max_depth = max_depth  # node workers search max_depth - precompute_depth
+        metrics = self.session.metrics.start(player)
+        try:
+            # exhaustive, so the scores are the same as if a worker searched the whole task
+            scored = self.session._search(player, metrics, exhaustive=True)
+        finally:
+            ctl.max_depth = difficulty
+        self.session.metrics.moves.clear()  # only the statistics of this task are needed
+        result = Result(scored.score, scored.total, scored.winner, scored.loser, task.moves, task.worker,
+                        metrics.nodes, time.perf_counter() - start, metrics.cache_hits, max_depth, task.game_id,
+                        task.round, slot=task.slot)
+        common.log(f'calculated result {result}')
+        return result
+
+
+_pool_controller: controller.ComputerController = None  # controller of a PoolWorker pool process
+
+
+def _init_pool(ctl: controller.ComputerController, table: 'transposition.SharedTable'):
+    """
+    Initialize a PoolWorker pool process.
+
+    :param ctl: controller of the worker (inherited by the forked process)
+    :param table: shared transposition table (its memory is inherited by the forked process)
+    :return:
+    """
+    global _pool_controller
+    _pool_controller = ctl
+    _pool_controller.store = table
+
+
+def _pool_work(task: Task) -> Result:
+    """
+    Compute a task in a PoolWorker pool process.
+
+    :param task: task to complete
+    :return: computed result
+    """
+    _pool_controller.board = task.board()
+    return do_work(_pool_controller, task, task.depth)
+
+
+class PoolWorker(Worker):
+    """
+    Worker that searches every task on a local process pool, so a single rank can use all cores of a node.
+
+    Tasks are split on the pre-computed depth (exhaustively, like SubMaster does) and the pieces are searched by the
+    pool processes. The processes share a transposition table in shared memory, positions reached by different
+    move orders (in this task or in earlier ones) are searched only once. The scored subtree is returned as a single
+    Result. Pool processes are forked from the worker, so they share its lookup tables copy-on-write.
+    """
+
+    def __init__(self, rank: int, comm, ctl: controller.ComputerController, processes: int,
+                 table_capacity=1 << 18):
+        import multiprocessing  # only pool workers need these, the other ranks start faster without them
+        import transposition
+
+        super().__init__(rank, comm, ctl)
+        self.table = transposition.SharedTable(table_capacity)
+        tables.load(*board.Board.DEFAULT_SIZE)  # boards load them on first use, the pool processes should share them
+        # fork (not spawn) - pool processes never touch MPI, and inherit the table memory and the loaded tables
+        self.pool = multiprocessing.get_context('fork').Pool(processes, _init_pool, (ctl, self.table))
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.table.close()
+
+    def _progress_mark(self):
+        return None  # the search runs in the pool processes
+
+    def _work(self, task: Task) -> Result:
+        """
+        Split the task into tasks for the pool processes and score their results.
+        :param task: task to complete
+        :return: result of the whole task subtree
+        """
+        if task.window is not None:  # windowed searches are searched by this process, the pool only splits trees
+            return super()._work(task)
+        ctl = self.controller
+        b = task.board()
+        ctl.board = b
+        common.log(f'received task {task}')
+        max_depth = task.depth if task.depth is not None else ctl.max_depth - ctl.precompute_depth
+        player = -task.player * (-1) ** ctl.precompute_depth  # the same player do_work searches for
+        key = b.key()
+        stored = self.table.get(key, player, max_depth)
+        if stored is not None:  # transposition of an earlier task
+            return Result(*stored, task.moves, task.worker, 0, 0.0, 1, max_depth, task.game_id, task.round,
+                          slot=task.slot)
+        if max_depth <= ctl.precompute_depth or not b.valid_moves:  # too shallow to split
+            return do_work(ctl, task, max_depth)
+
+        start = time.perf_counter()
+        scores = ScoreTree(b, player, ctl.precompute_depth)
+        tasks = list(Session._generate_tasks(b, scores.root, player, max_depth=ctl.precompute_depth, exhaustive=True,
+                                             leaves=scores.leaves))
+        for sub_task in tasks:
+            sub_task.depth = max_depth - ctl.precompute_depth
+        nodes, cache_hits = 0, 0
+        for sub_result in self.pool.imap_unordered(_pool_work, tasks):
+            scores.apply(sub_result)
+            nodes += sub_result.nodes
+            cache_hits += sub_result.cache_hits
+        scored = scores.finish()
+        self.table.put(key, player, max_depth, scored.score, scored.total, scored.winner, scored.loser)
+        result = Result(scored.score, scored.total, scored.winner, scored.loser, task.moves, task.worker, nodes,
+                        time.perf_counter() - start, cache_hits, max_depth, task.game_id, task.round, slot=task.slot)
+        common.log(f'calculated result {result}')
+        return result
 
 
 if __name__ == '__main__':
@@ -308,11 +1413,10 @@ if __name__ == '__main__':
             [1, 1, 1, 1, 1, 1, 1],
         ]
     ))
-    # create a pre-computed tree of depth 3
-    root = controller.ComputerController.create_tree(b, 1, 3)
+    # create a pre-computed tree of depth 3 and tasks based on it
+    root = search.TreeSearch.create_tree(b, 1, 0)
+    tasks = list(MasterController._generate_tasks(b, root, 1, max_depth=3))
     print(root.tree())
-    # create tasks based on the pre-computed tree
-    tasks = MasterController._create_tasks(root, max_depth=3)
     for task in tasks:
         print(task)
     print(b.table())
@@ -0,0 +1,147 @@
+import functools
+import json
+import sys
+import time
+from typing import Dict, List
+
+import common
+
+_hot = []  # functions marked as hot (wrapped only when profiling is enabled)
+_stats: Dict[str, List[float]] = {}  # function name -> [calls, total seconds]
+_enabled = False
+
+
+def hot(func):
+    """
+    Annotation used to mark a hot function for profiling.
+
+    It returns the function unchanged, so it has no overhead unless profiling is enabled.
+    Works for functions and methods (also under @property and @staticmethod), but not for nested functions.
+
+    :param func: function to be marked
+    :return: the same function
+    """
+    _hot.append(func)
+    return func
+
+
+def _wrap(name: str, func):
+    """
+    Wrap a function with a call counter and a timer.
+
+    :param name: name the stats are recorded under
+    :param func: function to be wrapped
+    :return: wrapper function
+    """
+    stat = _stats.setdefault(name, [0, 0.0])
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stat[0] += 1
+            stat[1] += perf_counter() - start
+
+    return wrapper
+
+
+def enable():
+    """
+    Enable profiling (sets common.PROFILE) by replacing every hot function with a wrapped one.
+
+    :return:
+    """
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    common.PROFILE = True
+    for func in _hot:
+        *path, attr = func.__qualname__.split('.')
+        owner = sys.modules[func.__module__]
+        for name in path:
+            owner = getattr(owner, name)
+        name = f'{func.__module__}.{func.__qualname__}'
+        current = vars(owner)[attr]
+        if isinstance(current, property):
+            setattr(owner, attr, property(_wrap(name, current.fget), current.fset, current.fdel, current.__doc__))
+        elif isinstance(current, staticmethod):
+            setattr(owner, attr, staticmethod(_wrap(name, current.__func__)))
+        else:
+            setattr(owner, attr, _wrap(name, current))
+    common.log(f'profiling {len(_hot)} functions')
+
+
+def stats() -> Dict[str, List[float]]:
+    """
+    Profile of this process.
+
+    :return: function name -> [calls, total seconds]
+    """
+    return {name: list(stat) for name, stat in _stats.items() if stat[0]}
+
+
+def merge(profiles: List[Dict[str, List[float]]]) -> Dict[str, List[float]]:
+    """
+    Merge profiles of many processes (e.g. one per MPI rank).
+
+    :param profiles: profiles returned by stats
+    :return: merged profile
+    """
+    result = {}
+    for profile in profiles:
+        for name, (calls, seconds) in profile.items():
+            stat = result.setdefault(name, [0, 0.0])
+            stat[0] += calls
+            stat[1] += seconds
+    return result
+
+
+def gather(comm, root=0) -> List[Dict[str, List[float]]]:
+    """
+    Collect profiles of all MPI ranks on the root rank (collective call, every rank has to call it).
+
+    :param comm: MPI communicator
+    :param root: rank collecting the profiles
+    :return: profiles indexed by rank on the root rank, None on other ranks
+    """
+    return comm.gather(stats(), root=root)
+
+
+def write_json(path: str, profiles: List[Dict[str, List[float]]]):
+    """
+    Write merged and per-rank profiles to a JSON file.
+
+    :param path: file path
+    :param profiles: profiles indexed by rank
+    :return:
+    """
+    with open(path, 'w') as file:
+        json.dump({'merged': merge(profiles), 'ranks': profiles}, file, indent=2)
+
+
+def report(profile: Dict[str, List[float]]) -> str:
+    """
+    Human readable profile, slowest functions first. Times are inclusive (they contain times of nested hot calls).
+
+    :param profile: profile
+    :return: report
+    """
+    lines = [f'{"function":<45} {"calls":>10} {"total s":>10} {"per call us":>12}']
+    for name, (calls, seconds) in sorted(profile.items(), key=lambda t: t[1][1], reverse=True):
+        lines.append(f'{name:<45} {calls:>10} {seconds:>10.3f} {seconds / calls * 1e6:>12.2f}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import board
+    import controller
+    import profiling  # hot functions register in the imported module, not in __main__
+
+    profiling.enable()
+    test_board = board.Board()
+    controller.ComputerController(test_board, difficulty=4).search(board.Board.PLAYER_1, 4)
+    print(profiling.report(profiling.stats()))
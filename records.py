@@ -0,0 +1,211 @@
+import struct
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+import board
+
+MAGIC = b'C4GR'  # record file signature
+VERSION = 1
+HEADER = struct.Struct('<4sBBB')  # magic, version, board width, board height
+RECORD = struct.Struct('<Bb')  # number of moves, winner (PLAYER_1, PLAYER_2 or 0)
+
+INDEX_DTYPE = np.dtype([('key', '<u8'), ('offset', '<u8')])  # position key -> offset of a game containing it
+
+
+def pack_moves(moves: List[int]) -> bytes:
+    """
+    Pack moves two per byte (4 bits per move).
+
+    :param moves: list of moves
+    :return: packed moves
+    """
+    padded = list(moves) + [0] * (len(moves) % 2)
+    return bytes(padded[i] | padded[i + 1] << 4 for i in range(0, len(padded), 2))
+
+
+def unpack_moves(data: bytes, count: int) -> List[int]:
+    """
+    Unpack moves packed by pack_moves.
+
+    :param data: packed moves
+    :param count: number of moves
+    :return: list of moves
+    """
+    moves = []
+    for byte in data:
+        moves.append(byte & 0xF)
+        moves.append(byte >> 4)
+    return moves[:count]
+
+
+def game_keys(moves: List[int]) -> np.ndarray:
+    """
+    Position keys of every position in a game (from the empty board up to the final position).
+
+    :param moves: moves of the game, first move by PLAYER_1
+    :return: array of position keys
+    """
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    states = [b.state.copy()]
+    for move in moves:
+        status = b.play(move, player)
+        if status == board.Board.INVALID_MOVE:
+            break
+        states.append(b.state.copy())
+        if status == board.Board.WIN:
+            break
+        player *= -1
+    return board.Board.encode_states(np.array(states))
+
+
+class RecordWriter:
+    """
+    Streaming writer of a binary game record file.
+
+    Each game takes 2 bytes plus half a byte per move. Use it as a context manager.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, board.Board.width, board.Board.height))
+
+    def write(self, moves: List[int], winner: int) -> int:
+        """
+        Append a game.
+
+        :param moves: moves of the game, first move by PLAYER_1
+        :param winner: PLAYER_1, PLAYER_2 or 0 for a draw
+        :return: file offset of the game (used by the index)
+        """
+        assert len(moves) < 256 and all(0 <= move < 16 for move in moves)
+        offset = self.file.tell()
+        self.file.write(RECORD.pack(len(moves), winner))
+        self.file.write(pack_moves(moves))
+        return offset
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordReader:
+    """
+    Streaming reader of a binary game record file. Iterating yields (offset, moves, winner) for every game.
+    Use it as a context manager.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb', buffering=1 << 20)
+        magic, version, width, height = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a game record file')
+        if (width, height) != (board.Board.width, board.Board.height):
+            raise ValueError(f'{path} records {width}x{height} games')
+
+    def __iter__(self) -> Iterator[Tuple[int, List[int], int]]:
+        self.file.seek(HEADER.size)
+        while True:
+            offset = self.file.tell()
+            game = self._read()
+            if game is None:
+                return
+            yield (offset,) + game
+
+    def _read(self) -> Tuple[List[int], int]:
+        """
+        Read the game at the current position.
+
+        :return: moves and winner (None at the end of the file)
+        """
+        data = self.file.read(RECORD.size)
+        if len(data) < RECORD.size:
+            return None
+        count, winner = RECORD.unpack(data)
+        return unpack_moves(self.file.read((count + 1) // 2), count), winner
+
+    def read_at(self, offset: int) -> Tuple[List[int], int]:
+        """
+        Read the game at a file offset.
+
+        :param offset: offset returned by RecordWriter.write or the index
+        :return: moves and winner
+        """
+        self.file.seek(offset)
+        return self._read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_index(records_path: str, index_path: str):
+    """
+    Build a position index of a record file: sorted (position key, game offset) pairs saved as a .npy file.
+
+    :param records_path: game record file
+    :param index_path: index file
+    :return:
+    """
+    parts = []
+    with RecordReader(records_path) as reader:
+        for offset, moves, winner in reader:
+            keys = np.unique(game_keys(moves))
+            part = np.empty(len(keys), dtype=INDEX_DTYPE)
+            part['key'] = keys
+            part['offset'] = offset
+            parts.append(part)
+    index = np.concatenate(parts) if parts else np.empty(0, dtype=INDEX_DTYPE)
+    index.sort(order=['key', 'offset'])
+    np.save(index_path, index)
+
+
+class PositionIndex:
+    """
+    Memory-mapped position index (see build_index) - only the pages that are looked up are read from the disk.
+    """
+
+    def __init__(self, path: str):
+        self.index = np.load(path, mmap_mode='r')
+        self.keys = self.index['key']
+
+    def offsets(self, key: int) -> List[int]:
+        """
+        Offsets of all games that contain a position.
+
+        :param key: position key
+        :return: list of game offsets
+        """
+        key = np.uint64(key)
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        return self.index['offset'][start:end].tolist()
+
+    def __len__(self):
+        return len(self.index)
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+
+    # convert tournament.py game records (JSON lines) to a binary record file and index it
+    source, target = sys.argv[1], sys.argv[2]
+    with open(source) as lines, RecordWriter(target) as writer:
+        for line in lines:
+            record = json.loads(line)
+            writer.write(record['moves'], record['winner'])
+    build_index(target, target + '.idx.npy')
+    index = PositionIndex(target + '.idx.npy')
+    print(f'{len(index)} positions, empty board in {len(index.offsets(board.Board().key()))} games')
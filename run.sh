@@ -2,4 +2,4 @@
 
 workers=$1
 total_proc=$(($workers + 1))
-mpiexec --hostfile hostfile -n $total_proc python main.py $total_proc $2
\ No newline at end of file
+mpiexec --hostfile hostfile -n $total_proc python main.py $total_proc $2 $3 $4
\ No newline at end of file
@@ -0,0 +1,514 @@
+import abc
+import time
+from typing import Dict, List, Type
+
+import numpy as np
+
+import board
+import common
+import ordering
+import profiling
+import tree
+
+BACKENDS: Dict[str, Type['Backend']] = {}  # registered search backends (name -> backend class)
+
+
+def register(name: str):
+    """
+    Annotation used to register a search backend under a name.
+
+    :param name: backend name (used by create and on the command line)
+    :return: class decorator
+    """
+
+    def wrapper(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+
+    return wrapper
+
+
+def create(name: str, **options) -> 'Backend':
+    """
+    Create a search backend by name.
+
+    :param name: registered backend name
+    :param options: backend specific options
+    :return: search backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f'unknown search backend {name} (available: {", ".join(sorted(BACKENDS))})')
+    return BACKENDS[name](**options)
+
+
+class SearchResult:
+    """
+    Outcome of searching a position: (score, total) pair with winner/loser flags for the position itself
+    and for every valid move from it.
+    """
+
+    def __init__(self, score, total, winner: bool, loser: bool, move: int = None, depth: int = 0,
+                 children: List['SearchResult'] = None, nodes: int = 0, cache_hits: int = 0, best: int = None):
+        self.score = score
+        self.total = total
+        self.winner = winner
+        self.loser = loser
+        self.move = move
+        self.depth = depth  # depth the search completed to
+        self.children = children or []
+        self.nodes = nodes  # number of nodes the search created
+        self.cache_hits = cache_hits  # number of positions the search didn't have to compute
+        self.best = best  # move chosen by the search (None -> the one with the highest score)
+
+    @staticmethod
+    def from_node(node: tree.Node, depth: int = 0, nodes: int = 0) -> 'SearchResult':
+        """
+        Create a search result from a scored tree (root and its direct children).
+
+        :param node: root node of the score tree
+        :param depth: depth the tree was scored to
+        :param nodes: number of nodes created while building the tree
+        :return: search result
+        """
+        children = [SearchResult(child.score, child.total, child.winner, child.loser, child.move, depth - 1)
+                    for child in node.children]
+        return SearchResult(node.score, node.total, node.winner, node.loser, node.move, depth, children, nodes)
+
+    @property
+    def best_move(self) -> int:
+        """
+        Optimal move - the one chosen by the search, otherwise the one with the highest score (first one if there are
+        more of them).
+
+        :return: optimal move
+        """
+        if self.best is not None:
+            return self.best
+        result = sorted(self.children, key=lambda t: common.calculate_score(t.score, t.total),
+                        reverse=True)  # sort moves by score
+        return result[0].move
+
+    def __repr__(self):
+        return f'SearchResult(score {self.score} total {self.total} move {self.move} depth {self.depth}) ' \
+               f'winner {self.winner} loser {self.loser}'
+
+
+class Backend(abc.ABC):
+    """
+    Search backend used by a ComputerController (and by workers) to score a position.
+    """
+    name: str = None
+    windowed = False  # searches with an alpha/beta window (see AlphaBetaSearch), parallel sessions split them by PV
+    ordering: 'ordering.MoveOrdering' = None  # move ordering tables (pruning backends only)
+
+    @abc.abstractmethod
+    def search(self, b: board.Board, player: int, max_depth: int, time_budget: float = None) -> SearchResult:
+        """
+        Search a position for the player making the move.
+
+        :param b: board with the position (it's not modified)
+        :param player: player making the move
+        :param max_depth: maximum search depth
+        :param time_budget: optional time budget in seconds, search stops deepening when it runs out
+        :return: scores for the position and every valid move
+        """
+        pass
+
+
+@register('tree')
+class TreeSearch(Backend):
+    """
+    Exhaustive search that builds the whole score tree and scores every node with the (score, total) pairs of its
+    children (averaging the leaf scores).
+
+    With a node budget, once the tree holds more nodes than the budget, the children of every scored node (except the
+    root) are discarded - a scored node keeps its aggregated (score, total) and winner/loser flags, which is all its
+    parent needs. The rest of the tree is then scored depth-first, holding at most budget + depth * branching nodes,
+    with the same results.
+
+    In streaming mode subtrees are discarded right after they are scored, whatever the budget, so the search holds
+    only O(depth * branching) nodes. The returned tree then has just the levels callers inspect: the root and its
+    direct children.
+    """
+    nodes = 0  # number of nodes created by play_node in this process (statistics only)
+
+    def __init__(self, node_budget: int = None, streaming=False):
+        self.node_budget = node_budget  # maximum number of nodes kept in memory (None -> keep the whole tree)
+        self.streaming = streaming  # discard every scored subtree below the root's children
+
+    @profiling.hot
+    def search(self, b: board.Board, player: int, max_depth: int, time_budget: float = None) -> SearchResult:
+        start_nodes = TreeSearch.nodes
+        if time_budget is None:
+            return SearchResult.from_node(self.compute(b, player, max_depth), max_depth,
+                                          TreeSearch.nodes - start_nodes)
+        # iterative deepening - keep the deepest search that completed within the budget
+        start = time.time()
+        result = None
+        for depth in range(1, max_depth + 1):
+            result = SearchResult.from_node(self.compute(b, player, depth), depth, TreeSearch.nodes - start_nodes)
+            if time.time() - start >= time_budget:
+                break
+        return result
+
+    def compute(self, b: board.Board, player: int, max_depth: int, precomputed_tree: tree.Node = None) -> tree.Node:
+        """
+        Computes the score tree from the board state for a selected player.
+
+        :param b: board
+        :param player: player making the move
+        :param max_depth: maximum score tree depth
+        :param precomputed_tree: optional pre-computed tree that can be used as a basis for tree-building and computing scores
+        :return: completely built & scored tree to the max_depth depth
+        """
+        return self._tree(b, player, max_depth, root=precomputed_tree)
+
+    @staticmethod
+    @profiling.hot
+    def create_tree(b: board.Board, player: int, max_depth) -> tree.Node:
+        """
+        Creates a pre-computed tree. It does NOT store scores for all nodes, just the leaf nodes and their direct parents.
+
+        :param b: board
+        :param player: current player
+        :param max_depth: maximum tree depth to create
+        :return: pre-computed tree
+        """
+
+        def recurse(move: int, board: board.Board, depth: int, current_player: int, node: tree.Node):
+            """
+            Recursively create a tree
+
+            :param move: current move
+            :param board: current board state
+            :param depth: current depth
+            :param current_player: current player
+            :param node: parent node for this move
+            :return:
+            """
+            if move is not None:
+                node = TreeSearch.play_node(player, board, move, current_player, node)
+                if abs(node.status) == board.WIN:  # if win occurs this new node is a leaf in the tree
+                    return  # we never encounter board.LOSS as a state because it's impossible to lose when it's your move
+            for m in board.valid_moves:
+                if depth < max_depth:
+                    recurse(m, board.copy(), depth + 1, current_player * -1,
+                            node)  # create a subtree for each valid move of the current board state
+
+        node = tree.Node(0, 0, None, b.state, player * -1, None)  # create a root node
+        recurse(None, b, 0, player * -1, node)  # compute from the current root node
+        return node
+
+    @staticmethod
+    @profiling.hot
+    def play_node(me: int, board: board.Board, move: int, player: int, node: tree.Node) -> tree.Node:
+        """
+        Play a move in the current board and for the parent node.
+
+        :param me: player we're building the tree for
+        :param board: current board
+        :param move: move to make
+        :param player: current player
+        :param node: parent node
+        :return: new node for the current move
+        """
+        TreeSearch.nodes += 1
+        status = board.play(move, player)
+        total_valid_moves_after_play = len(board.valid_moves)
+        new_node = tree.Node(0, 1, move, board.state, player, node)  # create a new node
+        if node:
+            node.add(new_node)  # if parent node is supplied -> add new node as a child
+        new_node.status = status
+        if status == board.WIN:
+            if player == me:
+                if node:
+                    node.winner = True  # mark parent as a winner
+                new_node.winner = True
+                # score is equal to the number of valid moves that would be possible if a win didn't occur
+                new_node.score = board.WIN * total_valid_moves_after_play
+                new_node.total = total_valid_moves_after_play
+                # print(move, 'wins the game!')
+            else:
+                if node:
+                    node.loser = True  # mark parent as a loser
+                new_node.score = board.LOSS * total_valid_moves_after_play
+                new_node.total = total_valid_moves_after_play
+                new_node.loser = True
+        return new_node
+
+    @staticmethod
+    @profiling.hot
+    def _score_node(node: tree.Node):
+        """
+        Score a node from its (already scored) children.
+
+        :param node: tree node
+        :return:
+        """
+        if not (node.winner or node.loser):  # if not directly a winner or a loser (child not a winner or loser)
+            all_winners = True
+            all_losers = True
+            for child in node.children:  # if all children are winners the current node is a winner, analogous for losers
+                if child.winner:
+                    all_losers = False
+                elif child.loser:
+                    all_winners = False
+                else:
+                    all_winners = False
+                    all_losers = False
+            node.winner = all_winners
+            node.loser = all_losers
+
+        if node.children:  # if node has children (is not a leaf node) -> score it by using children scores
+            score, total = 0, 0
+            for child in node.children:
+                score += child.score  # this differs from spec but creates much better computer moves
+                total += child.total
+            node.score = score
+            node.total = total
+
+    @profiling.hot
+    def _tree(self, b: board.Board, me: int, max_depth: int, root: tree.Node = None) -> tree.Node:
+        """
+        Creates a score tree of max depth with an optional pre-computed tree.
+
+        :param b: board
+        :param me: player that the score tree is being computed for
+        :param max_depth: maximum tree depth
+        :param root: pre-computed tree
+        :return: score tree of max depth max_depth
+        """
+
+        node_budget = 0 if self.streaming else self.node_budget
+        first_node = TreeSearch.nodes  # nodes created before this tree
+        discarded = 0  # nodes discarded so far
+
+        def recurse(player: int, r_board: board.Board, current_depth: int, node: tree.Node):
+            """
+            Goes through all pre-computed tree nodes, generates new ones if necessary
+            and recursively scores the nodes from the bottom-up.
+
+            :param player: current player
+            :param r_board: current board state
+            :param current_depth: current tree depth
+            :param node: current tree node
+            :return:
+            """
+            nonlocal discarded
+            if node.children:  # if pre-computed tree was supplied
+                for child in node.children:
+                    new_board = board.Board(np.copy(child.state), win_count=r_board.win_count)
+                    try:
+                        if abs(child.status) == r_board.WIN:
+                            continue
+                    except AttributeError as er:
+                        print(r_board)
+                        raise er
+                    if current_depth < max_depth:
+                        # just go through the whole pre-computed tree
+                        recurse(player * -1, new_board, current_depth + 1, child)
+                    del new_board
+            else:  # if no pre-computed tree was supplied -> generate your own
+                for move in r_board.valid_moves:
+                    new_board = r_board.copy()  # copy the board state (so that it doesn't affect other nodes)
+                    new_node = self.play_node(me, new_board, move, player, node)  # play the move
+                    if abs(new_node.status) == r_board.WIN:
+                        continue  # if we won -> leaf node -> don't recurse any further
+                    if current_depth < max_depth:
+                        # create a sub-tree for the current state after our played move
+                        recurse(player * -1, new_board, current_depth + 1, new_node)
+                    del new_board
+            self._score_node(node)
+            if node_budget is not None and node is not root and TreeSearch.nodes - first_node - discarded > node_budget:
+                discarded += len(node.children)  # only the scores are needed from now on -> free the subtree
+                node.children = []
+                node._children_map = {}
+
+        common.log(f'tree with root {root}')
+        if root is None:
+            # if no pre-computed tree was supplied -> create just the root node, the recursion generates the rest
+            # (nodes are generated depth-first, which is what lets a node budget bound the memory)
+            root = self.create_tree(b.copy(), me, 0)
+        recurse(me, b, 1, root)  # create the tree recursively
+        return root
+
+
+class _Abort(Exception):
+    """
+    Raised inside an alpha-beta search when a window update makes the rest of it pointless.
+    """
+    pass
+
+
+@register('alphabeta')
+class AlphaBetaSearch(Backend):
+    """
+    Negamax search with alpha-beta pruning. Unlike the tree search it computes minimax values, so most of the tree
+    can be pruned, and it holds only the current path in memory.
+
+    Positions at the depth limit are scored by a static evaluation: every winning line that holds stones of only
+    one player counts for that player, more for more stones. A win is worth WIN_SCORE plus the remaining depth
+    (faster wins are better). Scores are returned as (value, 1) pairs, so common.calculate_score gives the value.
+
+    Moves are searched best first (see ordering.MoveOrdering), the ordering tables are kept for the lifetime of the
+    backend. Among moves with the same value the first one searched is chosen.
+
+    The search can be given a window (alpha, beta) for the searched position: values outside it are only bounds
+    (fail-soft). While it runs, poll (if set) is called every POLL_NODES nodes and can return a narrower window -
+    parallel sessions use it to send window updates to workers (see parallel.Session).
+    """
+    windowed = True
+    WIN_SCORE = 1_000_000
+    INF = 1_000_000_000  # bigger than any value
+    POLL_NODES = 1024
+    nodes = 0  # number of nodes searched in this process (statistics only)
+
+    def __init__(self):
+        self.ordering = ordering.MoveOrdering()
+        self.poll = None  # callable returning an updated (alpha, beta) window of the searched position, or None
+        self._beta = AlphaBetaSearch.INF  # current beta of the searched position
+        self._best = -AlphaBetaSearch.INF  # best value of the searched position so far
+        self._next_poll = 0  # node count of the next poll
+
+    @staticmethod
+    def evaluate(b: board.Board, player: int) -> int:
+        """
+        Static evaluation of a position.
+
+        :param b: board
+        :param player: player the position is evaluated for
+        :return: value of the position for the player
+        """
+        cells = b.state.ravel()[b.lookup.lines]  # stones of every winning line
+        mine = np.count_nonzero(cells == player, axis=1)
+        theirs = np.count_nonzero(cells == -player, axis=1)
+        weights = 4 ** mine - 1  # 0, 3, 15, 63 for 0 to 3 stones
+        return int(weights[theirs == 0].sum() - (4 ** theirs - 1)[mine == 0].sum())
+
+    @profiling.hot
+    def search(self, b: board.Board, player: int, max_depth: int, time_budget: float = None,
+               window=None) -> SearchResult:
+        """
+        Search a position for the player making the move.
+
+        :param b: board with the position (it's not modified)
+        :param player: player making the move
+        :param max_depth: maximum search depth
+        :param time_budget: optional time budget in seconds, search stops deepening when it runs out
+        :param window: optional (alpha, beta) window of the position value
+        :return: value of the position and of every searched move (values of moves that didn't improve on the best
+                 one are upper bounds, moves after a cutoff are left out)
+        """
+        start_nodes = AlphaBetaSearch.nodes
+        self.ordering.age()
+        if time_budget is None:
+            return self._root(b, player, max_depth, window, start_nodes)
+        # iterative deepening - keep the deepest search that completed within the budget
+        start = time.time()
+        result = None
+        for depth in range(1, max_depth + 1):
+            result = self._root(b, player, depth, window, start_nodes)
+            if time.time() - start >= time_budget:
+                break
+        return result
+
+    def _root(self, b: board.Board, player: int, max_depth: int, window, start_nodes: int) -> SearchResult:
+        """
+        Search the root position, move by move.
+
+        :param b: board
+        :param player: player making the move
+        :param max_depth: maximum search depth
+        :param window: optional (alpha, beta) window
+        :param start_nodes: node count when the search started
+        :return: search result
+        """
+        alpha, self._beta = window if window is not None else (-AlphaBetaSearch.INF, AlphaBetaSearch.INF)
+        self._best = -AlphaBetaSearch.INF
+        best_move = None
+        children = []
+        for move in self.ordering.order(b, player, 0):
+            child = b.copy()
+            if child.play(move, player) == board.Board.WIN:
+                value = AlphaBetaSearch.WIN_SCORE + max_depth
+            elif max_depth <= 1 or not child.valid_moves:
+                value = -self._leaf(child, -player)
+            else:
+                try:
+                    value = -self._negamax(child, -player, max_depth - 1, -self._beta, -max(alpha, self._best), 1)
+                except _Abort:  # a window update cut the position off, what was found so far is a lower bound
+                    break
+            children.append(SearchResult(value, 1, value >= AlphaBetaSearch.WIN_SCORE,
+                                         value <= -AlphaBetaSearch.WIN_SCORE, move, max_depth - 1))
+            if value > self._best:
+                self._best, best_move = value, move
+                if self._best >= self._beta:  # fail high
+                    self.ordering.update(b, player, move, 0, max_depth)
+                    break
+        if not children:  # no moves (a window update can't abort the first one) -> full board, a draw
+            assert not b.valid_moves
+            return SearchResult(self._leaf(b, player), 1, False, False, None, max_depth,
+                                nodes=AlphaBetaSearch.nodes - start_nodes)
+        children.sort(key=lambda t: t.move)
+        return SearchResult(self._best, 1, self._best >= AlphaBetaSearch.WIN_SCORE,
+                            self._best <= -AlphaBetaSearch.WIN_SCORE, None, max_depth, children,
+                            AlphaBetaSearch.nodes - start_nodes, best=best_move)
+
+    def _leaf(self, b: board.Board, player: int) -> int:
+        """
+        Value of a position at the depth limit (or of a full board).
+
+        :param b: board
+        :param player: player making the move
+        :return: position value for the player
+        """
+        AlphaBetaSearch.nodes += 1
+        return self.evaluate(b, player) if b.valid_moves else 0
+
+    @profiling.hot
+    def _negamax(self, b: board.Board, player: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """
+        Fail-soft alpha-beta search below the root.
+
+        :param b: board (modified by the search)
+        :param player: player making the move
+        :param depth: remaining depth (at least 1)
+        :param alpha: alpha bound
+        :param beta: beta bound
+        :param ply: distance from the root
+        :return: position value for the player
+        """
+        AlphaBetaSearch.nodes += 1
+        if self.poll is not None and AlphaBetaSearch.nodes >= self._next_poll:
+            self._next_poll = AlphaBetaSearch.nodes + AlphaBetaSearch.POLL_NODES
+            window = self.poll()
+            if window is not None:
+                self._beta = min(self._beta, window[1])
+                if self._best >= self._beta:
+                    raise _Abort()
+        best = -AlphaBetaSearch.INF
+        for move in self.ordering.order(b, player, ply):
+            child = b.copy()
+            if child.play(move, player) == board.Board.WIN:
+                self.ordering.update(b, player, move, ply, depth)
+                return AlphaBetaSearch.WIN_SCORE + depth  # nothing beats winning right now
+            if depth <= 1 or not child.valid_moves:
+                value = -self._leaf(child, -player)
+            else:
+                value = -self._negamax(child, -player, depth - 1, -beta, -max(alpha, best), ply + 1)
+            if value > best:
+                best = value
+                if best >= beta:
+                    self.ordering.update(b, player, move, ply, depth)
+                    break
+        return best
+
+
+if __name__ == '__main__':
+    test_board = board.Board()
+    for name in sorted(BACKENDS):
+        backend = create(name)
+        # search the empty board to depth 3, then with a (tiny) time budget
+        print(name, backend.search(test_board, board.Board.PLAYER_1, 3).children)
+        print(name, backend.search(test_board, board.Board.PLAYER_1, 5, time_budget=0.01))
@@ -0,0 +1,219 @@
+import fcntl
+import os
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+import board
+import common
+import tables
+
+MAGIC = b'C4RS'  # result store file signature
+VERSION = 2  # 2 adds the win count to the header
+HEADER = struct.Struct('<4sBBBBI')  # magic, version, board width, height, win count, generation (bumped by compaction)
+RECORD = struct.Struct('<QbBdd??')  # position key, player, depth, score, total, winner, loser
+
+StoreKey = Tuple[int, int, int]  # position key, player making the move, search depth
+StoreValue = Tuple[float, float, bool, bool]  # score, total, winner, loser
+
+
+def default_path(backend: str, size: Tuple[int, int, int] = board.Board.DEFAULT_SIZE) -> str:
+    """
+    Default result store file for a search backend (backends score positions differently, so they don't share it).
+
+    :param backend: search backend name
+    :param size: board width, height and number of stones in a row needed to win
+    :return: file path
+    """
+    width, height, win_count = size
+    return os.path.join(tables.CACHE_DIR, f'results_{backend}_{width}x{height}_{win_count}.c4s')
+
+
+class ResultStore:
+    """
+    Persistent store of search results: (position key, player, depth) -> (score, total, winner, loser).
+
+    The store is an append-only log of fixed size records, every process keeps an in-memory index of it. Any number
+    of processes (MPI ranks on a shared file system) can use the same file: appends are done under a shared lock and
+    every process picks up records appended by others with refresh. Compaction drops duplicates and, once the store
+    holds more than max_entries results, the oldest ones. It rewrites the file in place under an exclusive lock and
+    bumps the generation in the header, which makes other processes reload their index.
+
+    Position keys are stored as 64-bit integers, so the board has to satisfy width * (height + 1) <= 64.
+    """
+
+    def __init__(self, path: str, max_entries=500_000, compact_every=50_000,
+                 size: Tuple[int, int, int] = board.Board.DEFAULT_SIZE):
+        self.width, self.height, self.win_count = size  # board of the stored positions
+        if self.width * (self.height + 1) > 64:
+            raise ValueError(f'{self.width}x{self.height} position keys don\'t fit in 64 bits')
+        self.path = path
+        self.max_entries = max_entries  # size cap (number of results kept by compaction)
+        self.compact_every = compact_every  # compact after this many appended records (0 disables it)
+        self._index: Dict[StoreKey, StoreValue] = {}
+        self._generation = None
+        self._offset = HEADER.size  # file offset up to which the index is loaded
+        self._appended = 0  # records appended by this process since the last compaction
+        self._lock = threading.RLock()  # sessions running on threads share the store
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:  # new store
+                os.write(self._fd, HEADER.pack(MAGIC, VERSION, self.width, self.height, self.win_count, 0))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.refresh()
+        common.log(f'opened result store {path} with {len(self._index)} results')
+
+    def _read_header(self) -> int:
+        """
+        Check the file header.
+
+        :return: generation of the file
+        """
+        magic, version, width, height, win_count, generation = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a result store (or has an old format)')
+        if (width, height, win_count) != (self.width, self.height, self.win_count):
+            raise ValueError(f'{self.path} stores {width}x{height} connect-{win_count} results')
+        return generation
+
+    def refresh(self):
+        """
+        Load records appended since the last refresh (by any process) into the index.
+
+        :return:
+        """
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                generation = self._read_header()
+                if generation != self._generation:  # file was compacted -> reload everything
+                    self._generation = generation
+                    self._index.clear()
+                    self._offset = HEADER.size
+                end = os.fstat(self._fd).st_size
+                end -= (end - HEADER.size) % RECORD.size  # ignore a partially written record
+                data = os.pread(self._fd, end - self._offset, self._offset) if end > self._offset else b''
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            for key, player, depth, score, total, winner, loser in RECORD.iter_unpack(data):
+                self._index[(key, player, depth)] = (score, total, winner, loser)
+            self._offset += len(data)
+
+    def get(self, key: int, player: int, depth: int) -> Optional[StoreValue]:
+        """
+        Look up a result (only in the index, call refresh to see results other processes stored in the meantime).
+
+        :param key: position key (see board.Board.key)
+        :param player: player making the move
+        :param depth: search depth
+        :return: score, total, winner and loser of the position, None if it isn't stored
+        """
+        return self._index.get((key, player, depth))
+
+    def put(self, key: int, player: int, depth: int, score, total, winner: bool, loser: bool):
+        """
+        Store a result (results already in the index are not stored again).
+
+        :param key: position key (see board.Board.key)
+        :param player: player making the move
+        :param depth: search depth
+        :param score: score of the position
+        :param total: total of the position
+        :param winner: position is a winner
+        :param loser: position is a loser
+        :return:
+        """
+        with self._lock:
+            if (key, player, depth) in self._index:
+                return
+            self._index[(key, player, depth)] = (score, total, winner, loser)
+            fcntl.flock(self._fd, fcntl.LOCK_SH)  # appends don't exclude each other, only compaction
+            try:
+                os.write(self._fd, RECORD.pack(key, player, depth, score, total, winner, loser))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._appended += 1
+            if self.compact_every and self._appended >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrite the file without duplicates, keeping only the max_entries most recently stored results.
+
+        :return:
+        """
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                generation = self._read_header()
+                end = os.fstat(self._fd).st_size
+                end -= (end - HEADER.size) % RECORD.size
+                records = {}  # dicts keep insertion order -> re-inserting moves a result to the end
+                data = os.pread(self._fd, end - HEADER.size, HEADER.size)
+                for key, player, depth, *value in RECORD.iter_unpack(data):
+                    records.pop((key, player, depth), None)
+                    records[(key, player, depth)] = tuple(value)
+                kept = list(records.items())[-self.max_entries:]
+                data = b''.join(RECORD.pack(*key, *value) for key, value in kept)
+                # the file is rewritten in place (not replaced) so that other processes keep appending to it
+                os.ftruncate(self._fd, 0)
+                header = HEADER.pack(MAGIC, VERSION, self.width, self.height, self.win_count,
+                                     generation + 1)
+                os.write(self._fd, header + data)
+                os.fsync(self._fd)
+                self._generation = generation + 1
+                self._index = dict(kept)
+                self._offset = HEADER.size + len(data)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._appended = 0
+            common.log(f'compacted result store {self.path} to {len(self._index)} results')
+
+    def close(self, compact=False):
+        """
+        Close the store.
+
+        :param compact: compact it first if it grew over the size cap or holds duplicates
+        :return:
+        """
+        if compact:
+            self.refresh()
+            if (os.fstat(self._fd).st_size - HEADER.size) // RECORD.size > min(len(self._index), self.max_entries):
+                self.compact()
+        os.close(self._fd)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    import controller
+
+    # search the same position twice, the second time the result comes from the store
+    path = os.path.join(tempfile.mkdtemp(), 'results.c4s')
+    test_board = board.Board()
+    ctl = controller.ComputerController(test_board, difficulty=4, verbose=False)
+    for _ in range(2):
+        with ResultStore(path) as store:
+            start = time.perf_counter()
+            value = store.get(test_board.key(), board.Board.PLAYER_1, 4)
+            if value is None:
+                result = ctl.search(board.Board.PLAYER_1, 4)
+                value = (result.score, result.total, result.winner, result.loser)
+                store.put(test_board.key(), board.Board.PLAYER_1, 4, *value)
+            print(value, f'{time.perf_counter() - start:.3f} s')
@@ -0,0 +1,198 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+import common
+
+TABLES_VERSION = 1  # bump when the table layout changes so that stale cache files get rebuilt
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')  # directory holding cached tables
+
+
+class Tables:
+    """
+    Precomputed lookup tables for a board of a certain size.
+
+    Every table is a NumPy array so the board and the search can replace small Python loops with array indexing:
+
+    * cell_lines - for every cell (row * width + col) the other cells of each winning line going through it,
+      shape (width * height, max lines per cell, win_count - 1). Cells with fewer lines are padded by repeating
+      their first line, which doesn't change the outcome of an "any line complete" check.
+    * cell_line_counts - number of (unpadded) winning lines for every cell, shape (width * height,)
+    * column_bits - legal-move bit for every column, shape (width,)
+    * moves - legal moves for every legal-move bitmask, shape (2 ** width, width), padded with -1
+    * move_counts - number of legal moves for every legal-move bitmask, shape (2 ** width,)
+    * center_order - columns ordered from the center outwards, shape (width,)
+    * ordered_moves - legal moves for every bitmask in center-first order, shape (2 ** width, width), padded with -1
+
+    Winning lines are horizontal and vertical only, the same rules that Board.think implements.
+    """
+
+    def __init__(self, width: int, height: int, win_count: int, arrays: dict = None):
+        self.width = width
+        self.height = height
+        self.win_count = win_count
+        if arrays is None:
+            arrays = self._build()
+        self.cell_lines: np.ndarray = arrays['cell_lines']
+        self.cell_line_counts: np.ndarray = arrays['cell_line_counts']
+        self.column_bits: np.ndarray = arrays['column_bits']
+        self.moves: np.ndarray = arrays['moves']
+        self.move_counts: np.ndarray = arrays['move_counts']
+        self.center_order: np.ndarray = arrays['center_order']
+        self.ordered_moves: np.ndarray = arrays['ordered_moves']
+
+        # plain Python views of the tables - for arrays this small, indexing lists is a lot cheaper than
+        # NumPy fancy indexing, so the hot path in board.Board uses these
+        self.line_cells: List[List[List[List[Tuple[int, int]]]]] = [[[] for _ in range(width)] for _ in range(height)]
+        for cell in range(width * height):  # [row][col] -> winning lines through (row, col) as lists of other cells
+            row, col = divmod(cell, width)
+            lines = self.cell_lines[cell, :self.cell_line_counts[cell]].tolist()
+            self.line_cells[row][col] = [[divmod(other, width) for other in line] for line in lines]
+        self.move_lists: List[List[int]] = [list(row[:count]) for row, count in
+                                            zip(self.moves.tolist(), self.move_counts.tolist())]
+        self.ordered_move_lists: List[List[int]] = [list(row[:count]) for row, count in
+                                                    zip(self.ordered_moves.tolist(), self.move_counts.tolist())]
+        self.full_mask = (1 << width) - 1  # bitmask with all columns playable
+        self.lines = np.array(self._lines(), dtype=np.int64)  # every winning line as flat cell indices
+
+    def _arrays(self) -> dict:
+        """
+        Arrays that define the tables (everything that gets cached to disk).
+
+        :return: dictionary of table name -> array
+        """
+        return {
+            'cell_lines': self.cell_lines,
+            'cell_line_counts': self.cell_line_counts,
+            'column_bits': self.column_bits,
+            'moves': self.moves,
+            'move_counts': self.move_counts,
+            'center_order': self.center_order,
+            'ordered_moves': self.ordered_moves,
+        }
+
+    def _lines(self) -> List[List[int]]:
+        """
+        Enumerate all horizontal and vertical winning lines as lists of flat cell indices.
+
+        :return: list of winning lines
+        """
+        lines = []
+        for row in range(self.height):
+            for col in range(self.width - self.win_count + 1):
+                lines.append([row * self.width + col + i for i in range(self.win_count)])
+        for col in range(self.width):
+            for row in range(self.height - self.win_count + 1):
+                lines.append([(row + i) * self.width + col for i in range(self.win_count)])
+        return lines
+
+    def _build(self) -> dict:
+        """
+        Build all tables from scratch.
+
+        :return: dictionary of table name -> array
+        """
+        cells = self.width * self.height
+        per_cell = [[] for _ in range(cells)]
+        for line in self._lines():
+            for cell in line:
+                per_cell[cell].append([other for other in line if other != cell])
+        max_lines = max(1, max(len(lines) for lines in per_cell))
+        cell_lines = np.zeros((cells, max_lines, self.win_count - 1), dtype=np.int64)
+        cell_line_counts = np.zeros(cells, dtype=np.int64)
+        for cell, lines in enumerate(per_cell):
+            cell_line_counts[cell] = len(lines)
+            if not lines:  # board too small to win through this cell -> line that can never be complete
+                lines = [[cell] * (self.win_count - 1)]
+            lines = lines + [lines[0]] * (max_lines - len(lines))
+            cell_lines[cell] = lines
+
+        column_bits = np.array([1 << col for col in range(self.width)], dtype=np.int64)
+        center_order = np.array(sorted(range(self.width), key=lambda t: (abs(2 * t - (self.width - 1)), t)),
+                                dtype=np.int64)
+
+        masks = 1 << self.width
+        moves = np.full((masks, self.width), -1, dtype=np.int64)
+        ordered_moves = np.full((masks, self.width), -1, dtype=np.int64)
+        move_counts = np.zeros(masks, dtype=np.int64)
+        for mask in range(masks):
+            legal = [col for col in range(self.width) if mask & (1 << col)]
+            ordered = [col for col in center_order if mask & (1 << col)]
+            moves[mask, :len(legal)] = legal
+            ordered_moves[mask, :len(ordered)] = ordered
+            move_counts[mask] = len(legal)
+
+        return {
+            'cell_lines': cell_lines,
+            'cell_line_counts': cell_line_counts,
+            'column_bits': column_bits,
+            'moves': moves,
+            'move_counts': move_counts,
+            'center_order': center_order,
+            'ordered_moves': ordered_moves,
+        }
+
+
+_tables = {}  # in-process cache: (width, height, win_count) -> Tables
+
+
+def _cache_path(width: int, height: int, win_count: int) -> str:
+    """
+    Path of the cache file for a certain board size.
+
+    :param width: board width
+    :param height: board height
+    :param win_count: number of contiguous fields needed to win
+    :return: cache file path
+    """
+    return os.path.join(CACHE_DIR, f'tables_v{TABLES_VERSION}_{width}x{height}_{win_count}.npz')
+
+
+def load(width: int, height: int, win_count: int) -> Tables:
+    """
+    Get the tables for a board size.
+
+    Tables are built only once per process. Built tables are cached to disk, and later processes load them from the
+    cache file instead of building them again. The cache file holds only the arrays (loaded without unpickling
+    anything), the Python views are rebuilt from them, which takes well under a millisecond. Failing to read or write
+    the cache is never fatal.
+
+    :param width: board width
+    :param height: board height
+    :param win_count: number of contiguous fields needed to win
+    :return: lookup tables
+    """
+    key = (width, height, win_count)
+    if key in _tables:
+        return _tables[key]
+    path = _cache_path(width, height, win_count)
+    tables = None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            tables = Tables(width, height, win_count, {name: data[name] for name in data.files})
+        common.log(f'loaded tables from {path}')
+    except (OSError, KeyError, ValueError):
+        pass
+    if tables is None:
+        tables = Tables(width, height, win_count)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = path + f'.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, **tables._arrays())
+            os.replace(tmp_path, path)  # atomic, so concurrently starting ranks never read a partial file
+            common.log(f'cached tables to {path}')
+        except OSError as e:
+            common.log(f'could not cache tables: {e}')
+    _tables[key] = tables
+    return tables
+
+
+if __name__ == '__main__':
+    t = load(7, 7, 4)
+    # lines going through the bottom left corner
+    print(t.cell_lines[6 * 7])
+    # legal moves when columns 0, 3 and 6 are playable
+    print(t.move_lists[0b1001001], t.ordered_move_lists[0b1001001])
@@ -0,0 +1,69 @@
+import random
+from typing import List
+
+import numpy as np
+import pytest
+
+import board
+
+SIZES = [board.Board.DEFAULT_SIZE, (5, 4, 3), (4, 4, 3), (9, 6, 5)]  # boards with 64-bit keys
+
+
+def random_boards(width: int, height: int, win_count: int, count: int, seed=0) -> List[board.Board]:
+    """
+    Boards with random moves played from an empty board (empty and full ones included).
+
+    :param width: board width
+    :param height: board height
+    :param win_count: number of stones in a row needed to win
+    :param count: number of boards
+    :param seed: random seed
+    :return: boards
+    """
+    rng = random.Random(seed)
+    boards = [board.Board(width=width, height=height, win_count=win_count)]
+    for _ in range(count - 1):
+        b = board.Board(width=width, height=height, win_count=win_count)
+        player = board.Board.PLAYER_1
+        for _ in range(rng.randrange(width * height + 1)):
+            b.play(rng.choice(b.valid_moves), player)
+            player *= -1
+        boards.append(b)
+    return boards
+
+
+@pytest.mark.parametrize('size', SIZES + [(10, 8, 4)])  # 10x8 keys don't fit in 64 bits
+def test_key_round_trip(size):
+    width, height, win_count = size
+    for b in random_boards(*size, 50):
+        key = b.key()
+        restored = board.Board.from_key(key, width, height, win_count)
+        assert np.array_equal(restored.state, b.state)
+        assert restored.last_rows == b.last_rows
+        assert restored.win_count == win_count
+        assert restored.key() == key
+
+
+def test_keys_are_unique():
+    boards = random_boards(*board.Board.DEFAULT_SIZE, 200)
+    states = {b.state.tobytes() for b in boards}
+    assert len({b.key() for b in boards}) == len(states)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_encode_decode_round_trip(size):
+    width, height, win_count = size
+    boards = random_boards(*size, 50, seed=1)
+    states = np.array([b.state for b in boards])
+    keys = board.Board.encode_states(states)
+    assert keys.dtype == np.uint64
+    assert keys.tolist() == [b.key() for b in boards]
+    assert np.array_equal(board.Board.decode_keys(keys, width, height), states)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_empty_board_key(size):
+    width, height, win_count = size
+    column = 1  # only the top of column marker
+    b = board.Board(width=width, height=height, win_count=win_count)
+    assert b.key() == sum(column << col * (height + 1) for col in range(width))
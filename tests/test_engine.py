@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+import board
+import controller
+import engine
+
+
+def empty_state():
+    return np.zeros((board.Board.height, board.Board.width)).tolist()
+
+
+def test_parse_moves():
+    state, player = engine.parse_position({'moves': [3, 3, 2]})
+    assert player == board.Board.PLAYER_2
+    assert state[-1, 3] == board.Board.PLAYER_1 and state[-2, 3] == board.Board.PLAYER_2
+    assert state[-1, 2] == board.Board.PLAYER_1
+    assert np.count_nonzero(state) == 3
+
+
+def test_parse_state():
+    state = empty_state()
+    state[-1][0] = board.Board.PLAYER_1
+    parsed, player = engine.parse_position({'state': state})
+    assert parsed.tolist() == state
+    assert player == board.Board.PLAYER_2
+    assert engine.parse_position({'state': state, 'player': 1})[1] == board.Board.PLAYER_1
+
+
+@pytest.mark.parametrize('request_', [
+    {'moves': [0, 0, 0, 0, 0, 0, 0, 0]},  # column 0 is full
+    {'moves': [0, 1, 0, 1, 0, 1, 0]},  # winning move
+    {'state': [[0] * board.Board.width]},  # wrong shape
+    {'state': [[2] * board.Board.width] * board.Board.height},  # not a player
+    {'moves': [3], 'player': 2},
+])
+def test_invalid_positions(request_):
+    with pytest.raises(ValueError):
+        engine.parse_position(request_)
+
+
+def test_floating_stone():
+    state = empty_state()
+    state[0][0] = board.Board.PLAYER_1  # top row, nothing below
+    with pytest.raises(ValueError, match='not on a filled field'):
+        engine.parse_position({'state': state})
+
+
+def test_unbalanced_state():
+    state = empty_state()
+    state[-1][0] = state[-1][1] = board.Board.PLAYER_1
+    with pytest.raises(ValueError, match='as many stones'):
+        engine.parse_position({'state': state})
+
+
+def test_full_board():
+    cells = board.Board.height * board.Board.width
+    fields = [board.Board.PLAYER_1 if i % 2 == 0 else board.Board.PLAYER_2 for i in range(cells)]  # balanced
+    state = [fields[row * board.Board.width:(row + 1) * board.Board.width] for row in range(board.Board.height)]
+    with pytest.raises(ValueError, match='full'):
+        engine.parse_position({'state': state})
+
+
+def test_identical_positions_are_searched_once(monkeypatch):
+    searches = []
+    search = controller.ComputerController.search
+
+    def counting_search(self, player, max_depth, *args):
+        searches.append(max_depth)
+        return search(self, player, max_depth, *args)
+
+    monkeypatch.setattr(controller.ComputerController, 'search', counting_search)
+    eng = engine.Engine(max_depth=3)
+
+    async def run():
+        state, player = engine.parse_position({'moves': [3, 3]})
+        other, _ = engine.parse_position({'moves': [2, 2]})
+        return await asyncio.gather(eng.best_move(state, player), eng.best_move(state.copy(), player),
+                                    eng.best_move(other, player))
+
+    try:
+        moves = asyncio.run(run())
+    finally:
+        eng.close()
+    assert moves[0] == moves[1]
+    assert sorted(searches) == [1, 1, 2, 2, 3, 3]  # two positions, every depth once
+
+
+def test_handle_responses():
+    eng = engine.Engine(max_depth=2)
+    responses = []
+
+    async def run():
+        await engine.handle(eng, json.dumps({'id': 7, 'moves': [3], 'stream': True}), responses.append)
+        await engine.handle(eng, json.dumps({'id': 8, 'moves': [9]}), responses.append)
+        await engine.handle(eng, 'not json', responses.append)
+
+    try:
+        asyncio.run(run())
+    finally:
+        eng.close()
+    assert [(r['id'], r.get('depth'), r['final']) for r in responses[:3]] == [(7, 1, False), (7, 2, False), (7, 2, True)]
+    assert responses[3]['id'] == 8 and 'error' in responses[3] and responses[3]['final']
+    assert responses[4]['id'] is None and 'error' in responses[4]
@@ -0,0 +1,73 @@
+import csv
+import json
+
+import pytest
+
+import measure
+
+
+def metrics() -> measure.Metrics:
+    """
+    Measurements of two moves, the second one without any task for worker 2.
+
+    :return: metrics
+    """
+    result = measure.Metrics()
+    first = result.start(1)
+    first.tasks = 3
+    first.task_done(1, 0.5)
+    first.task_done(2, 0.25)
+    first.task_done(1, 0.25)
+    first.total = 1.0
+    first.finish([1, 2])
+    second = result.start(-1)
+    second.tasks = 1
+    second.task_done(1, 2.0)
+    second.total = 3.0
+    second.finish([1, 2])
+    return result
+
+
+def test_busy_and_idle_times():
+    first, second = metrics().moves
+    assert first.busy == {1: 0.75, 2: 0.25}
+    assert first.idle == {1: 0.25, 2: 0.75}
+    assert second.busy == {1: 2.0, 2: 0.0}  # workers without tasks are idle the whole move
+    assert second.idle == {1: 1.0, 2: 3.0}
+
+
+def test_json_output(tmp_path):
+    path = tmp_path / 'metrics.json'
+    metrics().write_json(str(path), bins=2)
+    with open(path) as file:
+        data = json.load(file)
+    assert [move['move'] for move in data['moves']] == [0, 1]
+    assert data['moves'][0]['busy'] == {'1': 0.75, '2': 0.25}
+    assert data['moves'][1]['player'] == -1
+    assert data['summary']['total'] == pytest.approx({'min': 1.0, 'mean': 2.0, 'p50': 2.0, 'p90': 2.8, 'max': 3.0,
+                                                      'sum': 4.0})
+    assert data['summary']['tasks']['sum'] == 4
+    assert sum(data['histograms']['idle']['counts']) == 4  # every worker of every move
+    assert len(data['histograms']['idle']['edges']) == 3
+
+
+def test_csv_output(tmp_path):
+    path = tmp_path / 'metrics.csv'
+    metrics().write_csv(str(path))
+    with open(path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 2
+    assert rows[0]['tasks'] == '3'
+    assert float(rows[0]['busy_1']) == 0.75
+    assert float(rows[1]['idle_2']) == 3.0
+    assert float(rows[1]['total']) == 3.0
+
+
+def test_empty_metrics(tmp_path):
+    empty = measure.Metrics()
+    assert empty.summary('total') == {}
+    assert empty.histogram('total') == {'counts': [], 'edges': []}
+    empty.write_json(str(tmp_path / 'metrics.json'))
+    empty.write_csv(str(tmp_path / 'metrics.csv'))
+    with open(tmp_path / 'metrics.csv') as file:
+        assert file.read().strip() == ','.join(measure.MoveMetrics.FIELDS)
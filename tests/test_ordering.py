@@ -0,0 +1,72 @@
+import numpy as np
+
+import board
+import ordering
+import search
+
+
+def test_static_order():
+    b = board.Board()
+    assert ordering.MoveOrdering().order(b, board.Board.PLAYER_1, 0) == b.ordered_moves
+
+
+def test_killers_come_first():
+    b = board.Board()
+    moves = ordering.MoveOrdering()
+    for move, depth in [(6, 3), (0, 1), (5, 1)]:
+        moves.update(b, board.Board.PLAYER_1, move, 1, depth)
+    assert moves.killers[1] == [5, 0]  # newest first, at most KILLERS
+    assert moves.order(b, board.Board.PLAYER_1, 1)[:2] == [5, 0]
+    assert moves.order(b, board.Board.PLAYER_1, 2)[0] == 6  # other plies only see the history (6 has the most)
+
+
+def test_history_is_per_player_and_cell():
+    b = board.Board()
+    moves = ordering.MoveOrdering(max_ply=0)  # history only
+    moves.update(b, board.Board.PLAYER_2, 1, 0, 3)
+    assert moves.order(b, board.Board.PLAYER_2, 0)[0] == 1
+    assert moves.order(b, board.Board.PLAYER_1, 0) == b.ordered_moves
+    b.play(1, board.Board.PLAYER_1)  # the cell of column 1 is taken, its history is for the cell below
+    assert moves.order(b, board.Board.PLAYER_2, 0) == b.ordered_moves
+
+
+def test_age_and_merge():
+    b = board.Board()
+    worker = ordering.MoveOrdering()
+    worker.update(b, board.Board.PLAYER_1, 2, 0, 4)
+    updates = worker.take_updates()
+    assert updates.sum() == 16
+    assert worker.take_updates().sum() == 0  # updates are only taken once
+
+    master = ordering.MoveOrdering()
+    master.merge(updates)
+    assert np.array_equal(master.history, worker.history)
+    assert master.take_updates().sum() == 16  # passed on (sub-masters forward their workers' history)
+    master.age()
+    assert master.history.sum() == 8
+
+
+def test_clear():
+    b = board.Board()
+    moves = ordering.MoveOrdering()
+    moves.update(b, board.Board.PLAYER_1, 2, 1, 4)
+    moves.clear()
+    assert not moves.history.any() and not moves.take_updates().any()
+    assert moves.killers[1] == []
+    assert moves.order(b, board.Board.PLAYER_1, 1) == b.ordered_moves
+
+
+def test_ordering_keeps_the_values():
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    for move in [3, 3, 2, 4, 2, 2, 1]:
+        b.play(move, player)
+        player *= -1
+    backend = search.AlphaBetaSearch()
+    unordered = search.AlphaBetaSearch()
+    unordered.ordering.order = lambda b, player, ply: b.valid_moves  # column order
+    for depth in range(1, 7):
+        ordered = backend.search(b, player, depth)
+        expected = unordered.search(b, player, depth)
+        assert ordered.score == expected.score
+        assert ordered.nodes <= expected.nodes or depth < 3
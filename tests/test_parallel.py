@@ -0,0 +1,239 @@
+import importlib.util
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+import board
+import controller
+import parallel
+import search
+
+PRECOMPUTE_DEPTH = 2
+DEPTH = 4  # tree search depth, workers search DEPTH - PRECOMPUTE_DEPTH
+ALPHABETA_DEPTH = 6
+
+# mpiexec command of the MPI tests, e.g. "mpiexec --hostfile hostfile"
+MPIEXEC = os.environ.get('MPIEXEC', 'mpiexec')
+
+
+def positions():
+    """
+    Positions to search: the benchmark corpus and a few positions on smaller boards.
+
+    :return: list of (board, player making the move)
+    """
+    result = [benchmark.position(name) for name in benchmark.CORPUS]
+    rng = random.Random(3)
+    for size in [(5, 4, 3), (6, 5, 4)]:
+        width, height, win_count = size
+        while sum(b.size == size for b, _ in result) < 3:
+            b = board.Board(width=width, height=height, win_count=win_count)
+            player = board.Board.PLAYER_1
+            for _ in range(rng.randrange(width * height - 4)):
+                if b.play(rng.choice(b.valid_moves), player) == board.Board.WIN:
+                    break
+                player *= -1
+            else:
+                result.append((b, player))
+    return result
+
+
+def scores(result: search.SearchResult):
+    return ((result.score, result.total, result.winner, result.loser),
+            [(child.move, child.score, child.total, child.winner, child.loser) for child in result.children])
+
+
+def compute_tasks(tasks, order_seed: int):
+    """
+    Compute tasks the way workers do, in a random order.
+
+    :param tasks: tasks of a pre-computed tree
+    :param order_seed: random seed of the order
+    :return: results
+    """
+    tasks = list(tasks)
+    random.Random(order_seed).shuffle(tasks)
+    ctl = controller.ComputerController(None, DEPTH, precompute_depth=PRECOMPUTE_DEPTH, verbose=False)
+    results = []
+    for task in tasks:
+        ctl.board = task.board()
+        results.append(parallel.do_work(ctl, task, DEPTH - PRECOMPUTE_DEPTH))
+    return results
+
+
+def test_tasks_are_generated_lazily():
+    b, player = benchmark.position('opening')
+    root = search.TreeSearch.create_tree(b.copy(), player, 0)
+    nodes = search.TreeSearch.nodes
+    tasks = parallel.Session._generate_tasks(b, root, player, max_depth=PRECOMPUTE_DEPTH)
+    assert search.TreeSearch.nodes == nodes  # nothing is done before the first task is asked for
+    first = next(tasks)
+    assert search.TreeSearch.nodes - nodes <= PRECOMPUTE_DEPTH * board.Board.width
+    assert len(first.moves) == PRECOMPUTE_DEPTH
+    assert 1 + sum(1 for _ in tasks) == board.Board.width ** PRECOMPUTE_DEPTH
+
+
+@pytest.mark.parametrize('b, player', positions())
+@pytest.mark.parametrize('order_seed', [0, 1])
+def test_exhaustive_score_tree_matches_tree_search(b, player, order_seed):
+    tree = parallel.ScoreTree(b, player, PRECOMPUTE_DEPTH)
+    tasks = parallel.Session._generate_tasks(b, tree.root, player, max_depth=PRECOMPUTE_DEPTH, exhaustive=True,
+                                             leaves=tree.leaves)
+    for result in compute_tasks(tasks, order_seed):
+        tree.apply(result)
+    assert scores(tree.finish()) == scores(search.TreeSearch().search(b.copy(), player, DEPTH))
+
+
+@pytest.mark.parametrize('b, player', positions())
+@pytest.mark.parametrize('order_seed', [0, 1])
+def test_score_tree_matches_pre_computed_tree_scoring(b, player, order_seed):
+    # without exhaustive generation, the subtrees of winning and losing nodes get no tasks - the score tree has to
+    # score the same as search.TreeSearch scoring the whole pre-computed tree once all results are in
+    tree = parallel.ScoreTree(b, player, PRECOMPUTE_DEPTH)
+    tasks = parallel.Session._generate_tasks(b, tree.root, player, max_depth=PRECOMPUTE_DEPTH, leaves=tree.leaves)
+    root = search.TreeSearch.create_tree(b.copy(), player, 0)
+    leaves = []
+    for _ in parallel.Session._generate_tasks(b, root, player, max_depth=PRECOMPUTE_DEPTH, leaves=leaves):
+        pass
+    for result in compute_tasks(tasks, order_seed):
+        tree.apply(result)
+        node = leaves[result.slot]
+        node.score, node.total, node.winner, node.loser = result.score, result.total, result.winner, result.loser
+    scored = search.TreeSearch().compute(b.copy(), player, PRECOMPUTE_DEPTH, precomputed_tree=root)
+    assert scores(tree.finish()) == scores(search.SearchResult.from_node(scored, PRECOMPUTE_DEPTH))
+
+
+def test_new_game_resets_the_session():
+    scheduler = parallel.Scheduler(None, 0)  # no workers to tell
+    session = parallel.Session(scheduler, board.Board(), controller.ComputerController(
+        None, ALPHABETA_DEPTH, precompute_depth=PRECOMPUTE_DEPTH, backend='alphabeta', verbose=False))
+    ordering = session.controller.backend.ordering
+    ordering.update(session.board, board.Board.PLAYER_1, 3, 0, 4)
+    b = board.Board()
+    session.new_game(b)
+    assert session.board is b and session.controller.board is b
+    assert not ordering.history.any() and not any(ordering.killers)
+
+    parallel.Session(scheduler, board.Board(), controller.ComputerController(None, DEPTH, verbose=False))
+    with pytest.raises(AssertionError):  # the workers are shared by both sessions
+        session.new_game(board.Board())
+
+
+def test_worker_new_game():
+    ctl = controller.ComputerController(None, ALPHABETA_DEPTH, precompute_depth=PRECOMPUTE_DEPTH, backend='alphabeta',
+                                        verbose=False)
+    ctl.backend.ordering.update(board.Board(), board.Board.PLAYER_2, 1, 0, 4)
+    parallel.Worker(1, None, ctl).new_game(4)
+    assert ctl.max_depth == 4
+    assert not ctl.backend.ordering.history.any()
+
+
+class SilentComm:
+    """
+    Communicator of a scheduler whose workers never answer: sends complete right away, nothing is ever received.
+    """
+
+    class Request:
+        def Test(self):
+            return True
+
+        def Wait(self):
+            pass
+
+    def improbe(self):
+        return None
+
+    def isend(self, message, dest, tag):
+        return SilentComm.Request()
+
+    def Get_rank(self):
+        return 0
+
+
+def test_tasks_of_lost_workers_are_computed_locally():
+    scheduler = parallel.Scheduler(SilentComm(), 1, timeout=0.0)
+    b, player = benchmark.position(next(iter(benchmark.CORPUS)))
+    ctl = controller.ComputerController(None, DEPTH, precompute_depth=PRECOMPUTE_DEPTH, verbose=False)
+    session = parallel.Session(scheduler, b, ctl)
+    task = parallel.Task(None, b.key(), [b.valid_moves[0], b.valid_moves[0]], -player, game_id=session.game_id,
+                         round=session.round)
+    scheduler._idle.append(1)  # worker 1 asked for a task
+    scheduler.submit(session, [task])
+    assert task.worker == 1
+
+    result = scheduler.receive(session)  # worker 1 stays silent, the task is computed by the scheduler
+    assert scheduler.lost == {1}
+    expected = compute_tasks([task], 0)[0]
+    assert (result.score, result.total, result.winner, result.loser) == (expected.score, expected.total,
+                                                                       expected.winner, expected.loser)
+    with scheduler._condition:
+        scheduler._return_response(expected)  # the worker's result arrives after all
+    assert not session.has_responses()  # dropped, the task was done
+    scheduler.done()
+
+
+@pytest.mark.skipif(importlib.util.find_spec('mpi4py') is None or shutil.which(MPIEXEC.split()[0]) is None,
+                    reason='needs mpi4py and mpiexec')
+@pytest.mark.parametrize('precompute_depth', [2, 4])
+def test_split_search_matches_serial_alphabeta(precompute_depth):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    # Open MPI refuses to start more ranks than there are cores, and to run as root (CI containers), unless told to
+    env.setdefault('OMPI_MCA_rmaps_base_oversubscribe', '1')
+    if os.geteuid() == 0:
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT', '1')
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT_CONFIRM', '1')
+    process = subprocess.run(MPIEXEC.split() + ['-n', '3', sys.executable, os.path.abspath(__file__),
+                                                str(precompute_depth)],
+                             env=env, capture_output=True, text=True, timeout=600)
+    assert process.returncode == 0, process.stderr
+    searched = json.loads(process.stdout.splitlines()[-1])
+    for name in benchmark.CORPUS:
+        b, player = benchmark.position(name)
+        value, move = searched[name]
+        assert value == search.AlphaBetaSearch().search(b, player, ALPHABETA_DEPTH).score, name
+        # moves with the same value can be chosen differently (every process orders moves by its own history), but
+        # the chosen one has to be worth the value
+        child = b.copy()
+        if child.play(move, player) == board.Board.WIN:
+            assert value == search.AlphaBetaSearch.WIN_SCORE + ALPHABETA_DEPTH, name
+        else:
+            assert value == -search.AlphaBetaSearch().search(child, -player, ALPHABETA_DEPTH - 1).score, name
+
+
+def _split_search_values(precompute_depth: int):
+    """
+    Search the benchmark corpus with the alpha-beta backend split by principal variation (run inside mpiexec: rank 0
+    is the master, every other rank is a worker). The master prints the values and best moves as JSON.
+
+    :param precompute_depth: depth the principal variation is split to
+    :return:
+    """
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    ctl = controller.ComputerController(None, ALPHABETA_DEPTH, precompute_depth=precompute_depth,
+                                        backend='alphabeta', verbose=False)
+    if rank == 0:
+        master = parallel.MasterController(comm, comm.Get_size() - 1, board.Board(), ctl)
+        searched = {}
+        for name in benchmark.CORPUS:
+            b, player = benchmark.position(name)
+            master.board = b
+            ctl.board = b
+            result = master._split_search(player, ALPHABETA_DEPTH, master.metrics.start(player))
+            searched[name] = [result.score, result.best_move]
+        master.done()
+        print(json.dumps(searched))
+    else:
+        parallel.Worker(rank, comm, ctl).run()
+
+
+if __name__ == '__main__':
+    _split_search_values(int(sys.argv[1]))
@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+import board
+import records
+
+
+def random_game(rng: random.Random):
+    """
+    Random moves until a win or a full board.
+
+    :param rng: random generator
+    :return: moves and winner
+    """
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    moves = []
+    while b.valid_moves:
+        moves.append(rng.choice(b.valid_moves))
+        if b.play(moves[-1], player) == board.Board.WIN:
+            return moves, player
+        player *= -1
+    return moves, 0
+
+
+def test_pack_moves():
+    for moves in ([], [3], [0, 6, 1], list(range(7)) * 7):
+        packed = records.pack_moves(moves)
+        assert len(packed) == (len(moves) + 1) // 2
+        assert records.unpack_moves(packed, len(moves)) == moves
+
+
+def test_writer_and_reader(tmp_path):
+    rng = random.Random(0)
+    games = [random_game(rng) for _ in range(20)] + [([], 0)]
+    path = str(tmp_path / 'games.bin')
+    with records.RecordWriter(path) as writer:
+        offsets = [writer.write(moves, winner) for moves, winner in games]
+    with records.RecordReader(path) as reader:
+        assert list(reader) == [(offset, moves, winner) for offset, (moves, winner) in zip(offsets, games)]
+        assert reader.read_at(offsets[3]) == games[3]
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / 'games.bin'
+    path.write_bytes(b'not a record file')
+    with pytest.raises(ValueError):
+        records.RecordReader(str(path))
+
+
+def test_game_keys():
+    moves = [3, 3, 2]
+    keys = records.game_keys(moves)
+    b = board.Board()
+    expected = [b.key()]
+    for i, move in enumerate(moves):
+        b.play(move, board.Board.PLAYER_1 if i % 2 == 0 else board.Board.PLAYER_2)
+        expected.append(b.key())
+    assert keys.tolist() == expected
+
+
+def test_position_index(tmp_path):
+    rng = random.Random(1)
+    games = [random_game(rng) for _ in range(30)]
+    path = str(tmp_path / 'games.bin')
+    with records.RecordWriter(path) as writer:
+        offsets = [writer.write(moves, winner) for moves, winner in games]
+    records.build_index(path, path + '.idx.npy')
+    index = records.PositionIndex(path + '.idx.npy')
+    assert isinstance(index.index, np.memmap)
+    assert len(index) == sum(len(np.unique(records.game_keys(moves))) for moves, _ in games)
+    assert index.offsets(board.Board().key()) == offsets  # every game starts from the empty board
+    moves = games[5][0]
+    key = int(records.game_keys(moves[:4])[-1])
+    expected = [offset for offset, (other, _) in zip(offsets, games) if key in records.game_keys(other).tolist()]
+    assert 5 in [offsets.index(offset) for offset in index.offsets(key)]
+    assert index.offsets(key) == expected
+    with records.RecordReader(path) as reader:
+        for offset in index.offsets(key):
+            assert key in records.game_keys(reader.read_at(offset)[0]).tolist()
+    assert index.offsets(0) == []
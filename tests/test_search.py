@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+import board
+import search
+
+
+def random_position(seed: int, moves: int) -> board.Board:
+    """
+    Board after a few random moves (without a win).
+
+    :param seed: random seed
+    :param moves: number of moves
+    :return: board
+    """
+    rng = random.Random(seed)
+    while True:
+        b = board.Board()
+        player = board.Board.PLAYER_1
+        for _ in range(moves):
+            if b.play(rng.choice(b.valid_moves), player) == board.Board.WIN:
+                break
+            player *= -1
+        else:
+            return b
+
+
+def scores(result: search.SearchResult):
+    return [(child.move, child.score, child.total, child.winner, child.loser) for child in result.children]
+
+
+def live_nodes(node) -> int:
+    while node.parent is not None:
+        node = node.parent
+    stack, count = [node], 0
+    while stack:
+        count += 1
+        stack.extend(stack.pop().children)
+    return count
+
+
+def test_node_budget_gives_the_same_results():
+    for seed in range(5):
+        b = random_position(seed, 6)
+        expected = search.TreeSearch().search(b.copy(), board.Board.PLAYER_1, 4)
+        bounded = search.TreeSearch(node_budget=100).search(b.copy(), board.Board.PLAYER_1, 4)
+        assert scores(bounded) == scores(expected)
+        assert bounded.best_move == expected.best_move
+
+
+@pytest.fixture
+def peak(monkeypatch):
+    """
+    Record the largest tree seen while scoring (peak[0]).
+    """
+    result = [0]
+    score_node = search.TreeSearch._score_node
+
+    def counting_score_node(node):
+        result[0] = max(result[0], live_nodes(node))
+        score_node(node)
+
+    monkeypatch.setattr(search.TreeSearch, '_score_node', staticmethod(counting_score_node))
+    return result
+
+
+def test_node_budget_bounds_the_tree(peak):
+    budget, depth = 100, 4
+    root = search.TreeSearch(node_budget=budget).compute(board.Board(), board.Board.PLAYER_1, depth)
+    assert peak[0] <= budget + depth * board.Board.width + 1
+    assert live_nodes(root) <= budget + 1  # scored subtrees were freed
+
+    peak[0] = 0
+    search.TreeSearch().compute(board.Board(), board.Board.PLAYER_1, depth)
+    assert peak[0] > 2 * budget  # without a budget the whole tree is kept
+
+
+def test_streaming_gives_the_same_results():
+    for seed in range(5):
+        b = random_position(seed, 4)
+        expected = search.TreeSearch().search(b.copy(), board.Board.PLAYER_2, 4)
+        streamed = search.TreeSearch(streaming=True).search(b.copy(), board.Board.PLAYER_2, 4)
+        assert scores(streamed) == scores(expected)
+
+
+def test_streaming_keeps_only_the_root_and_its_children(peak):
+    depth = 4
+    root = search.TreeSearch(streaming=True).compute(board.Board(), board.Board.PLAYER_1, depth)
+    assert peak[0] <= depth * board.Board.width + 1
+    assert len(root.children) == board.Board.width
+    assert all(not child.children for child in root.children)
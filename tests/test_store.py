@@ -0,0 +1,90 @@
+import pytest
+
+import store
+
+
+def results(count: int, start=0):
+    """
+    Distinct results to store.
+
+    :param count: number of results
+    :param start: number of the first result
+    :return: list of (key, player, depth, (score, total, winner, loser))
+    """
+    return [((1 << 40) + i, 1 if i % 2 else -1, i % 5, (i * 0.5 - 3.0, float(i + 1), i % 3 == 0, i % 3 == 1))
+            for i in range(start, start + count)]
+
+
+def put(result_store: store.ResultStore, entries):
+    for key, player, depth, value in entries:
+        result_store.put(key, player, depth, *value)
+
+
+def assert_stored(result_store: store.ResultStore, entries):
+    for key, player, depth, value in entries:
+        assert result_store.get(key, player, depth) == value
+
+
+def test_put_get_survives_compaction(tmp_path):
+    path = str(tmp_path / 'results.c4s')
+    entries = results(100)
+    with store.ResultStore(path, compact_every=0) as result_store:
+        put(result_store, entries)
+        put(result_store, entries[:10])  # already stored, not appended again
+        result_store.compact()
+        assert len(result_store) == 100
+        assert_stored(result_store, entries)
+        more = results(20, start=100)
+        put(result_store, more)  # appended after the compacted records
+        assert_stored(result_store, entries + more)
+    with store.ResultStore(path, compact_every=0) as result_store:
+        assert len(result_store) == 120
+        assert_stored(result_store, entries + more)
+
+
+def test_compaction_keeps_the_newest_results(tmp_path):
+    path = str(tmp_path / 'results.c4s')
+    entries = results(30)
+    with store.ResultStore(path, max_entries=20, compact_every=7) as result_store:  # compacts every 7 puts
+        put(result_store, entries)
+        result_store.compact()
+        assert len(result_store) == 20
+        assert_stored(result_store, entries[10:])
+        assert result_store.get(*entries[0][:3]) is None
+
+
+def test_other_processes_see_compaction(tmp_path):
+    path = str(tmp_path / 'results.c4s')
+    entries = results(40)
+    with store.ResultStore(path, compact_every=0) as writer, store.ResultStore(path, compact_every=0) as reader:
+        put(writer, entries[:20])
+        reader.refresh()
+        assert_stored(reader, entries[:20])
+        reader.compact()  # rewrites the file the writer keeps appending to
+        put(writer, entries[20:])
+        writer.refresh()
+        reader.refresh()
+        assert_stored(writer, entries)
+        assert_stored(reader, entries)
+        assert len(reader) == 40
+
+
+def test_other_games_are_rejected(tmp_path):
+    path = str(tmp_path / 'results.c4s')
+    store.ResultStore(path, size=(7, 6, 4)).close()
+    with pytest.raises(ValueError, match='connect-'):
+        store.ResultStore(path, size=(7, 6, 5))
+    with pytest.raises(ValueError, match='7x6'):
+        store.ResultStore(path)
+
+
+def test_boards_with_long_keys_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match='64 bits'):
+        store.ResultStore(str(tmp_path / 'results.c4s'), size=(9, 7, 5))
+
+
+def test_old_format_is_rejected(tmp_path):
+    path = tmp_path / 'results.c4s'
+    path.write_bytes(store.HEADER.pack(store.MAGIC, store.VERSION - 1, 7, 7, 0, 0))
+    with pytest.raises(ValueError, match='old format'):
+        store.ResultStore(str(path))
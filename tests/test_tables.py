@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import board
+import tables
+
+SIZES = [(7, 7, 4), (5, 4, 3), (4, 4, 4)]
+
+
+def brute_force_lines(width: int, height: int, win_count: int, row: int, col: int):
+    """
+    Horizontal and vertical winning lines through a cell, as sets of the other cells.
+
+    :return: list of sets of (row, col)
+    """
+    lines = []
+    for start in range(col - win_count + 1, col + 1):
+        if 0 <= start and start + win_count <= width:
+            lines.append({(row, c) for c in range(start, start + win_count)} - {(row, col)})
+    for start in range(row - win_count + 1, row + 1):
+        if 0 <= start and start + win_count <= height:
+            lines.append({(r, col) for r in range(start, start + win_count)} - {(row, col)})
+    return lines
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_winning_lines(size):
+    width, height, win_count = size
+    t = tables.Tables(width, height, win_count)
+    for row in range(height):
+        for col in range(width):
+            lines = [set(line) for line in t.line_cells[row][col]]
+            expected = brute_force_lines(width, height, win_count, row, col)
+            assert sorted(map(sorted, lines)) == sorted(map(sorted, expected))
+            cell = row * width + col
+            assert t.cell_line_counts[cell] == len(expected)
+            real = {tuple(line) for line in t.cell_lines[cell, :len(expected)].tolist()} or {(cell,) * (win_count - 1)}
+            assert {tuple(line) for line in t.cell_lines[cell].tolist()} == real  # padding repeats a real line
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_moves(size):
+    width, height, win_count = size
+    t = tables.Tables(width, height, win_count)
+    assert t.full_mask == (1 << width) - 1
+    assert t.column_bits.tolist() == [1 << col for col in range(width)]
+    center = sorted(range(width), key=lambda col: abs(2 * col - (width - 1)))
+    assert t.center_order.tolist() == center
+    for mask in range(1 << width):
+        legal = [col for col in range(width) if mask & (1 << col)]
+        assert t.move_lists[mask] == legal
+        assert t.move_counts[mask] == len(legal)
+        assert t.ordered_move_lists[mask] == [col for col in center if mask & (1 << col)]
+        assert t.moves[mask, len(legal):].tolist() == [-1] * (width - len(legal))
+
+
+def test_load_caches_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(tables, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(tables, '_tables', {})
+    built = tables.load(5, 4, 3)
+    assert tables.load(5, 4, 3) is built  # built only once per process
+    assert len(list(tmp_path.iterdir())) == 1
+
+    monkeypatch.setattr(tables, '_tables', {})  # a new process
+    loaded = tables.load(5, 4, 3)
+    assert loaded is not built
+    for name, array in built._arrays().items():
+        assert np.array_equal(loaded._arrays()[name], array), name
+    assert loaded.line_cells == built.line_cells
+    assert loaded.move_lists == built.move_lists
+
+
+def test_broken_cache_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(tables, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(tables, '_tables', {})
+    with open(tables._cache_path(5, 4, 3), 'wb') as file:
+        file.write(b'not a cache file')
+    assert tables.load(5, 4, 3).move_lists == tables.Tables(5, 4, 3).move_lists
+
+
+def test_pickled_cache_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(tables, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(tables, '_tables', {})
+    arrays = tables.Tables(5, 4, 3)._arrays()
+    arrays['moves'] = np.array([None], dtype=object)  # cache files are never unpickled
+    with open(tables._cache_path(5, 4, 3), 'wb') as file:
+        np.savez(file, **arrays)
+    assert tables.load(5, 4, 3).move_lists == tables.Tables(5, 4, 3).move_lists
+
+
+def test_default_tables_are_loaded_lazily(monkeypatch):
+    monkeypatch.setattr(tables, '_tables', {})
+    monkeypatch.setattr(board.Board, 'lookup', board._DefaultTables())  # as imported
+    assert not tables._tables
+    b = board.Board()
+    assert b.lookup is tables.load(*board.Board.DEFAULT_SIZE)
+    assert board.Board.__dict__['lookup'] is b.lookup  # loaded only once
+
+
+def test_board_uses_the_tables():
+    b = board.Board()
+    for i in range(board.Board.height):
+        b.play(0, board.Board.PLAYER_1 if i % 2 else board.Board.PLAYER_2)
+    assert b.valid_moves == list(range(1, board.Board.width))
+    assert b.legal == board.Board.lookup.full_mask & ~1
+    for i in range(board.Board.win_count - 1):
+        assert b.play(1, board.Board.PLAYER_1) == board.Board.VALID_MOVE
+    assert b.play(1, board.Board.PLAYER_1) == board.Board.WIN
@@ -0,0 +1,42 @@
+import importlib.util
+
+import pytest
+
+import topology
+
+
+def test_read_hostfile(tmp_path):
+    path = tmp_path / 'hostfile'
+    path.write_text('# cluster\nnode1 slots=4\n\nnode2 slots=2 max_slots=8  # second node\nnode3\n')
+    assert topology.read_hostfile(str(path)) == [('node1', 4), ('node2', 2), ('node3', 1)]
+
+
+def test_layout_by_slot():
+    assert topology.layout([('node1', 4), ('node2', 4)], 8) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert topology.layout([('node1', 4), ('node2', 4)], 5) == [[0, 1, 2, 3], [4]]
+    assert topology.layout([('node1', 2), ('node2', 1)], 2) == [[0, 1]]  # hosts without ranks are left out
+
+
+def test_layout_wraps_around():
+    assert topology.layout([('node1', 2), ('node2', 1)], 7) == [[0, 1, 3, 4, 6], [2, 5]]
+
+
+def test_layout_without_slots():
+    with pytest.raises(ValueError):
+        topology.layout([('node1', 0)], 2)
+
+
+def test_topology_groups():
+    t = topology.Topology(topology.layout([('node1', 4), ('node2', 1), ('node3', 3)], 8))
+    assert t.groups == [[1, 2, 3], [4], [5, 6, 7]]  # the master is in no group
+    assert t.sub_masters == [1, 4, 5]
+    assert [t.group_of(rank) for rank in range(8)] == [None, 0, 0, 0, 1, 2, 2, 2]
+    assert topology.Topology([[0]]).groups == []
+
+
+@pytest.mark.skipif(importlib.util.find_spec('mpi4py') is None, reason='needs mpi4py')
+def test_from_comm_of_one_rank():
+    from mpi4py import MPI
+
+    t = topology.Topology.from_comm(MPI.COMM_SELF)
+    assert t.groups == [] and t.sub_masters == []
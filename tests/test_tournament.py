@@ -0,0 +1,70 @@
+import random
+
+import board
+import tournament
+
+
+def replay(record: dict) -> int:
+    """
+    Replay the moves of a game record.
+
+    :param record: game record
+    :return: status of the last move
+    """
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    status = None
+    for move in record['moves']:
+        status = b.play(move, player)
+        assert status != board.Board.INVALID_MOVE
+        player *= -1
+    return status
+
+
+def test_random_opening_stops_at_a_win():
+    for seed in range(20):
+        moves = tournament.random_opening(random.Random(seed), 30)
+        statuses = []
+        b = board.Board()
+        for i, move in enumerate(moves):
+            statuses.append(b.play(move, board.Board.PLAYER_1 if i % 2 == 0 else board.Board.PLAYER_2))
+        assert board.Board.WIN not in statuses[:-1]
+
+
+def test_games_are_reproducible():
+    first = tournament.play_game(3, ['random', 'tree:2'], 7, 4, False)
+    second = tournament.play_game(3, ['random', 'tree:2'], 7, 4, False)
+    first.pop('seconds')
+    second.pop('seconds')
+    assert first == second
+
+
+def test_game_records():
+    records = tournament.run_pool([(i, ['random', 'tree:2'], 1, 4, True) for i in range(4)], 1)
+    assert [record['game'] for record in records] == [0, 1, 2, 3]
+    for record in records:
+        assert isinstance(record['moves'], list)
+        assert record['moves'][:record['opening']] == tournament.random_opening(
+            random.Random(f'1-{record["game"]}'), 4)
+        status = replay(record)
+        if record['winner']:
+            assert status == board.Board.WIN
+            assert record['winner'] == (board.Board.PLAYER_1 if len(record['moves']) % 2 else board.Board.PLAYER_2)
+    assert records[0]['slots'] == [0, 1] and records[0]['players'] == ['random', 'tree:2']
+    assert records[1]['slots'] == [1, 0] and records[1]['players'] == ['tree:2', 'random']
+
+
+def test_mirror_match_win_rates():
+    records = [
+        {'players': ['random', 'random'], 'slots': [0, 1], 'moves': [0] * 7, 'winner': board.Board.PLAYER_1},
+        {'players': ['random', 'random'], 'slots': [1, 0], 'moves': [0] * 8, 'winner': board.Board.PLAYER_2},
+        {'players': ['random', 'random'], 'slots': [0, 1], 'moves': [0] * 9, 'winner': board.Board.PLAYER_2},
+        {'players': ['random', 'random'], 'slots': [1, 0], 'moves': [0] * 10, 'winner': 0},
+    ]
+    summary = tournament.report(records, 2.0)
+    assert summary['players'] == ['random', 'random']
+    assert summary['win_rates'] == [0.5, 0.25]  # player 0 won games 0 and 1, player 1 won game 2
+    assert summary['first_player_win_rate'] == 0.25
+    assert summary['draw_rate'] == 0.25
+    assert summary['average_moves'] == 8.5
+    assert summary['games_per_hour'] == 4 / 2.0 * 3600
@@ -0,0 +1,57 @@
+import multiprocessing
+
+import pytest
+
+import transposition
+
+
+@pytest.fixture
+def table():
+    result = transposition.SharedTable(1 << 4)
+    yield result
+    result.close()
+
+
+def test_put_get(table):
+    table.put(12345, 1, 3, 420.0, 2761.0, False, True)
+    table.put(1 << 55, -1, 5, -0.5, 3.0, True, False)
+    assert table.get(12345, 1, 3) == (420.0, 2761.0, False, True)
+    assert table.get(1 << 55, -1, 5) == (-0.5, 3.0, True, False)
+    assert table.get(12345, -1, 3) is None
+    assert table.get(12345, 1, 4) is None
+    assert table.get(54321, 1, 3) is None
+
+
+def test_newer_results_replace_older_ones(table):
+    keys = range(1, 200)
+    for key in keys:
+        table.put(key, 1, 2, float(key), 1.0, False, False)
+    found = [key for key in keys if table.get(key, 1, 2) is not None]
+    assert 0 < len(found) <= table.capacity
+    assert all(table.get(key, 1, 2) == (float(key), 1.0, False, False) for key in found)
+    assert table.get(199, 1, 2) is not None  # the last one is always kept
+
+
+def test_torn_entries_are_misses(table):
+    table.put(12345, 1, 3, 420.0, 2761.0, False, True)
+    slot = table._slot(12345, transposition.SharedTable._meta(1, 3))
+    table._table[slot, 2] ^= 1  # the score of another writer
+    assert table.get(12345, 1, 3) is None
+
+
+def _put(table: transposition.SharedTable, key: int):
+    table.put(key, -1, 4, 7.0, 9.0, False, False)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_forked_processes_share_the_table(table):
+    process = multiprocessing.get_context('fork').Process(target=_put, args=(table, 777))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert table.get(777, -1, 4) == (7.0, 9.0, False, False)
+
+
+def test_capacity_has_to_be_a_power_of_2():
+    with pytest.raises(AssertionError):
+        transposition.SharedTable(12)
@@ -0,0 +1,127 @@
+from typing import List, Tuple
+
+import common
+
+
+def read_hostfile(path: str) -> List[Tuple[str, int]]:
+    """
+    Read an Open MPI hostfile ("host slots=N" lines, comments start with #).
+
+    :param path: hostfile path
+    :return: list of (host, slots) in file order
+    """
+    hosts = []
+    with open(path) as file:
+        for line in file:
+            line = line.split('#', 1)[0].split()
+            if not line:
+                continue
+            slots = 1
+            for option in line[1:]:
+                if option.startswith('slots='):
+                    slots = int(option[len('slots='):])
+            hosts.append((line[0], slots))
+    return hosts
+
+
+def layout(hosts: List[Tuple[str, int]], size: int) -> List[List[int]]:
+    """
+    Ranks running on every host, assuming mpiexec maps ranks by slot (its default): the slots of the first host
+    are filled first, then the slots of the next one. Ranks over the total number of slots wrap around.
+
+    :param hosts: hosts and their slots (see read_hostfile)
+    :param size: number of ranks
+    :return: ranks of every host (hosts without ranks are left out)
+    """
+    if sum(slots for host, slots in hosts) == 0:
+        raise ValueError('hostfile has no slots')
+    groups = [[] for _ in hosts]
+    rank = 0
+    while rank < size:
+        for i, (host, slots) in enumerate(hosts):
+            take = min(slots, size - rank)
+            groups[i].extend(range(rank, rank + take))
+            rank += take
+    return [group for group in groups if group]
+
+
+class Topology:
+    """
+    Two-level topology: the master (rank 0) talks only to one sub-master per host, every sub-master serves the
+    other ranks of its host. A host with a single rank (besides the master) gets no sub-master, that rank works
+    for the master directly.
+    """
+
+    def __init__(self, groups: List[List[int]]):
+        self.groups = [[rank for rank in group if rank != 0] for group in groups]  # the master isn't in any group
+        self.groups = [group for group in self.groups if group]
+        self.sub_masters = [group[0] for group in self.groups]  # ranks the master hands out tasks to
+
+    def group_of(self, rank: int) -> int:
+        """
+        Index of the group a rank belongs to.
+
+        :param rank: rank
+        :return: group index (None for the master)
+        """
+        for i, group in enumerate(self.groups):
+            if rank in group:
+                return i
+        return None
+
+    def split(self, comm):
+        """
+        Create the node communicator of this rank (collective call, every rank has to call it).
+        The sub-master is rank 0 of the node communicator.
+
+        :param comm: MPI communicator of all ranks
+        :return: node communicator (None for the master and for ranks working for the master directly)
+        """
+        from mpi4py import MPI
+
+        rank = comm.Get_rank()
+        group = self.group_of(rank)
+        color = MPI.UNDEFINED if group is None or len(self.groups[group]) == 1 else group
+        local_comm = comm.Split(color, key=rank)
+        if local_comm == MPI.COMM_NULL:
+            return None
+        common.log(f'rank {rank} is rank {local_comm.Get_rank()} of node {group}')
+        return local_comm
+
+    @staticmethod
+    def from_comm(comm) -> 'Topology':
+        """
+        Create the topology of the ranks that really share a node, as MPI reports it (collective call, every rank
+        has to call it). It holds for any rank mapping (--map-by, rankfiles, allocations of a batch scheduler).
+
+        :param comm: MPI communicator of all ranks
+        :return: topology
+        """
+        from mpi4py import MPI
+
+        node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.Get_rank())
+        node_ranks = node_comm.allgather(comm.Get_rank())  # ranks of this node
+        node_comm.Free()
+        groups = {tuple(ranks) for ranks in comm.allgather(node_ranks)}
+        return Topology(sorted(map(list, groups)))
+
+    @staticmethod
+    def from_hostfile(path: str, size: int) -> 'Topology':
+        """
+        Create the topology for a hostfile, assuming mpiexec maps ranks by slot (see layout). Use from_comm unless
+        the hosts have to be made up, e.g. to try a layout on a single machine.
+
+        :param path: hostfile path
+        :param size: number of ranks
+        :return: topology
+        """
+        return Topology(layout(read_hostfile(path), size))
+
+    def __repr__(self):
+        return f'Topology(sub-masters {self.sub_masters}, groups {self.groups})'
+
+
+if __name__ == '__main__':
+    # two hosts with 4 slots each, 8 ranks -> rank 0 is the master, ranks 1 and 4 are sub-masters
+    print(Topology(layout([('node1', 4), ('node2', 4)], 8)))
+    print(Topology.from_hostfile('hostfile', 5))
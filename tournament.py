@@ -0,0 +1,200 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from typing import List
+
+import board
+import controller
+import game
+import records as records_format
+
+
+def make_controller(spec: str, b: board.Board, seed) -> controller.Controller:
+    """
+    Create a controller from its spec: "random" or "<backend>[:<depth>]" (e.g. "tree:4").
+
+    :param spec: controller spec
+    :param b: board
+    :param seed: seed for controllers that need randomness
+    :return: controller
+    """
+    name, *args = spec.split(':')
+    if name == 'random':
+        return controller.RandomController(b, seed)
+    depth = int(args[0]) if args else 4
+    return controller.ComputerController(b, depth, backend=name, verbose=False)
+
+
+def random_opening(rng: random.Random, length: int) -> List[int]:
+    """
+    Create a random opening (stops early if a move wins the game).
+
+    :param rng: random generator
+    :param length: number of opening moves
+    :return: opening moves
+    """
+    b = board.Board()
+    player = board.Board.PLAYER_1
+    moves = []
+    for _ in range(length):
+        if not b.valid_moves:
+            break
+        move = rng.choice(b.valid_moves)
+        moves.append(move)
+        if b.play(move, player) == board.Board.WIN:
+            break
+        player *= -1
+    return moves
+
+
+def play_game(index: int, specs: List[str], seed: int, opening: int, swap: bool) -> dict:
+    """
+    Play a single headless game.
+
+    Everything random in the game is derived from (seed, index), so any game can be replayed on its own.
+
+    :param index: game index
+    :param specs: controller specs of both sides
+    :param seed: tournament seed
+    :param opening: number of random opening moves
+    :param swap: swap sides on every odd game
+    :return: game record
+    """
+    rng = random.Random(f'{seed}-{index}')
+    slots = [1, 0] if swap and index % 2 == 1 else [0, 1]  # tournament players of PLAYER_1 and PLAYER_2
+    specs = [specs[slot] for slot in slots]
+    start = time.perf_counter()
+    b = board.Board()
+    opening_moves = random_opening(rng, opening)
+    # play the opening through the game so that it ends up in the game history
+    g = game.Game(b, controller.HardcodedController(b, opening_moves[::2]),
+                  controller.HardcodedController(b, opening_moves[1::2]))
+    for _ in opening_moves:
+        g.step()
+    g.controllers = [make_controller(specs[0], b, rng.random()), make_controller(specs[1], b, rng.random())]
+    winner = g.run()
+    return {
+        'game': index,
+        'seed': seed,
+        'players': specs,  # spec of PLAYER_1, spec of PLAYER_2
+        'slots': slots,  # tournament player (index in --players) of PLAYER_1 and PLAYER_2
+        'opening': len(opening_moves),
+        'moves': g.history,
+        'winner': winner,  # PLAYER_1, PLAYER_2 or 0 for a draw
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+
+def _play_game(args) -> dict:
+    """
+    Process pool entry point for play_game.
+
+    :param args: play_game arguments
+    :return: game record
+    """
+    return play_game(*args)
+
+
+def report(records: List[dict], seconds: float) -> dict:
+    """
+    Summarize game records: throughput and win rates.
+
+    Win rates are reported per tournament player (its index in --players), so both sides of a mirror match with the
+    same spec get their own rate.
+
+    :param records: game records
+    :param seconds: wall time of the whole tournament
+    :return: summary
+    """
+    games = len(records)
+    players = {}  # tournament player -> spec
+    wins = {}  # tournament player -> number of games won
+    for record in records:
+        for slot, spec in zip(record['slots'], record['players']):
+            players[slot] = spec
+            wins.setdefault(slot, 0)
+        if record['winner'] == board.Board.PLAYER_1:
+            wins[record['slots'][0]] += 1
+        elif record['winner'] == board.Board.PLAYER_2:
+            wins[record['slots'][1]] += 1
+    draws = sum(1 for record in records if record['winner'] == 0)
+    first = sum(1 for record in records if record['winner'] == board.Board.PLAYER_1)
+    return {
+        'games': games,
+        'seconds': seconds,
+        'games_per_hour': games / seconds * 3600 if seconds else 0.0,
+        'average_moves': sum(len(record['moves']) for record in records) / games if games else 0.0,
+        'players': [players[slot] for slot in sorted(players)],
+        'win_rates': [wins[slot] / games for slot in sorted(wins)],  # in the order of players
+        'first_player_win_rate': first / games if games else 0.0,
+        'draw_rate': draws / games if games else 0.0,
+    }
+
+
+def run_pool(arguments: List[tuple], processes: int) -> List[dict]:
+    """
+    Play games on a local process pool.
+
+    :param arguments: play_game arguments of every game
+    :param processes: number of processes
+    :return: game records ordered by game index
+    """
+    if processes == 1:
+        return [play_game(*args) for args in arguments]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_play_game, arguments, chunksize=1)
+
+
+def run_mpi(arguments: List[tuple]) -> List[dict]:
+    """
+    Play games on MPI ranks (rank r plays every size-th game starting from game r).
+
+    :param arguments: play_game arguments of every game
+    :return: game records ordered by game index on rank 0, None on other ranks
+    """
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank, size = comm.Get_rank(), comm.Get_size()
+    records = [play_game(*args) for args in arguments[rank::size]]
+    gathered = comm.gather(records, root=0)
+    if rank != 0:
+        return None
+    return sorted((record for records in gathered for record in records), key=lambda t: t['game'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless self-play tournament.')
+    parser.add_argument('--players', nargs=2, default=['tree:4', 'tree:4'],
+                        help='controller specs: "random" or "<backend>[:<depth>]"')
+    parser.add_argument('--games', type=int, default=10, help='number of games')
+    parser.add_argument('--seed', type=int, default=0, help='tournament seed')
+    parser.add_argument('--opening', type=int, default=4, help='number of random opening moves')
+    parser.add_argument('--swap', action='store_true', help='swap sides on every odd game')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='local process pool size')
+    parser.add_argument('--mpi', action='store_true', help='play games on MPI ranks (run under mpiexec)')
+    parser.add_argument('--output', default='games.jsonl', help='game records (one JSON object per line)')
+    parser.add_argument('--records', help='also write a binary game record file (see records.py)')
+    args = parser.parse_args()
+
+    arguments = [(i, args.players, args.seed, args.opening, args.swap) for i in range(args.games)]
+    start = time.perf_counter()
+    records = run_mpi(arguments) if args.mpi else run_pool(arguments, args.processes)
+    if records is None:  # not the MPI root rank
+        return
+    summary = report(records, time.perf_counter() - start)
+
+    with open(args.output, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record, separators=(',', ':')) + '\n')
+    if args.records:
+        with records_format.RecordWriter(args.records) as writer:
+            for record in records:
+                writer.write(record['moves'], record['winner'])
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
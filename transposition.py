@@ -0,0 +1,122 @@
+import struct
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+import store
+
+_FLOAT = struct.Struct('<d')
+_WORD = struct.Struct('<Q')
+
+
+def _bits(value) -> int:
+    """
+    Bits of a float as an unsigned 64-bit integer.
+
+    :param value: number
+    :return: bits
+    """
+    return _WORD.unpack(_FLOAT.pack(value))[0]
+
+
+def _value(bits: int) -> float:
+    """
+    Inverse of _bits.
+
+    :param bits: bits
+    :return: number
+    """
+    return _FLOAT.unpack(_WORD.pack(bits))[0]
+
+
+class SharedTable:
+    """
+    Transposition table of search results in shared memory, shared by the processes of a local process pool.
+
+    It has the same get/put interface as store.ResultStore: (position key, player, depth) -> (score, total, winner,
+    loser). The table is a fixed size array of entries, every position has a single slot and a newer result replaces
+    an older one. Entries are written without locks: every entry holds a check word (the XOR of its other words), so
+    an entry torn by two processes writing it at the same time fails the check and reads as a miss.
+
+    Create it before forking the pool processes, they inherit the mapping. Keys are 64-bit, positions of boards too
+    big for 64-bit keys are never stored.
+    """
+    WORDS = 5  # key, meta (player, depth, winner, loser), score bits, total bits, check
+
+    def __init__(self, capacity=1 << 18):
+        assert capacity & (capacity - 1) == 0, 'capacity has to be a power of 2'
+        self.capacity = capacity
+        self._memory = shared_memory.SharedMemory(create=True, size=capacity * SharedTable.WORDS * 8)
+        self._table = np.ndarray((capacity, SharedTable.WORDS), dtype=np.uint64, buffer=self._memory.buf)
+        self._table[:] = 0
+
+    @staticmethod
+    def _meta(player: int, depth: int) -> int:
+        return depth << 1 | (player == 1)
+
+    def _slot(self, key: int, meta: int) -> int:
+        return ((key ^ meta) * 0x9E3779B97F4A7C15 >> 20) & (self.capacity - 1)
+
+    def get(self, key: int, player: int, depth: int) -> Optional[store.StoreValue]:
+        """
+        Look up a result.
+
+        :param key: position key (see board.Board.key)
+        :param player: player making the move
+        :param depth: search depth
+        :return: score, total, winner and loser of the position, None if it isn't in the table
+        """
+        if key >> 64:
+            return None
+        meta = SharedTable._meta(player, depth)
+        entry_key, entry_meta, score, total, check = self._table[self._slot(key, meta)].tolist()
+        if entry_key != key or entry_meta & 0xFFFF != meta or check != entry_key ^ entry_meta ^ score ^ total:
+            return None
+        return _value(score), _value(total), bool(entry_meta >> 16 & 1), bool(entry_meta >> 17 & 1)
+
+    def put(self, key: int, player: int, depth: int, score, total, winner: bool, loser: bool):
+        """
+        Store a result.
+
+        :param key: position key (see board.Board.key)
+        :param player: player making the move
+        :param depth: search depth
+        :param score: score of the position
+        :param total: total of the position
+        :param winner: position is a winner
+        :param loser: position is a loser
+        :return:
+        """
+        if key >> 64:
+            return
+        meta = SharedTable._meta(player, depth)
+        entry_meta = meta | winner << 16 | loser << 17
+        score, total = _bits(score), _bits(total)
+        self._table[self._slot(key, meta)] = [key, entry_meta, score, total, key ^ entry_meta ^ score ^ total]
+
+    def refresh(self):
+        """
+        Nothing to do, the table is always up to date (store.ResultStore interface).
+        :return:
+        """
+        pass
+
+    def close(self, unlink=True):
+        """
+        Release the shared memory.
+
+        :param unlink: also remove it (only the creating process should)
+        :return:
+        """
+        del self._table
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
+
+
+if __name__ == '__main__':
+    table = SharedTable(1 << 4)
+    table.put(12345, 1, 3, 420.0, 2761.0, False, True)
+    print(table.get(12345, 1, 3), table.get(12345, -1, 3), table.get(12345, 1, 4))
+    table.close()
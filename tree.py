@@ -1,6 +1,8 @@
 from typing import List
 import numpy as np
 
+import profiling
+
 
 class Node:
     """
@@ -10,6 +12,7 @@ class Node:
     final scoring.
     """
 
+    @profiling.hot
     def __init__(self, score, total, move: int, state: np.ndarray, player, parent: 'Node', *nodes: 'Node'):
         assert type(move) == int or move is None
         self.parent = parent
@@ -24,6 +27,7 @@ class Node:
         self.player = player
         self.state = state
 
+    @profiling.hot
     def add(self, node: 'Node') -> 'Node':
         """
         Add a node as a child.
@@ -36,6 +40,7 @@ class Node:
         node.parent = self
         return self
 
+    @profiling.hot
     def get_move(self, *moves: int) -> 'Node':
         """
         Get node that represents a particular combination of moves (in this sub-tree)